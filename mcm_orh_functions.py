@@ -1,8 +1,22 @@
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import date
+import functools
+import hashlib
+import importlib.util
+import json
 import os
+import re
+import time
+import tracemalloc
+import weakref
 
 
 def merge_orh(input_data, id_columns, id_name):
@@ -21,27 +35,12 @@ def format_orh_cols(input_data, column_path):
     return input_data
 
 
-def format_orh(input_data):
-
-    path = './orh_cols.csv'
+def format_orh(input_data, path='./orh_cols.csv', types_path='./orh_col_types.csv'):
 
     format_orh_cols(input_data, path)
 
     # Format completion stages
-    mask_in = input_data['frm_completion_stage'].str.contains('This form is being completed as a part of MOVE-IN to this recovery home, and I recently moved in.')
-    mask_out = input_data['frm_completion_stage'].str.contains('This form is being completed as a part of MOVE-OUT from this recovery home.')
-    mask_follow = input_data['frm_completion_stage'].str.contains('This form is being completed as a part of an IN-HOUSE FOLLOW UP SIX MONTHS after move-in.')
-
-    in_new = 'Move In'
-    out_new = 'Move Out'
-    follow_new = 'Follow Up'
-
-    input_data.loc[mask_in,
-                   'frm_completion_stage'] = in_new
-    input_data.loc[mask_out,
-                   'frm_completion_stage'] = out_new
-    input_data.loc[mask_follow,
-                   'frm_completion_stage'] = follow_new
+    format_orh_stage(input_data)
 
     input_data = input_data.rename(columns={'frm_completion_stage': 'Stage'})
 
@@ -57,53 +56,765 @@ def format_orh(input_data):
                     axis=1,
                     inplace=True)
 
-    # # Create Gender ID Column
-    # gender_id = ['gender_identify_agender', 'gender_identify_genderqueer',
-    #              'gender_identify_gender_fluid', 'gender_identify_man',
-    #              'gender_identify_non-binary', 'gender_identify_questioning',
-    #              'gender_identify_transgender', 'gender_identify_trans_man',
-    #              'gender_identify_trans_woman', 'gender_identify_woman',
-    #              'gender_identify_no_answer', 'gender_identify_other']
-
-    # merge_orh(input_data, gender_id, 'Gender')
-
-    # # Create Sexuality ID Column
-    # sexuality_id = ['sexual_identity_asexual', 'sexual_identity_bisexual',
-    #                 'sexual_identity_gay', 'sexual_identity_heterosexual',
-    #                 'sexual_identity_lesbian', 'sexual_identity_pansexual',
-    #                 'sexual_identity_queer', 'sexual_identity_questioning',
-    #                 'sexual_identity_same_gender_loving',
-    #                 'sexual_identity_no_answer', 'sexual_identity_other']
-
-    # merge_orh(input_data, sexuality_id, 'Sexuality')
-
-    # # Create Race ID Column
-    # race_id = ['race_id_white', 'race_id_black_or_african_american',
-    #            'race_id_american_indian_or_alaska_native',
-    #            'race_id_chinese', 'race_id_vietnamese',
-    #            'race_id_native_hawaiian', 'race_id_filipino', 'race_id_korean',
-    #            'race_id_samoan', 'race_id_asian_indian',
-    #            'race_id_japanese', 'race_id_chamorro',
-    #            'race_id_other_asian', 'race_id_other_pacific_islander',
-    #            'rad_id_no_answer', 'race_id_other']
-    
-    # merge_orh(input_data, race_id, 'Race')
+    # Pack checkbox families into bit columns for the outcome functions
+    binarize_orh(input_data)
+
+    # Collapse gender, sexuality and race into one column each
+    identity_orh(input_data)
+
+    # Cast option columns to categoricals
+    input_data = format_orh_types(input_data, types_path)
+
+    return input_data
+
+
+# Completion stage answers as exported, and the short name used everywhere else
+STAGE_NAMES = {
+    'This form is being completed as a part of MOVE-IN to this recovery home, and I recently moved in.': 'Move In',
+    'This form is being completed as a part of MOVE-OUT from this recovery home.': 'Move Out',
+    'This form is being completed as a part of an IN-HOUSE FOLLOW UP SIX MONTHS after move-in.': 'Follow Up',
+}
+
+
+def _stage_name(raw, stage_names):
+
+    # Fallback for wordings that are not an exact match: ignore case and spacing and
+    # look for a known sentence inside the answer, as plain text
+    text = ' '.join(str(raw).split()).lower()
+    for sentence, name in stage_names.items():
+        if sentence.lower() in text:
+            return name
+
+    return None
+
+
+def format_orh_stage(input_data, stage_names=None):
+
+    # Map every distinct answer once, then spread the short names back over the rows
+    if stage_names is None:
+        stage_names = STAGE_NAMES
+
+    codes, uniques = pd.factorize(input_data['frm_completion_stage'])
+
+    names = []
+    variants = {}
+    unknown = []
+    for raw in uniques:
+        name = stage_names.get(raw)
+        if name is None:
+            name = _stage_name(raw, stage_names)
+            if name is None:
+                unknown.append(raw)
+                name = raw
+            else:
+                variants[raw] = name
+        names.append(name)
+
+    if len(variants) > 0:
+        print(f'Completion stage wording matched loosely: {variants}')
+    if len(unknown) > 0:
+        print(f'Unrecognized completion stage, left as is: {unknown}')
+
+    # Code -1 (missing) picks the trailing NaN
+    names = np.append(np.asarray(names, dtype=object), np.nan)
+    input_data['frm_completion_stage'] = names[codes]
+
+    return input_data
+
+
+# Bump when format_orh changes what it produces, so existing caches are rebuilt
+ORH_CACHE_VERSION = 3
+
+
+def _file_hash(file_path):
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def load_orh(source_path='./orh_2022.csv',
+             path='./orh_cols.csv',
+             types_path='./orh_col_types.csv',
+             cache_dir='./ORH_Cache'):
+
+    # Read and format an export once, then load the formatted frame from a binary cache.
+    # The cache key covers the export and both column specs, so changing any of them
+    # rebuilds the cache. Feather needs pyarrow, otherwise the cache is a pickle.
+    key = hashlib.sha256(f'{ORH_CACHE_VERSION}'.encode())
+    for file_path in [source_path, path, types_path]:
+        key.update(_file_hash(file_path).encode())
+
+    ext = 'feather' if importlib.util.find_spec('pyarrow') is not None else 'pkl'
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    cache_path = os.path.join(cache_dir, f'{stem}_{key.hexdigest()[:16]}.{ext}')
+
+    if os.path.exists(cache_path):
+        if ext == 'feather':
+            return pd.read_feather(cache_path)
+        return pd.read_pickle(cache_path)
+
+    input_data = format_orh(pd.read_csv(source_path), path, types_path)
+
+    # Drop caches of older versions of this export before writing the new one. Only
+    # '<stem>_<16 hex digits>.<ext>' is this export's, orh.csv must not take orh_2022.csv's.
+    os.makedirs(cache_dir, exist_ok=True)
+    stale = re.compile(re.escape(stem) + r'_[0-9a-f]{16}\.(feather|pkl)')
+    for old in os.listdir(cache_dir):
+        if stale.fullmatch(old):
+            os.remove(os.path.join(cache_dir, old))
+
+    # Write under a temporary name so an interrupted run never leaves a partial cache
+    temp_path = cache_path + '.tmp'
+    if ext == 'feather':
+        input_data.reset_index(drop=True).to_feather(temp_path)
+    else:
+        input_data.to_pickle(temp_path)
+    os.replace(temp_path, cache_path)
+
+    return input_data
+
+
+# Multi-select ("check all that apply") questions. Each option is its own column that is
+# filled when ticked and empty otherwise.
+CHECKBOX_FAMILIES = {
+    'gender_identify': ['gender_identify_agender', 'gender_identify_genderqueer',
+                        'gender_identify_gender_fluid', 'gender_identify_man',
+                        'gender_identify_non-binary', 'gender_identify_questioning',
+                        'gender_identify_transgender', 'gender_identify_trans_man',
+                        'gender_identify_trans_woman', 'gender_identify_woman',
+                        'gender_identify_no_answer', 'gender_identify_other'],
+    'sexual_identity': ['sexual_identity_asexual', 'sexual_identity_bisexual',
+                        'sexual_identity_gay', 'sexual_identity_heterosexual',
+                        'sexual_identity_lesbian', 'sexual_identity_pansexual',
+                        'sexual_identity_queer', 'sexual_identity_questioning',
+                        'sexual_identity_same_gender_loving',
+                        'sexual_identity_no_answer', 'sexual_identity_other'],
+    'race_id': ['race_id_white', 'race_id_black_or_african_american',
+                'race_id_american_indian_or_alaska_native',
+                'race_id_chinese', 'race_id_vietnamese',
+                'race_id_native_hawaiian', 'race_id_filipino', 'race_id_korean',
+                'race_id_samoan', 'race_id_asian_indian',
+                'race_id_japanese', 'race_id_chamorro',
+                'race_id_other_asian', 'race_id_other_pacific_islander',
+                'rad_id_no_answer', 'race_id_other'],
+    'ethnicity_id': ['ethnicity_id_no_hispanic_latino_spanish',
+                     'ethnicity_id_mexican_mexican_american_chicano',
+                     'ethnicity_id_puerto_rican', 'ethnicity_id_cuban',
+                     'ethnicity_id_no_answer', 'ethnicity_id_other'],
+    'in_recovery_stimulant': ['in_recovery_stimulant_cocaine', 'in_recovery_stimulant_crack cocaine',
+                              'in_recovery_stimulant_methamphetamine',
+                              'in_recovery_stimulant_amphetamines', 'in_recovery_stimulant_ritalin',
+                              'in_recovery_stimulant_cylert', 'in_recovery_stimulant_none',
+                              'in_recovery_stimulant_no_answer', 'in_recovery_stimulant_other'],
+    'in_recovery_depressant': ['in_recovery_depressant_alcohol', 'in_recovery_depressant_barbiturates',
+                               'in_recovery_depressant_benzodiazepines',
+                               'in_recovery_depressant_tranquilizers',
+                               'in_recovery_depressant_flunitrazepam', 'in_recovery_depressant_ghb',
+                               'in_recovery_depressant_methaqualone', 'in_recovery_depressant_none',
+                               'in_recovery_depressant_no_answer', 'in_recovery_depressant_other'],
+    'in_recovery_opoid_morphine_derivative': [
+        'in_recovery_opoid_morphine_derivative_heroin',
+        'in_recovery_opoid_morphine_derivative_oxycodone',
+        'in_recovery_opoid_morphine_derivative_morphine',
+        'in_recovery_opoid_morphine_derivative_opium',
+        'in_recovery_opoid_morphine_derivative_codeine',
+        'in_recovery_opoid_morphine_derivative_fentanyl_and_analogs',
+        'in_recovery_opoid_morphine_derivative_hydrocodone_bi_tartrate',
+        'in_recovery_opoid_morphine_derivative_none ',
+        'in_recovery_opoid_morphine_derivative_no_answer',
+        'in_recovery_opoid_morphine_derivative_other'],
+    'in_recovery_hallciucinogen_dissociative': [
+        'in_recovery_hallciucinogen_dissociative_lsd',
+        'in_recovery_hallciucinogen_dissociative_mescaline_or_peyote',
+        'in_recovery_hallciucinogen_dissociative_ecstasy_mdma',
+        'in_recovery_hallciucinogen_dissociative_psilocybin_or_mushrooms',
+        'in_recovery_hallciucinogen_dissociative_dmt',
+        'in_recovery_hallciucinogen_dissociative_pcp',
+        'in_recovery_hallciucinogen_dissociative_ketamine',
+        'in_recovery_hallciucinogen_dissociative_dxm',
+        'in_recovery_hallciucinogen_dissociative_salvia divinorum',
+        'in_recovery_hallciucinogen_dissociative_none',
+        'in_recovery_hallciucinogen_dissociative_no_answer',
+        'in_recovery_hallciucinogen_dissociative_other'],
+    'in_recovery_inhalants': ['in_recovery_inhalants_glue', 'in_recovery_inhalants_paint_thinner',
+                              'in_recovery_inhalants_gasoline', 'in_recovery_inhalants_laughing_gas',
+                              'in_recovery_inhalants_aerosol_sprays', 'in_recovery_inhalants_none',
+                              'in_recovery_inhalants_no_answer', 'in_recovery_inhalants_other'],
+    'in_recovery_cannabinioids': ['in_recovery_cannabinioids_marijuana',
+                                  'in_recovery_cannabinioids_hashish',
+                                  'in_recovery_cannabinioids_none',
+                                  'in_recovery_cannabinioids_no_answer',
+                                  'in_recovery_cannabinioids_other'],
+    'in_recovery_anabolic_strds': ['in_recovery_anabolic_strds_anadrol',
+                                   'in_recovery_anabolic_strds_oxandrin',
+                                   'in_recovery_anabolic_strds_dunabolin',
+                                   'in_recovery_anabolic_strds_stanozol',
+                                   'in_recovery_anabolic_strds_dianaboll',
+                                   'in_recovery_anabolic_strds_none',
+                                   'in_recovery_anabolic_strds_no_answer',
+                                   'in_recovery_anabolic_strds_other'],
+    'last_30_substance_use_consequences': ['last_30_substance_use_consequences_social',
+                                           'last_30_substance_use_consequences_health_behavioral',
+                                           'last_30_substance_use_consequences_financial',
+                                           'last_30_substance_use_consequences_none_of_above',
+                                           'last_30_substance_use_consequences_no_answer',
+                                           'last_30_substance_use_consequences_other'],
+    'curr_status_cjs': ['curr_status_cjs_parole_probation', 'curr_status_cjs_drug_court',
+                        'curr_status_cjs_no_involvement', 'curr_status_cjs_no_answer'],
+    'update_since_rh_move_in': ['update_since_rh_move_in_completed_parole_probation',
+                                'update_since_rh_move_in_completed_drug_court_requirements',
+                                'update_since_rh_move_in_completed_other_criminal_justice_requirements',
+                                'update_since_rh_move_in_none_of_above',
+                                'update_since_rh_move_in_no_answer'],
+    'last_30_attendance': ['last_30_attendance_12_step',
+                           'last_30_attendance_organized_religious_group',
+                           'last_30_attendance_other_support_group',
+                           'last_30_attendance_sober_support_outing',
+                           'last_30_attendance_activities_sponsored_by_recovery_residence',
+                           'last_30_attendance_activities_provided_while_incarcerated',
+                           'last_30_attendance_none', 'last_30_attendance_no_answer'],
+    'peer_support_type': ['peer_support_type_12_step', 'peer_support_type_recovery_coach',
+                          'peer_support_type_certified_peer_supporter',
+                          'peer_support_type_non_certified_supporter',
+                          'peer_support_type_unkown_certified_supporter',
+                          'peer_support_type_friend_in_recovery',
+                          'peer_support_type_no_answer'],
+    'last_30_education_progress': ['last_30_education_progress_ged',
+                                   'last_30_education_progress_vocational_school',
+                                   'last_30_education_progress_skilled_training',
+                                   'last_30_education_progress_college',
+                                   'last_30_education_progress_not_involved',
+                                   'last_30_education_progress_no_answer',
+                                   'last_30_education_progress_other'],
+    'education_progress_since_recovery_housing': [
+        'education_progress_since_recovery_housing_ged',
+        'education_progress_since_recovery_housing_vocational',
+        'education_progress_since_recovery_housing_associates_degree',
+        'education_progress_since_recovery_housing_bachelors_degree',
+        'education_progress_since_recovery_housing_masters_degree_or_above',
+        'education_progress_since_recovery_housing_none_of_above',
+        'education_progress_since_recovery_housing_no_answer',
+        'education_progress_since_recovery_housing_other'],
+    'debt_category': ['debt_category_student_loans', 'debt_category_car_loan',
+                      'debt_category_mortgage', 'debt_category_other_bank_loan',
+                      'debt_category_credit_cards', 'debt_category_child_support',
+                      'debt_category_past_due_bills', 'debt_category_court_fees',
+                      'debt_category_no_answer', 'debt_category_other'],
+    'parenting_situation': ['parenting_situation_children_in_custody_living_with_me',
+                            'parenting_situation_children_in_custody_living_elsewhere',
+                            'parenting_situation_children_not_in_custody_living_with_family_member',
+                            'parenting_situation_children_in_welfare_custody',
+                            'parenting_situation_no_answer'],
+    'move_out_statement': ['move_out_statement_had_a_safe_clean_and_sober_place_to_live',
+                           'move_out_statement_stabilized_and/or_strengthened_recovery',
+                           'move_out_statement_made_connections_to_the_recovery_community',
+                           'move_out_statement_built_or_re-built_relationships_with_family_and_friends',
+                           'move_out_statement_established_a_plan_for_recovery_including_support_people',
+                           'move_out_statement_grew_as_a_person_and_improved_overall_quality_of_life',
+                           'move_out_statement_believe_that_i_can_impact_my_goals_today',
+                           'move_out_statement_no_answer', 'move_out_statement_other'],
+}
+
+# Option column -> (family, bit position)
+CHECKBOX_OPTIONS = {col: (family, bit)
+                    for family, columns in CHECKBOX_FAMILIES.items()
+                    for bit, col in enumerate(columns)}
+
+
+def _bits_dtype(n_options):
+
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_options <= np.iinfo(dtype).bits:
+            return dtype
+
+
+def binarize_orh(input_data):
+
+    # Pack every checkbox family into one unsigned integer column, '<family>_bits',
+    # where bit i is set when the i-th option was ticked.
+    for family, columns in CHECKBOX_FAMILIES.items():
+        if not set(columns).issubset(input_data.columns):
+            continue
+
+        dtype = _bits_dtype(len(columns))
+        ticked = input_data[columns].notna().to_numpy(dtype=dtype)
+        weights = np.left_shift(np.ones(len(columns), dtype=dtype),
+                                np.arange(len(columns), dtype=dtype))
+
+        input_data[f'{family}_bits'] = np.bitwise_or.reduce(ticked * weights, axis=1).astype(dtype)
+
+    return input_data
+
+
+def checkbox_array(input_data, columns):
+
+    # (rows x options) uint8 matrix of ticked options, read from the packed
+    # '<family>_bits' columns when binarize_orh has run
+    output = np.empty((len(input_data), len(columns)), dtype=np.uint8)
+
+    for i, col in enumerate(columns):
+        family, bit = CHECKBOX_OPTIONS.get(col, (None, None))
+
+        if family is not None and f'{family}_bits' in input_data.columns:
+            bits = input_data[f'{family}_bits'].to_numpy()
+            output[:, i] = (bits >> bit) & 1
+        else:
+            output[:, i] = input_data[col].notna()
+
+    return output
+
+
+def checkbox_indicators(input_data, columns):
+
+    return pd.DataFrame(checkbox_array(input_data, columns),
+                        index=input_data.index,
+                        columns=columns)
+
+
+# Identity columns derived by identity_orh: column -> (checkbox family, no-answer option,
+# prefix stripped from the option names)
+IDENTITY_COLUMNS = {
+    'Gender': ('gender_identify', 'gender_identify_no_answer', 'gender_identify_'),
+    'Sexuality': ('sexual_identity', 'sexual_identity_no_answer', 'sexual_identity_'),
+    'Race': ('race_id', 'rad_id_no_answer', 'race_id_'),
+}
+
+
+def identity_orh(input_data):
+
+    # One categorical per identity question: the option name when exactly one was ticked,
+    # 'Multiple' when more were, 'No Answer' when the no-answer option was ticked and
+    # empty when nothing was. Works on the '<family>_bits' columns from binarize_orh.
+    for name, (family, declined, prefix) in IDENTITY_COLUMNS.items():
+        if f'{family}_bits' not in input_data.columns:
+            continue
+
+        columns = CHECKBOX_FAMILIES[family]
+        bits = input_data[f'{family}_bits'].to_numpy().astype(np.int64)
+        declined_bit = 1 << CHECKBOX_OPTIONS[declined][1]
+
+        answered = bits & ~declined_bit
+        single = (answered != 0) & ((answered & (answered - 1)) == 0)
+
+        options = [col for col in columns if col != declined]
+        labels = [col.replace(prefix, '') for col in options] + ['Multiple', 'No Answer']
+
+        # Option bit -> category code, then the two catch-all codes
+        option_codes = np.full(len(columns), -1, dtype=np.int64)
+        option_codes[[CHECKBOX_OPTIONS[col][1] for col in options]] = np.arange(len(options))
+
+        codes = np.full(len(bits), -1, dtype=np.int64)
+        codes[single] = option_codes[np.log2(answered[single]).round().astype(np.int64)]
+        codes[(answered & (answered - 1)) != 0] = len(options)
+        codes[(bits & declined_bit) != 0] = len(options) + 1
+
+        input_data[name] = pd.Categorical.from_codes(codes, categories=labels)
+
+    return input_data
+
+
+def format_orh_types(input_data, types_path):
+
+    # Cast option columns to pandas Categorical using orh_col_types.csv. Listed categories
+    # keep their order and any answer the spec does not list is merged in, so no value is
+    # lost. The spec lists answers in the string order the reports have always shown them
+    # in. Columns without listed categories, and every checkbox option column, use their
+    # observed answers in that same string order. Group on these columns with observed=True
+    # and sort_index(), pandas 1.x leaves observed groups in first-seen order.
+    orh_types = pd.read_csv(types_path, keep_default_na=False)
+
+    categories = dict(zip(orh_types['Columns'], orh_types['Categories']))
+    for columns in CHECKBOX_FAMILIES.values():
+        for col in columns:
+            categories.setdefault(col, '')
+
+    converted = {}
+    for col, listed in categories.items():
+        if col not in input_data.columns:
+            continue
+
+        listed = [value for value in listed.split('|') if value != '']
+        observed = [value for value in input_data[col].dropna().unique() if value not in listed]
+
+        # Slot each unlisted answer in before the first listed answer that sorts after it,
+        # so a string-ordered spec stays string-ordered once the extra answers are added.
+        merged = list(listed)
+        for value in sorted(observed, key=str):
+            position = next((i for i, known in enumerate(merged) if str(known) > str(value)), len(merged))
+            merged.insert(position, value)
+
+        converted[col] = pd.Categorical(input_data[col], categories=merged)
+
+    # Build the typed frame in one go. Replacing the columns one at a time copies the
+    # remaining object block for every column, which grows with rows x columns squared.
+    return pd.DataFrame({col: converted.get(col, input_data[col].array) for col in input_data.columns},
+                        index=input_data.index)
+
+
+# Tables held back by deferred_output, None when every table is written straight away
+_OUTPUT_BUFFER = None
+
+
+def save_output(table, output_directory, file_name):
+
+    # Every report table goes through here, so a run can collect them and write once
+    if _OUTPUT_BUFFER is not None:
+        _OUTPUT_BUFFER.append((output_directory, file_name, table))
+        return
+
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    table.to_csv(f'{output_directory}/{file_name}')
+    _count_output(f'{output_directory}/{file_name}')
+
+
+def flush_output(buffer, csv=True, workbook=None, parquet=None):
+
+    # Create each output directory once, then write every table
+    if csv is True:
+        for output_directory in dict.fromkeys(entry[0] for entry in buffer):
+            os.makedirs(output_directory, exist_ok=True)
+        for output_directory, file_name, table in buffer:
+            table.to_csv(f'{output_directory}/{file_name}')
+            _count_output(f'{output_directory}/{file_name}')
+
+    # One sheet per table plus a contents sheet. Excel caps sheet names at 31 characters
+    # and does not allow []:*?/\ in them.
+    if workbook is not None:
+        contents = []
+        with pd.ExcelWriter(workbook) as writer:
+            for i, (output_directory, file_name, table) in enumerate(buffer):
+                sheet = ''.join(c for c in os.path.splitext(file_name)[0] if c not in '[]:*?/\\')
+                sheet = f'{i + 1} {sheet}'[:31]
+                table.to_excel(writer, sheet_name=sheet)
+                contents.append({'Sheet': sheet, 'Directory': output_directory, 'File': file_name})
+            pd.DataFrame(contents).to_excel(writer, sheet_name='Contents', index=False)
+
+    # Every table stacked into one frame, keyed by the directory and file it belongs to
+    if parquet is not None:
+        frames = [table.reset_index().assign(Directory=output_directory, File=file_name)
+                  for output_directory, file_name, table in buffer]
+        dataset = pd.concat(frames, ignore_index=True)
+        dataset.columns = dataset.columns.astype(str)
+        for col in dataset.columns[dataset.dtypes == object]:
+            dataset[col] = dataset[col].astype('string')
+        dataset.to_parquet(parquet, index=False)
+
+
+@contextmanager
+def deferred_output(csv=True, workbook=None, parquet=None):
+
+    # Collect every table saved inside the block and write them together at the end, as
+    # CSVs and/or one workbook or Parquet file. Nothing is written if the block fails.
+    global _OUTPUT_BUFFER
+
+    previous = _OUTPUT_BUFFER
+    buffer = []
+    _OUTPUT_BUFFER = buffer
+    try:
+        yield buffer
+    finally:
+        _OUTPUT_BUFFER = previous
+
+    flush_output(buffer, csv=csv, workbook=workbook, parquet=parquet)
+
+
+# Results held back by quiet_results, None when every result is printed as it is made
+_RESULT_BUFFER = None
+
+
+def report_result(method_title, title, sample_size, table):
+
+    # Every summary table a report function makes, as a dict that callers can use directly.
+    # sample_size maps each stage to its number of surveys.
+    result = {'metric': method_title,
+              'title': title,
+              'sample_size': sample_size,
+              'table': table}
+
+    if _RESULT_BUFFER is not None:
+        _RESULT_BUFFER.append(result)
+    else:
+        render_result(result)
+
+    return result
+
+
+def render_result(result):
+
+    for stage, sample_size in result['sample_size'].items():
+        print(f"{result['metric']} {result['title']}: {stage} Sample Size = {sample_size}")
+    print(f"\n{result['metric']} {result['title']}: Summary Table")
+    print("============================================")
+    print(f"{result['table']}")
+    print("============================================\n\n")
+
+
+@contextmanager
+def quiet_results():
+
+    # Print nothing inside the block and collect every result into the yielded list
+    # instead; pass them to render_result to print any of them later
+    global _RESULT_BUFFER
+
+    previous = _RESULT_BUFFER
+    buffer = []
+    _RESULT_BUFFER = buffer
+    try:
+        yield buffer
+    finally:
+        _RESULT_BUFFER = previous
+
+
+# Calls recorded by profile_run, None when profiling is off
+_PROFILE_RECORDS = None
+
+# Profiled calls still running, innermost last
+_PROFILE_STACK = []
+
+# Bytes of report files written while profiling
+_OUTPUT_BYTES = 0
 
-    # # Create Criminal Justice ID Column
-    # crim_hist_id = ['curr_status_cjs_parole_probation',
-    #                 'curr_status_cjs_drug_court',
-    #                 'curr_status_cjs_no_involvement',
-    #                 'curr_status_cjs_no_answer']
 
-    # merge_orh(input_data, crim_hist_id, 'CJS')
+def _count_output(file_path):
+
+    global _OUTPUT_BYTES
+    if _PROFILE_RECORDS is not None:
+        _OUTPUT_BYTES += os.path.getsize(file_path)
+
+
+def profiled(func):
+
+    # Record wall time, rows passed in, peak allocation and bytes written for each call
+    # made inside profile_run. Outside of it a call costs one extra check. Nested calls
+    # are recorded too, and every figure includes the calls made from inside.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _PROFILE_RECORDS is None:
+            return func(*args, **kwargs)
+
+        records = _PROFILE_RECORDS
+        call = {'output_bytes': _OUTPUT_BYTES, 'peak': 0}
+
+        # tracemalloc keeps one peak, so each call restarts it and hands its own peak
+        # back to the call it was made from
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if _PROFILE_STACK:
+                _PROFILE_STACK[-1]['peak'] = max(_PROFILE_STACK[-1]['peak'], peak)
+            call['base'] = current
+            tracemalloc.reset_peak()
+
+        _PROFILE_STACK.append(call)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            _PROFILE_STACK.pop()
+
+            peak_mb = None
+            if tracing:
+                peak = max(call['peak'], tracemalloc.get_traced_memory()[1])
+                peak_mb = (peak - call['base']) / 1e6
+                if _PROFILE_STACK:
+                    _PROFILE_STACK[-1]['peak'] = max(_PROFILE_STACK[-1]['peak'], peak)
+
+            values = list(args) + list(kwargs.values())
+            records.append({
+                'function': func.__name__,
+                'arguments': ', '.join(value for value in values if isinstance(value, str)),
+                'depth': len(_PROFILE_STACK),
+                'seconds': seconds,
+                'rows': sum(len(value) for value in values if isinstance(value, pd.DataFrame)),
+                'peak_mb': peak_mb,
+                'output_bytes': _OUTPUT_BYTES - call['output_bytes']})
+
+    return wrapper
+
+
+def profile_table(records):
+
+    # One line per function, slowest first. Times include the profiled calls made from
+    # inside, so an aggregate runner also counts its cohort* calls.
+    calls = pd.DataFrame(records, columns=['function', 'arguments', 'depth', 'seconds',
+                                           'rows', 'peak_mb', 'output_bytes'])
+    calls['peak_mb'] = calls['peak_mb'].astype(float)
+
+    table = calls.groupby('function').agg(calls=('seconds', 'size'),
+                                          seconds=('seconds', 'sum'),
+                                          mean_seconds=('seconds', 'mean'),
+                                          rows=('rows', 'sum'),
+                                          peak_mb=('peak_mb', 'max'),
+                                          output_mb=('output_bytes', 'sum'))
+    table['output_mb'] = table['output_mb'] / 1e6
+
+    return table.sort_values('seconds', ascending=False)
+
+
+@contextmanager
+def profile_run(json_path=None, memory=False):
+
+    # Profile every report function called inside the block and print a summary at the
+    # end. memory=True also traces allocations for peak_mb, which slows the run down.
+    # json_path keeps every call, one record each, for comparing runs.
+    global _PROFILE_RECORDS
+
+    previous = _PROFILE_RECORDS
+    records = []
+    _PROFILE_RECORDS = records
+
+    started = memory is True and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    run_start = time.perf_counter()
+    try:
+        yield records
+    finally:
+        _PROFILE_RECORDS = previous
+        if started:
+            tracemalloc.stop()
+
+    if json_path is not None:
+        with open(json_path, 'w') as file:
+            json.dump({'date': str(date.today()),
+                       'seconds': time.perf_counter() - run_start,
+                       'calls': records}, file, indent=2)
+
+    print("Profile: Summary Table")
+    print("============================================")
+    print(profile_table(records).round(3).to_string())
+    print("============================================\n\n")
+
+
+# ----------------------------------------------------------------------------------------- #
+#                                  V1 SURVEY HARMONIZATION                                  #
+# ----------------------------------------------------------------------------------------- #
+
+
+# Completion stage answers of the v1 survey. Staff filled in the last one for residents
+# who left without notice.
+V1_STAGE_NAMES = {
+    'This form is being completed as a part of MOVE-IN to this recovery home, and I recently moved-in.': 'Move In',
+    'This form is being completed as a part of MOVE-OUT from this recovery home.': 'Move Out',
+    'This form is being completed as part of an IN-HOUSE FOLLOW-UP SIX MONTHS after move-in': 'Follow Up',
+    'I am completing this form for a resident who moved out without notice.': 'Move Out',
+}
+
+# Age ranges of the 2022 survey, as [lower, upper) bounds in years
+V1_AGE_BINS = [18, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, np.inf]
+V1_AGE_LABELS = ['18-24 years', '25-29 years', '30-34 years', '35-39 years', '40-44 years',
+                 '45-49 years', '50-54 years', '55-59 years', '60-64 years', '65-69 years',
+                 '70+ years']
+
+# Compiled old_col_map.csv files, by path and modification time
+_V1_MAPS = {}
+
+
+def _v1_map(map_path):
+
+    # {2022 column: [(v1 one-hot column, 2022 answer), ...]} in file order. A blank
+    # answer keeps the text of the v1 column.
+    key = (map_path, os.path.getmtime(map_path))
+    if key not in _V1_MAPS:
+        spec = pd.read_csv(map_path, keep_default_na=False)
+        _V1_MAPS[key] = {target: list(zip(group['Columns'], group['Value']))
+                         for target, group in spec.groupby('Target', sort=False)}
+
+    return _V1_MAPS[key]
+
+
+def _collapse_one_hot(input_data, options):
+
+    # One column from a set of one-hot columns. When several are ticked, the first
+    # option in the map wins.
+    columns = [col for col, _ in options]
+    ticked = input_data[columns].notna().to_numpy()
+
+    values = np.column_stack([
+        np.full(len(input_data), value, dtype=object) if value != '' else input_data[col].to_numpy(dtype=object)
+        for col, value in options])
+
+    output = values[np.arange(len(input_data)), ticked.argmax(axis=1)]
+    output[~ticked.any(axis=1)] = np.nan
+
+    return output
+
+
+def format_orh_v1(input_data,
+                  path='./old_col_update.csv',
+                  map_path='./old_col_map.csv',
+                  types_path='./orh_col_types.csv'):
+
+    # Bring a v1 survey export into the shape format_orh gives the 2022 export, so the
+    # outcome and cohort functions run on it unchanged. Columns the 2022 survey does not
+    # have are kept as they are.
+    format_orh_cols(input_data, path)
+
+    input_data = input_data[input_data['frm_completion_stage'].notna()].copy()
+
+    input_data['input_type'] = np.where(
+        input_data['frm_completion_stage'].str.contains('without notice', regex=False), 'Staff', 'Client')
+
+    # The 2022 export names the org column with a trailing space
+    format_orh_stage(input_data, V1_STAGE_NAMES)
+    input_data = input_data.rename(columns={'frm_completion_stage': 'Stage', 'org': 'org '})
+
+    # Age range at submission from the year of birth, unknown when out of range
+    born = pd.to_numeric(input_data['year_of_birth'], errors='coerce')
+    born = born.where((born >= 1923) & (born <= 2005))
+    submitted = pd.to_datetime(input_data['submission_date'], errors='coerce').dt.year
+    age = pd.cut(submitted - born, bins=V1_AGE_BINS, labels=V1_AGE_LABELS, right=False)
+    input_data['age'] = age.astype(object).fillna('Unknown')
+
+    # One-hot v1 answers become the single 2022 columns
+    v1_map = _v1_map(map_path)
+    for target, options in v1_map.items():
+        input_data[target] = _collapse_one_hot(input_data, options)
+
+    one_hot = {col for options in v1_map.values() for col, _ in options}
+    consent = [col for col in input_data.columns if col.startswith('consent_indicator')]
+    input_data = input_data.drop(columns=sorted(one_hot) + consent + ['survey_id'])
+
+    input_data['survey_version'] = 'v1'
+
+    binarize_orh(input_data)
+    identity_orh(input_data)
+    input_data = format_orh_types(input_data, types_path)
 
     return input_data
 
+
+def combine_orh(data_2022, data_v1, types_path='./orh_col_types.csv'):
+
+    # One frame over both survey versions. Categoricals from the two frames do not
+    # stack, so the checkbox bits, identities and types are redone over the combined frame.
+    data_2022 = data_2022.assign(survey_version='2022')
+
+    combined = pd.concat([data_2022, data_v1], ignore_index=True)
+    combined = combined.drop(columns=[col for col in combined.columns if col.endswith('_bits')])
+
+    binarize_orh(combined)
+    identity_orh(combined)
+    combined = format_orh_types(combined, types_path)
+
+    return combined
+
+
 # ----------------------------------------------------------------------------------------- #
 #                                     COHORT FUNCTIONS                                      #
 # ----------------------------------------------------------------------------------------- #
 
 
+@profiled
 def cohortAges(input_data, stage, plot=False, title=""):
 
     method_title = "Age Breakdown"
@@ -111,185 +822,60 @@ def cohortAges(input_data, stage, plot=False, title=""):
 
     df['age_range'] = df['age'].str.replace(' years', '')
 
-    df = df.groupby('age_range').size().reset_index(name='count')
+    df = df.groupby('age_range', observed=True).size().sort_index().reset_index(name='count')
 
     # Include only age ranges
     df = df[df['age_range'] != 'Prefer not to answer']
     df = df[df['age_range'] != 'Unknown']
     df['percent'] = df['count']/df['count'].sum() * 100
-    output_table = df.copy()
-    output_table[f'Total Sample Size {title}'] = output_table['count'].sum()
-    print(f"{method_title} {title}: Sample Size = {df['count'].sum()}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{df}")
-    print("============================================\n\n")
 
-    if plot is True:
-        # Set the plot style and color palette
-        sns.set_style('whitegrid')
-        sns.set_palette('muted')
-
-        fig, ax = plt.subplots()
-        ax.bar(df['age_range'],
-               df['count'])
-        ax.set_xticklabels(df['age_range'],
-                           rotation=45,
-                           ha='right')
-        ax.set_xlabel('Age Range')
-        ax.set_ylabel('Percentage')
-        if title == "":
-            ax.set_title(f'ORH Age Breakdown: {stage}')
-        else:
-            ax.set_title(f'{title} - ORH Age Breakdown: {stage}')
-
-        # display percent above each bar
-        for i, percent in enumerate(df['percent']):
-            ax.text(i,
-                    df['count'][i]+0.5,
-                    f'{percent:.2f}%',
-                    ha='center',
-                    va='bottom')
-
-            # Customize plot
-        fig.set_size_inches(8, 6)
-        ax.tick_params(axis='both',
-                       which='major',
-                       labelsize=10)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.yaxis.grid(True)
-
-        plt.tight_layout()
-        plt.show()
-
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Cohort_Comparisons/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
-
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    # Plotted, closed and saved the same way as the batch reports
+    return {method_title: _report_cohort(_cohort_spec(method_title), df, stage, title, plot)}
 
 
+@profiled
 def cohortEducation(input_data, stage, plot=False, title=""):
 
     method_title = "Highest Educational Degree"
 
     df = input_data[input_data['Stage'] == stage]
-    df = df.groupby('highest_education_degree').size().reset_index(name='count')
+    df = df.groupby('highest_education_degree', observed=True).size().sort_index().reset_index(name='count')
 
     # Include only usable value ranges
     df = df[df['highest_education_degree'] != 'Prefer not to answer']
     df = df[df['highest_education_degree'] != 'Unknown']
 
-    if len(df['highest_education_degree']) == 6:
-        order = [3, 4, 2, 5, 1, 6]
-        df['order'] = order
-        df = df.sort_values('order', ascending=True)
-        df = df.reset_index(drop=True)
+    # Order and shorten degree names, unlisted answers go last as they are
+    order = {degree: i for i, degree in enumerate(EDUCATION_NAMES)}
+    df = df.iloc[df['highest_education_degree'].map(order).astype(float).fillna(len(order)).argsort(kind='stable')]
+    df = df.reset_index(drop=True)
 
-    if len(df['highest_education_degree']) == 6:
-        educ_names = ['No Degree', 'HS Diploma / GED',
-                      "Associate's", "Bachelor's",
-                      "Master's or Beyond", 'Tech/Vocational Cert']
-
-        df['Education'] = educ_names
-    else:
-        df['Education'] = df['highest_education_degree']
+    df['Education'] = df['highest_education_degree'].map(EDUCATION_NAMES).astype(object)
+    df['Education'] = df['Education'].fillna(df['highest_education_degree'].astype(object))
 
     df['percent'] = df['count']/df['count'].sum() * 100
-    output_table = df.copy()
-    output_table[f'Total Sample Size {title}'] = output_table['count'].sum()
-    print(f"{method_title} {title}: Sample Size = {df['count'].sum()}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{df}")
-    print("============================================\n\n")
-    if plot is True:
-        # Set the plot style and color palette
-        sns.set_style('whitegrid')
-        sns.set_palette('muted')
 
-        fig, ax = plt.subplots()
-        ax.bar(df['highest_education_degree'],
-               df['count'])
-
-        ax.set_xticklabels(df['Education'],rotation=45, ha='right')
-        ax.set_xlabel('Education')
-        ax.set_ylabel('Count')
-        if title == "":
-            ax.set_title(f'ORH Highest Educational Degree Breakdown: {stage}')
-        else:
-            ax.set_title(f'{title} - ORH Highest Educational Degree Breakdown: {stage}')
-
-        # display percent above each bar
-        for i, percent in enumerate(df['percent']):
-            ax.text(i,
-                    df['count'][i]+0.5,
-                    f'{percent:.2f}%',
-                    ha='center',
-                    va='bottom')
-
-        ax.set_ylim([0, df['count'].max()*1.1])
-
-        # Customize plot
-        fig.set_size_inches(8, 6)
-        ax.tick_params(axis='both',
-                       which='major',
-                       labelsize=10)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.yaxis.grid(True)
-
-        plt.tight_layout()
-        plt.show()
-
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Cohort_Comparisons/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
-
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    # Plotted, closed and saved the same way as the batch reports
+    return {method_title: _report_cohort(_cohort_spec(method_title), df, stage, title, plot)}
 
 
+@profiled
 def cohortRace(input_data, stage, plot=False, title=""):
 
     method_title = "Race Breakdown"
     df = input_data[input_data['Stage'] == stage]
 
-    # Remove rows where all are empty
-    df[((df['race_id_white'].notna())
-        | (df['rad_id_no_answer'].notna()))
-        | (df['race_id_black_or_african_american'].notna())
-        | (df['race_id_american_indian_or_alaska_native'].notna())
-        | (df['race_id_chinese'].notna())
-        | (df['race_id_vietnamese'].notna())
-        | (df['race_id_native_hawaiian'].notna())
-        | (df['race_id_filipino'].notna())
-        | (df['race_id_korean'].notna())
-        | (df['race_id_samoan'].notna())
-        | (df['race_id_asian_indian'].notna())
-        | (df['race_id_japanese'].notna())
-        | (df['race_id_chamorro'].notna())
-        | (df['race_id_other_asian'].notna())
-        | (df['race_id_other_pacific_islander'].notna())
-        | (df['race_id_other'].notna())]
-
     # Remove no answers
-    df = df[df['rad_id_no_answer'].isna()]
+    df = df[df['Race'] != 'No Answer']
 
-    orh_race = df[['race_id_white', 'race_id_black_or_african_american',
-                     'race_id_american_indian_or_alaska_native', 'race_id_chinese',
-                     'race_id_vietnamese', 'race_id_native_hawaiian', 'race_id_filipino',
-                     'race_id_korean', 'race_id_samoan', 'race_id_asian_indian',
-                     'race_id_japanese','race_id_chamorro', 'race_id_other_asian',
-                     'race_id_other_pacific_islander', 'race_id_other']]
-
-    orh_race.fillna(0, inplace=True)
-
-    orh_race = orh_race.astype(bool).astype(int)
+    orh_race = checkbox_indicators(df, ['race_id_white', 'race_id_black_or_african_american',
+                                        'race_id_american_indian_or_alaska_native',
+                                        'race_id_chinese', 'race_id_vietnamese',
+                                        'race_id_native_hawaiian', 'race_id_filipino',
+                                        'race_id_korean', 'race_id_samoan',
+                                        'race_id_asian_indian', 'race_id_japanese',
+                                        'race_id_chamorro', 'race_id_other_asian',
+                                        'race_id_other_pacific_islander', 'race_id_other'])
 
     new_col_names = [col_name.replace('race_id_', '').replace('rad_id_', '') for col_name in orh_race.columns]
     orh_race.columns = new_col_names
@@ -303,1906 +889,2558 @@ def cohortRace(input_data, stage, plot=False, title=""):
                                                       0: 'Total',
                                                       1: 'Surveys',
                                                       2: 'Percent Surveyed'})
-    # Create new dataframe for graph display
-    r_graphs = r_brkdwn.copy()
-    r_graphs['g_perc'] = r_graphs['Percent Surveyed']*100
 
-    # Create output dataframe for export
-    output_table = r_brkdwn
+    # Plotted, closed and saved the same way as the batch reports
+    return {method_title: _report_cohort(_cohort_spec(method_title), r_brkdwn, stage, title, plot)}
+
+
+@profiled
+def cohortGender(input_data, stage, plot=False, title=""):
+
+    method_title = "Gender Breakdown"
+    df = input_data[input_data['Stage'] == stage]
+
+    # Remove No Answers
+    df = df[df['Gender'] != 'No Answer']
+
+    orh_gender = checkbox_indicators(df, ['gender_identify_agender',
+                                          'gender_identify_genderqueer',
+                                          'gender_identify_gender_fluid',
+                                          'gender_identify_man', 'gender_identify_non-binary',
+                                          'gender_identify_questioning',
+                                          'gender_identify_transgender',
+                                          'gender_identify_trans_man',
+                                          'gender_identify_trans_woman',
+                                          'gender_identify_woman', 'gender_identify_other'])
+
+    new_col_names = [col_name.replace('gender_identify_', '') for col_name in orh_gender.columns]
+    orh_gender.columns = new_col_names
+
+    g_sum = orh_gender.sum()
+    g_count = orh_gender.count()
+    g_perc = g_sum/g_count
+
+    g_brkdwn = pd.concat([g_sum, g_count, g_perc], axis=1)
+    g_brkdwn = g_brkdwn.reset_index().rename(columns = {'index': 'gender',
+                                                        0: 'Total',
+                                                        1: 'Surveys',
+                                                        2: 'Percent Surveyed'})
+
+    # Plotted, closed and saved the same way as the batch reports
+    return {method_title: _report_cohort(_cohort_spec(method_title), g_brkdwn, stage, title, plot)}
+
+
+@profiled
+def cohortSexuality(input_data, stage, plot=False, title=""):
+
+    method_title = "Sexuality Breakdown"
+    df = input_data[input_data['Stage'] == stage]
+
+    # Remove empty rows and no answers
+    df = df[df['Sexuality'].notna() & (df['Sexuality'] != 'No Answer')]
+    
+    orh_sex = checkbox_indicators(df, ['sexual_identity_asexual', 'sexual_identity_bisexual',
+                                       'sexual_identity_gay', 'sexual_identity_heterosexual',
+                                       'sexual_identity_lesbian', 'sexual_identity_pansexual',
+                                       'sexual_identity_queer', 'sexual_identity_questioning',
+                                       'sexual_identity_same_gender_loving',
+                                       'sexual_identity_other'])
+
+    new_col_names = [col_name.replace('sexual_identity_', '') for col_name in orh_sex.columns]
+    orh_sex.columns = new_col_names
+
+    s_sum = orh_sex.sum()
+    s_count = orh_sex.count()
+    s_perc = s_sum/s_count
+
+    s_brkdwn = pd.concat([s_sum, s_count, s_perc], axis=1)
+    s_brkdwn = s_brkdwn.reset_index().rename(columns={'index': 'Sexuality',
+                                                      0: 'Total',
+                                                      1: 'Surveys',
+                                                      2: 'Percent Surveyed'})
+
+    # Plotted, closed and saved the same way as the batch reports
+    return {method_title: _report_cohort(_cohort_spec(method_title), s_brkdwn, stage, title, plot)}
+
+
+# ----------------------------------------------------------------------------------------- #
+#                                    OUTCOME FUNCTIONS                                      #
+# ----------------------------------------------------------------------------------------- #
+
+
+@profiled
+def outcomeSubstance(input_data,
+                     title="",
+                     plot=False,
+                     includeStaff=True,
+                     noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'Substance',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomePrograms(input_data,
+                    title="",
+                    plot=False,
+                    includeStaff=True,
+                    noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'Programs',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeDocuments(input_data,
+                     title="",
+                     plot=False,
+                     includeStaff=True,
+                     noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'Documents',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeEducation(input_data,
+                     title="",
+                     plot=False,
+                     includeStaff=True,
+                     noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'Education',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeEmployment(input_data,
+                      title="",
+                      plot=False,
+                      includeStaff=True,
+                      noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'Employment',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeHealth(input_data,
+                  title="",
+                  plot=False,
+                  includeStaff=True,
+                  noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'Health',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeConsequences(input_data,
+                        title="",
+                        plot=False,
+                        includeStaff=True,
+                        noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'Consequences',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeRecoveryCapital(input_data,
+                     title="",
+                     plot=False,
+                     includeStaff=True,
+                     noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'RecoveryCapital',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeSuccess(input_data,
+                     title="",
+                     plot=False,
+                     includeStaff=True,
+                     noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'Success',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeMoveOutReason(input_data,
+                         title="",
+                         plot=False,
+                         includeStaff=True,
+                         noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'MoveOutReason',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeSponsor(input_data,
+                   title="",
+                   plot=False,
+                   includeStaff=True,
+                   noAnswers=False):
+
+    return outcomeReport(input_data,
+                         'Sponsor',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+@profiled
+def outcomeCriminalJustice(input_data,
+                    title="",
+                    plot=False,
+                    includeStaff=True,
+                    noAnswers=True):
+
+    return outcomeReport(input_data,
+                         'CriminalJustice',
+                         title=title,
+                         plot=plot,
+                         includeStaff=includeStaff,
+                         noAnswers=noAnswers)
+
+
+# ----------------------------------------------------------------------------------------- #
+#                                     OUTCOME ENGINE                                        #
+# ----------------------------------------------------------------------------------------- #
+
+
+OUTCOME_STAGES = ['Move In', 'Move Out']
+
+NO_ANSWER_VALUES = ['Prefer not to answer', 'Unknown']
+
+POPULATION = '__population__'
+
+# Every outcome metric, declared once. 'single' metrics are one answer per survey, 'multi'
+# metrics are checkbox families where each option is its own column. 'report' names the
+# outcome* function that reports the metric, 'summary': False leaves it out of
+# outcomeSummary / outcomeComparison, and 'stages' limits it to some of OUTCOME_STAGES.
+OUTCOME_METRICS = [
+    {'title': 'Alcohol Use', 'report': 'Substance', 'type': 'single',
+     'column': 'last_30_alcohol_use', 'label': 'Alcohol Use',
+     'plot_title': 'Alcohol Use Last 30 Days: Move In vs Move Out'},
+    {'title': 'Drug Use', 'report': 'Substance', 'type': 'single',
+     'column': 'last_30_illegal_drugs_non_prescribed_medications', 'label': 'Drug Use',
+     'plot_title': 'Drug Use Last 30 Days: Move In vs Move Out'},
+    {'title': 'Program Usage', 'report': 'Programs', 'type': 'multi',
+     'columns': ['last_30_attendance_12_step',
+                 'last_30_attendance_organized_religious_group',
+                 'last_30_attendance_other_support_group',
+                 'last_30_attendance_sober_support_outing',
+                 'last_30_attendance_activities_sponsored_by_recovery_residence',
+                 'last_30_attendance_activities_provided_while_incarcerated',
+                 'last_30_attendance_none', 'last_30_attendance_no_answer'],
+     'labels': ['Last 30: 12 Step',
+                'Last 30: Attended Religious Group',
+                'Last 30: Attended Other Support Group',
+                'Last 30: Attended Sober Support Outing',
+                'Last 30: Attended Recovery Residence Activity',
+                'Last 30: Attended Activity while Incarcerated',
+                'Last 30: Attended No Program',
+                'Last 30: No Answer on Attendance'],
+     'answered': ['last_30_attendance_12_step',
+                  'last_30_attendance_organized_religious_group',
+                  'last_30_attendance_other_support_group',
+                  'last_30_attendance_sober_support_outing',
+                  'last_30_attendance_activities_sponsored_by_recovery_residence',
+                  'last_30_attendance_activities_provided_while_incarcerated',
+                  'last_30_attendance_none'],
+     'declined': 'last_30_attendance_no_answer',
+     'rule': 'and',
+     'hidden': ['last_30_attendance_no_answer'],
+     'plot_title': "Program Usage Comparison for 'Last 30' Columns: Move In vs Move Out"},
+    {'title': 'Drivers License', 'report': 'Documents', 'type': 'single',
+     'column': 'doc_status_drivers_license',
+     'plot_title': 'Document Status: Drivers License'},
+    {'title': 'State ID', 'report': 'Documents', 'type': 'single',
+     'column': 'doc_status_state_id',
+     'plot_title': 'Document Status: State ID'},
+    {'title': 'Social Security Card', 'report': 'Documents', 'type': 'single',
+     'column': 'doc_status_social_security_card',
+     'plot_title': 'Document Status: Social Security Card'},
+    {'title': 'Birth Certificate', 'report': 'Documents', 'type': 'single',
+     'column': 'doc_status_birth_certificate',
+     'plot_title': 'Document Status: Birth Certificate'},
+    {'title': 'Education Outcome', 'report': 'Education', 'type': 'multi', 'summary': False,
+     'label': 'Education Progress',
+     'columns': ['last_30_education_progress_ged',
+                 'last_30_education_progress_vocational_school',
+                 'last_30_education_progress_skilled_training',
+                 'last_30_education_progress_college',
+                 'last_30_education_progress_not_involved'],
+     'labels': ['Last 30: GED',
+                'Last 30: Vocational School',
+                'Last 30: Skilled Training',
+                'Last 30: College',
+                'Last 30: No Involvement'],
+     'answered': ['last_30_education_progress_ged',
+                  'last_30_education_progress_vocational_school',
+                  'last_30_education_progress_skilled_training',
+                  'last_30_education_progress_college',
+                  'last_30_education_progress_not_involved'],
+     'plot_title': "Education Comparison for 'Last 30' Columns: Move In vs Move Out"},
+    {'title': 'Employment', 'report': 'Employment', 'type': 'single',
+     'column': 'last_30_employment_status',
+     'plot_title': 'Employment Status'},
+    {'title': 'Volunteering', 'report': 'Employment', 'type': 'single',
+     'column': 'last_30_volunteering_status',
+     'plot_title': 'Volunteering Status'},
+    {'title': 'Physical Health', 'report': 'Health', 'type': 'single',
+     'column': 'last_30_physical_health'},
+    {'title': 'Mental Health', 'report': 'Health', 'type': 'single',
+     'column': 'last_30_mental_health'},
+    {'title': 'Substance Use Consequences', 'report': 'Consequences', 'type': 'multi',
+     'label': 'Consequences',
+     'columns': ['last_30_substance_use_consequences_social',
+                 'last_30_substance_use_consequences_health_behavioral',
+                 'last_30_substance_use_consequences_financial',
+                 'last_30_substance_use_consequences_none_of_above',
+                 'last_30_substance_use_consequences_no_answer',
+                 'last_30_substance_use_consequences_other'],
+     'answered': ['last_30_substance_use_consequences_social',
+                  'last_30_substance_use_consequences_health_behavioral',
+                  'last_30_substance_use_consequences_financial',
+                  'last_30_substance_use_consequences_none_of_above',
+                  'last_30_substance_use_consequences_no_answer',
+                  'last_30_substance_use_consequences_other'],
+     'hidden': ['last_30_substance_use_consequences_none_of_above',
+                'last_30_substance_use_consequences_no_answer'],
+     'plot_title': "Outcome Substance Consequences for 'Last 30' Columns: Move In vs Move Out"},
+    {'title': 'Support System', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery'},
+    {'title': 'Future Hopes and Goals', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_goals_and_hopes_for_my_future'},
+    {'title': 'Problem Solving Skills', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions'},
+    {'title': 'Sense of Self', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_a_clear_sense_of_who_i_am'},
+    {'title': 'Family and Community Participation', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community'},
+    {'title': 'Sense of Purpose', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_a_sense_of_purpose_in_my_life'},
+    {'title': 'Sense of Personal Values', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong'},
+    {'title': 'Sense of Community and Belonging', 'report': 'RecoveryCapital', 'type': 'single',
+     'folder': 'Recovery_Capital',
+     'column': 'move_out_statement_i_have_a_sense_of_community_and_belonging'},
+    {'title': 'Was Housing Successful?', 'report': 'Success', 'type': 'single', 'stages': ['Move Out'],
+     'column': 'move_out_recovery_housing_success'},
+    {'title': 'Move Out Reason', 'report': 'MoveOutReason', 'type': 'single', 'stages': ['Move Out'],
+     'column': 'move_out_recovery_housing_leave_reason'},
+    {'title': 'Working with Sponsor?', 'report': 'Sponsor', 'type': 'single',
+     'column': 'last_30_attendance_working_with_sponsor'},
+    {'title': 'Criminal Justice Status', 'report': 'CriminalJustice', 'type': 'multi',
+     'label': 'Criminal Justice System Status',
+     'columns': ['curr_status_cjs_parole_probation',
+                 'curr_status_cjs_drug_court',
+                 'curr_status_cjs_no_involvement',
+                 'curr_status_cjs_no_answer'],
+     'answered': ['curr_status_cjs_parole_probation',
+                  'curr_status_cjs_drug_court',
+                  'curr_status_cjs_no_involvement'],
+     'declined': 'curr_status_cjs_no_answer',
+     'rule': 'or',
+     'hidden': ['curr_status_cjs_no_answer'],
+     'plot_title': 'Criminal Justice Status: Move In vs Move Out'},
+]
+
+
+def outcome_metrics(titles=None, summary=False, report=None):
+
+    if report is not None:
+        return [spec for spec in OUTCOME_METRICS if spec.get('report') == report]
+
+    if titles is not None:
+        specs = {spec['title']: spec for spec in OUTCOME_METRICS}
+        return [specs[title] for title in titles]
+
+    if summary is True:
+        return [spec for spec in OUTCOME_METRICS if spec.get('summary', True)]
+
+    return list(OUTCOME_METRICS)
+
+
+# Row positions and stage codes already worked out for a frame, least recently used first.
+# Reports on the same frame reuse them instead of rebuilding the masks.
+VIEW_CACHE_SIZE = 256
+
+_VIEW_CACHE = OrderedDict()
+
+# id(frame) -> (frame token, cache keys), emptied when the frame is garbage collected
+_VIEW_FRAMES = {}
+
+
+def _column_token(column):
+
+    # Address of the column's values, which moves when the column is replaced
+    values = column.array
+    values = values.codes if isinstance(values, pd.Categorical) else column.to_numpy()
+
+    return values.__array_interface__['data'][0]
+
+
+def _frame_token(input_data):
+
+    # Changes when rows or columns are added or dropped, or Stage / input_type are
+    # replaced. Values edited in place are not seen, call clear_views after those.
+    return (input_data.shape,
+            id(input_data.index),
+            tuple(input_data.columns),
+            _column_token(input_data['Stage']),
+            _column_token(input_data['input_type']) if 'input_type' in input_data.columns else None)
+
+
+def _drop_views(frame):
+
+    _, keys = _VIEW_FRAMES.pop(frame, (None, ()))
+    for key in keys:
+        _VIEW_CACHE.pop(key, None)
+
+
+def clear_views(input_data=None):
+
+    # Forget the cached views of one frame, or of every frame
+    if input_data is not None:
+        _drop_views(id(input_data))
+        return
+
+    _VIEW_CACHE.clear()
+    _VIEW_FRAMES.clear()
+
+
+def _cached_view(input_data, key, build):
+
+    frame = id(input_data)
+    token = _frame_token(input_data)
+
+    if frame not in _VIEW_FRAMES:
+        weakref.finalize(input_data, _drop_views, frame)
+    elif _VIEW_FRAMES[frame][0] != token:
+        _drop_views(frame)
+    token, keys = _VIEW_FRAMES.setdefault(frame, (token, set()))
+
+    key = (frame,) + key
+    if key in _VIEW_CACHE:
+        _VIEW_CACHE.move_to_end(key)
+        return _VIEW_CACHE[key]
+
+    view = build()
+    view.setflags(write=False)
+    _VIEW_CACHE[key] = view
+    keys.add(key)
+
+    while len(_VIEW_CACHE) > VIEW_CACHE_SIZE:
+        oldest, _ = _VIEW_CACHE.popitem(last=False)
+        _VIEW_FRAMES[oldest[0]][1].discard(oldest)
+
+    return view
+
+
+def _stage_codes(input_data, stages=None):
+
+    # Stage as integer codes over the requested stages, -1 for everything else
+    if stages is None:
+        stages = OUTCOME_STAGES
+
+    def build():
+        return pd.Categorical(input_data['Stage'], categories=stages).codes.astype(np.int64)
+
+    return _cached_view(input_data, ('stages', tuple(stages)), build)
+
+
+def _tree_columns(input_data, tree):
+
+    # Columns a compiled cohort reads: its single-choice columns and each family's bits
+    # column, or the family's option columns when there is no bits column
+    kind = tree[0]
+    if kind in ('any', 'only'):
+        if f'{tree[1]}_bits' in input_data.columns:
+            return [f'{tree[1]}_bits']
+        return list(CHECKBOX_FAMILIES[tree[1]])
+    if kind in ('in', 'answered'):
+        return [tree[1]]
+
+    return [col for branch in tree[1:] for col in _tree_columns(input_data, branch)]
+
+
+def _cohort_columns(input_data, cohort):
+
+    # Columns a cohort expression reads. Text that does not compile is for DataFrame.eval,
+    # where every column named anywhere in the text counts.
+    try:
+        return _tree_columns(input_data, _compiled_cohort(cohort))
+    except ValueError:
+        return [col for col in input_data.columns if isinstance(col, str) and col in cohort]
+
+
+def _view_rows(input_data, stages=None, includeStaff=True, cohort=None):
+
+    # Positions of the rows in the given stages, clients only unless includeStaff, and
+    # in the cohort if one is given. Cohort expressions, compiled or for DataFrame.eval, are
+    # cached like the stage and staff filters, keyed on the columns they read so reassigning
+    # one of those columns rebuilds them; masks, callables and subsets are applied to the
+    # cached rows afresh.
+    if stages is None:
+        stages = OUTCOME_STAGES
+
+    key = ('rows', tuple(stages), includeStaff is False, cohort)
+    if cohort is not None:
+        rows = _view_rows(input_data, stages, includeStaff)
+        if not isinstance(cohort, (str, tuple)):
+            return rows[_cohort_mask(input_data, cohort)[rows]]
+
+        columns = [col for col in _cohort_columns(input_data, cohort) if col in input_data.columns]
+        key += tuple(_column_token(input_data[col]) for col in dict.fromkeys(columns))
+
+        def build():
+            return rows[_cohort_mask(input_data, cohort)[rows]]
+    else:
+        def build():
+            mask = _stage_codes(input_data, stages) >= 0
+            if includeStaff is False:
+                mask &= (input_data['input_type'] == 'Client').to_numpy()
+            return np.flatnonzero(mask)
+
+    return _cached_view(input_data, key, build)
+
+
+def _family_columns(spec):
+
+    # Option columns plus any no-answer column the keep rule needs to look at
+    columns = list(spec['columns'])
+    for col in spec.get('answered', []) + [spec.get('declined')]:
+        if col is not None and col not in columns:
+            columns.append(col)
+
+    return columns
+
+
+def _family_keep(indicators, columns, spec):
+
+    # Rows that count towards a checkbox family when no-answers are excluded
+    if 'answered' in spec:
+        answered = indicators[:, [columns.index(col) for col in spec['answered']]].any(axis=1)
+    else:
+        answered = np.ones(len(indicators), dtype=bool)
+
+    if spec.get('declined') is None:
+        return answered
+
+    declined = indicators[:, columns.index(spec['declined'])].astype(bool)
+
+    # 'or' keeps every row except those whose only answer is the no-answer option
+    if spec.get('rule') == 'or':
+        return answered | ~declined
+
+    return answered & ~declined
+
+
+def _answer_codes(input_data, column, noAnswers=False):
+
+    # Integer code per row for a single-choice column, -1 when missing (or a no-answer,
+    # unless noAnswers). Categorical columns use their codes, in category order.
+    column = input_data[column]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy().astype(np.int64)
+        uniques = np.asarray(column.cat.categories, dtype=object)
+    else:
+        codes, uniques = pd.factorize(column, sort=True)
+        uniques = np.asarray(uniques, dtype=object)
+
+    if noAnswers is False:
+        remap = np.where(pd.Series(uniques).isin(NO_ANSWER_VALUES), -1,
+                         np.arange(len(uniques)))
+        codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+
+    return codes, uniques
+
+
+def _count_outcomes(input_data, rows, groups, n_groups, noAnswers=False, metrics=None, stages=None):
+
+    # Count every metric for every (group, Stage) in one pass over the selected rows.
+    # Returns a tidy, additive count table: group, metric, value, Stage, count.
+    if metrics is None:
+        metrics = outcome_metrics()
+    if stages is None:
+        stages = OUTCOME_STAGES
+
+    n_stages = len(stages)
+    cells = groups * n_stages + _stage_codes(input_data, stages)[rows]
+    n_cells = n_groups * n_stages
+
+    cell_group = np.repeat(np.arange(n_groups), n_stages)
+    cell_stage = np.tile(np.array(stages, dtype=object), n_groups)
+
+    pieces = []
+
+    def emit(metric, values, counts):
+        # counts: (n_cells, n_values) array
+        counts = np.asarray(counts, dtype=np.int64)
+        n_values = counts.shape[1]
+        pieces.append(pd.DataFrame({
+            'group': np.repeat(cell_group, n_values),
+            'metric': metric,
+            'value': np.tile(np.asarray(values, dtype=object), n_cells),
+            'Stage': np.repeat(cell_stage, n_values),
+            'count': counts.ravel()}))
+
+    for spec in metrics:
+
+        if spec['type'] == 'single':
+            codes, uniques = _answer_codes(input_data, spec['column'], noAnswers)
+
+            codes = codes[rows]
+            valid = codes >= 0
+            n_values = len(uniques)
+
+            counts = np.bincount(cells[valid] * n_values + codes[valid],
+                                 minlength=n_cells * n_values).reshape(n_cells, n_values)
+
+            emit(spec['title'], uniques, counts)
+            emit(spec['title'], [POPULATION], counts.sum(axis=1, keepdims=True))
+
+        else:
+            columns = _family_columns(spec)
+            indicators = checkbox_array(input_data, columns)[rows]
+
+            if noAnswers is False:
+                keep = _family_keep(indicators, columns, spec)
+                shown = [col for col in spec['columns'] if col not in spec.get('hidden', [])]
+            else:
+                keep = np.ones(len(rows), dtype=bool)
+                shown = spec['columns']
+
+            kept_cells = cells[keep]
+            kept = indicators[keep]
+
+            counts = np.column_stack([
+                np.bincount(kept_cells, weights=kept[:, columns.index(col)], minlength=n_cells)
+                for col in shown])
+
+            emit(spec['title'], shown, counts)
+            emit(spec['title'], [POPULATION],
+                 np.bincount(kept_cells, minlength=n_cells)[:, None])
+
+    return pd.concat(pieces, ignore_index=True)
+
+
+def outcome_counts(input_data, includeStaff=True, noAnswers=False, metrics=None):
+
+    rows = _view_rows(input_data, includeStaff=includeStaff)
+
+    counts = _count_outcomes(input_data,
+                             rows,
+                             np.zeros(len(rows), dtype=np.int64),
+                             1,
+                             noAnswers=noAnswers,
+                             metrics=metrics)
+
+    return counts.drop(columns='group')
+
+
+def _outcome_table(spec, counts):
+
+    stages = spec.get('stages', OUTCOME_STAGES)
+
+    grid = counts.pivot_table(index='value',
+                              columns='Stage',
+                              values='count',
+                              aggfunc='sum',
+                              sort=False)
+    grid = grid.reindex(columns=stages).fillna(0).astype(int)
+
+    population = grid.loc[POPULATION]
+    grid = grid.drop(index=POPULATION)
+
+    if spec['type'] == 'single':
+        # Only answers someone actually gave, in the order groupby would list them
+        grid = grid[grid.sum(axis=1) > 0]
+        grid.index.name = spec.get('label', spec['column'])
+
+        perc = grid.div(population, axis=1)
+
+        output = pd.concat([grid, perc], axis=1)
+        output.columns = [f'{stage} Surveys' for stage in stages] + [f'% {stage}' for stage in stages]
+        return output
+
+    labels = dict(zip(spec['columns'], spec.get('labels', spec['columns'])))
+
+    output = grid.copy()
+    for stage in stages:
+        output[f'Percent {stage}'] = (grid[stage] / population[stage]) * 100
+    for stage in stages:
+        output[f'{stage} Population'] = population[stage]
+
+    output.index = [labels[col] for col in output.index]
+    output = output.rename_axis(spec.get('label', spec['title'])).reset_index()
+    output.columns.name = None
+
+    return output
+
+
+def outcome_tables(counts, metrics=None):
+
+    if metrics is None:
+        metrics = outcome_metrics()
+
+    by_metric = dict(tuple(counts.groupby('metric', sort=False)))
+
+    return {spec['title']: _outcome_table(spec, by_metric[spec['title']])
+            for spec in metrics if spec['title'] in by_metric}
+
+
+def outcomeEngine(input_data, includeStaff=True, noAnswers=False, metrics=None):
+
+    counts = outcome_counts(input_data,
+                            includeStaff=includeStaff,
+                            noAnswers=noAnswers,
+                            metrics=metrics)
 
+    return outcome_tables(counts, metrics)
 
 
-    print(f"{method_title} {title}: Sample Size = {r_count[0]}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{r_brkdwn}")
-    print("============================================\n\n")
+def _plot_outcome(spec, table, title="", ax=None):
 
-    if plot is True:
-        # Set the plot style and color palette
-        sns.set_style('whitegrid')
-        sns.set_palette('muted')
+    plot_title = spec.get('plot_title', spec['title'])
+    stages = spec.get('stages', OUTCOME_STAGES)
 
-        fig, ax = plt.subplots()
-        ax.bar(r_graphs['race'],
-               r_graphs['Total'])
+    if spec['type'] == 'single':
+        perc = table[[f'% {stage}' for stage in stages]]
+        perc.columns = stages
 
-        ax.set_xticklabels(r_graphs['race'],rotation=45, ha='right')
-        ax.set_xlabel('Race: Self Identification - Percentage of Surveys')
-        ax.set_ylabel('Total')
+        ax = perc.plot(kind='bar', ax=ax)
+        ax.set_ylabel('Percent Total')
         if title == "":
-            ax.set_title(f'ORH Breakdown Race Breakdown - Self Identification: {stage}')
+            ax.set_title(plot_title)
         else:
-            ax.set_title(f'{title} - ORH Breakdown Race Breakdown - Self Identification: {stage}')
-
-        for i, percent in enumerate(r_graphs['g_perc']):
-            ax.text(i,
-                    r_graphs['Total'][i]+0.5,
-                    f'{percent:.2f}%',
-                    ha='center',
-                    va='bottom')
-
-        ax.set_ylim([0, r_graphs['Total'].max()*1.1])
-
-        # Customize plot
-        fig.set_size_inches(8, 6)
-        ax.tick_params(axis='both',
-                       which='major',
-                       labelsize=10)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.yaxis.grid(True)
-
-        plt.tight_layout()
-        plt.show()
+            ax.set_title(f'{title} - {plot_title}')
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Cohort_Comparisons/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+        # Add percentage labels above each bar
+        for i, container in enumerate(ax.containers):
+            ax.bar_label(container, labels=[f'{val:.0%}' for val in perc.values[:, i]])
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+        # Set the y-axis limits
+        ax.set_ylim(0, 1)
 
+    else:
+        label = table.columns[0]
+        perc = table[[label] + [f'Percent {stage}' for stage in stages]]
+        perc.columns = [label] + stages
 
-def cohortGender(input_data, stage, plot=False, title=""):
+        ax = perc.plot(x=label, kind="bar", stacked=False, ax=ax)
+        if title == "":
+            ax.set_title(plot_title)
+        else:
+            ax.set_title(f"{title} - {plot_title}")
+        ax.set_xlabel("Percentage of Total (%)")
+        ax.set_ylabel("Last 30 Columns")
 
-    method_title = "Gender Breakdown"
-    df = input_data[input_data['Stage'] == stage]
+        # Add percentage labels above each bar
+        for container in ax.containers:
+            ax.bar_label(container, fmt='%.0f%%')
 
-    # Remove Empty Rows
-    df[df['gender_identify_agender'].notna()
-       | df['gender_identify_genderqueer'].notna()
-       | df['gender_identify_gender_fluid'].notna()
-       | df['gender_identify_man'].notna()
-       | df['gender_identify_non-binary'].notna()
-       | df['gender_identify_questioning'].notna()
-       | df['gender_identify_transgender'].notna()
-       | df['gender_identify_trans_man'].notna()
-       | df['gender_identify_trans_woman'].notna()
-       | df['gender_identify_woman'].notna()
-       | df['gender_identify_no_answer'].notna()
-       | df['gender_identify_other'].notna()]
+    return ax
 
-    # Remove No Answers
-    df = df[df['gender_identify_no_answer'].isna()]
 
-    orh_gender = df[['gender_identify_agender', 'gender_identify_genderqueer',
-                     'gender_identify_gender_fluid', 'gender_identify_man',
-                     'gender_identify_non-binary', 'gender_identify_questioning',
-                     'gender_identify_transgender', 'gender_identify_trans_man',
-                     'gender_identify_trans_woman', 'gender_identify_woman',
-                     'gender_identify_other']]
+def _outcome_directory(spec):
 
-    orh_gender.fillna(0, inplace = True)
+    folder = spec.get('folder')
+    if folder is None:
+        return f'./ORH_Output_{date.today()}/Outcome_Comparison/{spec["title"]}'
 
-    orh_gender = orh_gender.astype(bool).astype(int)
+    return f'./ORH_Output_{date.today()}/Outcome_Comparison/{folder}/{spec["title"]}'
 
-    new_col_names = [col_name.replace('gender_identity_', '') for col_name in orh_gender.columns]
-    orh_gender.columns = new_col_names
 
-    g_sum = orh_gender.sum()
-    g_count = orh_gender.count()
-    g_perc = g_sum/g_count
+def _report_outcome(spec, table, title="", plot=False):
 
-    g_brkdwn = pd.concat([g_sum, g_count, g_perc], axis=1)
-    g_brkdwn = g_brkdwn.reset_index().rename(columns = {'index': 'gender',
-                                                        0: 'Total',
-                                                        1: 'Surveys',
-                                                        2: 'Percent Surveyed'})
-    # Create new dataframe for graph display
-    g_graphs = g_brkdwn.copy()
-    g_graphs['g_perc'] = g_graphs['Percent Surveyed']*100
-    
-    # Create output dataframe for export
-    output_table = g_brkdwn
+    method_title = spec['title']
+    stages = spec.get('stages', OUTCOME_STAGES)
 
+    sample_size = {}
+    for stage in stages:
+        if spec['type'] == 'single':
+            sample_size[stage] = table[f'{stage} Surveys'].sum()
+        else:
+            sample_size[stage] = table[f'{stage} Population'].iloc[0] if len(table) else 0
 
+    result = report_result(method_title, title, sample_size, table)
 
-    print(f"{method_title} {title}: Sample Size = {g_count[0]}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{g_brkdwn}")
-    print("============================================\n\n")
+    if plot is True and len(table) > 0:
+        ax = _plot_outcome(spec, table, title)
+        plt.show()
+        plt.close(ax.figure)
 
-    if plot is True:
-        # Set the plot style and color palette
-        sns.set_style('whitegrid')
-        sns.set_palette('muted')
+    # Save the output table
+    output_directory = _outcome_directory(spec)
+    save_output(table, output_directory, f'{method_title}_{title}_{date.today()}.csv')
 
-        fig, ax = plt.subplots()
-        ax.bar(g_graphs['gender'],
-               g_graphs['Total'])
+    return result
 
-        ax.set_xticklabels(g_graphs['gender'],rotation=45, ha='right')
-        ax.set_xlabel('Gender: Self Identification - Percentage of Surveys')
-        ax.set_ylabel('Count')
-        if title == "":
-            ax.set_title(f'ORH Breakdown - Gender - Self Identification: {stage}')
-        else:
-            ax.set_title(f'{title} - ORH Breakdown - Gender - Self Identification: {stage}')
-
-        for i, percent in enumerate(g_graphs['g_perc']):
-            ax.text(i, 
-                    g_graphs['Total'][i]+0.5,
-                    f'{percent:.2f}%',
-                    ha='center',
-                    va='bottom')
-
-        ax.set_ylim([0, g_graphs['Total'].max()*1.1])
-
-        # Customize plot
-        fig.set_size_inches(8, 6)
-        ax.tick_params(axis='both',
-                       which='major',
-                       labelsize=10)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.yaxis.grid(True)
-
-        plt.tight_layout()
-        plt.show()
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Cohort_Comparisons/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+def outcomeReport(input_data,
+                  report,
+                  title="",
+                  plot=False,
+                  includeStaff=True,
+                  noAnswers=False):
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    # Report every metric registered under one report name, counted together in one pass
+    metrics = outcome_metrics(report=report)
 
+    tables = outcomeEngine(input_data,
+                           includeStaff=includeStaff,
+                           noAnswers=noAnswers,
+                           metrics=metrics)
 
-def cohortSexuality(input_data, stage, plot=False, title=""):
+    results = {}
+    for spec in metrics:
+        results[spec['title']] = _report_outcome(spec, tables[spec['title']], title, plot)
 
-    method_title = "Sexuality Breakdown"
-    df = input_data[input_data['Stage'] == stage]
+    return results
 
-    # Remove Empty Rows
-    df = df[((df['sexual_identity_asexual'].notna())
-            | (df['sexual_identity_bisexual'].notna())
-            | (df['sexual_identity_gay'].notna())
-            | (df['sexual_identity_lesbian'].notna())
-            | (df['sexual_identity_pansexual'].notna())
-            | (df['sexual_identity_queer'].notna())
-            | (df['sexual_identity_same_gender_loving'].notna())
-            | (df['sexual_identity_other'].notna()))
-            | (df['sexual_identity_heterosexual'].notna())
-            | (df['sexual_identity_no_answer'].notna())
-            | (df['sexual_identity_questioning'].notna())]
 
-    # Remove No Answers
-    df = df[df['sexual_identity_no_answer'].isna()]
-    
-    orh_sex = df[['sexual_identity_asexual', 'sexual_identity_bisexual',
+# ----------------------------------------------------------------------------------------- #
+#                                      COHORT BATCH                                         #
+# ----------------------------------------------------------------------------------------- #
+
+
+# Display names and order for highest_education_degree, as used by cohortEducation
+EDUCATION_NAMES = {'No degree received': 'No Degree',
+                   'High school diploma or equivalency (GED)': 'HS Diploma / GED',
+                   'Associate degree': "Associate's",
+                   "Bachelor's degree": "Bachelor's",
+                   "Master's degree or beyond": "Master's or Beyond",
+                   'Technical or vocational certification': 'Tech/Vocational Cert'}
+
+# Demographic breakdowns reported by cohortSummary / cohortComparison for a single stage
+COHORT_METRICS = [
+    {'title': 'Age Breakdown', 'type': 'single',
+     'column': 'age', 'label': 'age_range', 'strip': ' years',
+     'plot_title': 'ORH Age Breakdown', 'xlabel': 'Age Range'},
+    {'title': 'Highest Educational Degree', 'type': 'single',
+     'column': 'highest_education_degree', 'names': EDUCATION_NAMES,
+     'plot_title': 'ORH Highest Educational Degree Breakdown', 'xlabel': 'Education'},
+    {'title': 'Race Breakdown', 'type': 'multi',
+     'label': 'race', 'prefix': 'race_id_',
+     'columns': ['race_id_white', 'race_id_black_or_african_american',
+                 'race_id_american_indian_or_alaska_native', 'race_id_chinese',
+                 'race_id_vietnamese', 'race_id_native_hawaiian', 'race_id_filipino',
+                 'race_id_korean', 'race_id_samoan', 'race_id_asian_indian',
+                 'race_id_japanese', 'race_id_chamorro', 'race_id_other_asian',
+                 'race_id_other_pacific_islander', 'race_id_other'],
+     'declined': 'rad_id_no_answer',
+     'plot_title': 'ORH Breakdown Race Breakdown - Self Identification',
+     'xlabel': 'Race: Self Identification - Percentage of Surveys'},
+    {'title': 'Gender Breakdown', 'type': 'multi',
+     'label': 'gender', 'prefix': 'gender_identify_',
+     'columns': ['gender_identify_agender', 'gender_identify_genderqueer',
+                 'gender_identify_gender_fluid', 'gender_identify_man',
+                 'gender_identify_non-binary', 'gender_identify_questioning',
+                 'gender_identify_transgender', 'gender_identify_trans_man',
+                 'gender_identify_trans_woman', 'gender_identify_woman',
+                 'gender_identify_other'],
+     'declined': 'gender_identify_no_answer',
+     'plot_title': 'ORH Breakdown - Gender - Self Identification',
+     'xlabel': 'Gender: Self Identification - Percentage of Surveys'},
+    {'title': 'Sexuality Breakdown', 'type': 'multi',
+     'label': 'Sexuality', 'prefix': 'sexual_identity_',
+     'columns': ['sexual_identity_asexual', 'sexual_identity_bisexual',
+                 'sexual_identity_gay', 'sexual_identity_heterosexual',
+                 'sexual_identity_lesbian', 'sexual_identity_pansexual',
+                 'sexual_identity_queer', 'sexual_identity_questioning',
+                 'sexual_identity_same_gender_loving', 'sexual_identity_other'],
+     'answered': ['sexual_identity_asexual', 'sexual_identity_bisexual',
                   'sexual_identity_gay', 'sexual_identity_heterosexual',
                   'sexual_identity_lesbian', 'sexual_identity_pansexual',
                   'sexual_identity_queer', 'sexual_identity_questioning',
-                  'sexual_identity_same_gender_loving', 'sexual_identity_other']]
+                  'sexual_identity_same_gender_loving', 'sexual_identity_other'],
+     'declined': 'sexual_identity_no_answer',
+     'plot_title': 'ORH Breakdown - Sexuality - Self Identification',
+     'xlabel': 'Sexuality: Self Identification - Percentage of Surveys'},
+]
 
-    orh_sex.fillna(0, inplace=True)
 
-    orh_sex = orh_sex.astype(bool).astype(int)
+def _cohort_spec(title):
 
-    new_col_names = [col_name.replace('sexual_identity_', '') for col_name in orh_sex.columns]
-    orh_sex.columns = new_col_names
+    return next(spec for spec in COHORT_METRICS if spec['title'] == title)
 
-    s_sum = orh_sex.sum()
-    s_count = orh_sex.count()
-    s_perc = s_sum/s_count
 
-    s_brkdwn = pd.concat([s_sum, s_count, s_perc], axis=1)
-    s_brkdwn = s_brkdwn.reset_index().rename(columns={'index': 'Sexuality',
-                                                      0: 'Total',
-                                                      1: 'Surveys',
-                                                      2: 'Percent Surveyed'})
-    # Create new dataframe for graph display
-    s_graphs = s_brkdwn.copy()
-    s_graphs['g_perc'] = s_graphs['Percent Surveyed']*100
+def _cohort_mask(input_data, cohort):
 
-    # Create output dataframe for export
-    output_table = s_brkdwn
+    # A cohort is a boolean mask, a callable returning one, a name from COHORT_DEFINITIONS,
+    # a cohort expression or a cohort compiled by compile_cohort, an expression for
+    # DataFrame.eval, or a subset of the frame such as the notebooks build. Text is read as
+    # a cohort expression first and only goes to DataFrame.eval when it does not compile.
+    if isinstance(cohort, pd.DataFrame):
+        return input_data.index.isin(cohort.index)
+    if isinstance(cohort, str):
+        try:
+            cohort = _compiled_cohort(cohort)
+        except ValueError:
+            pass
+    if isinstance(cohort, tuple):
+        return _evaluate_cohort(input_data, cohort)
+    if callable(cohort):
+        cohort = cohort(input_data)
+    elif isinstance(cohort, str):
+        cohort = input_data.eval(cohort, engine='python')
 
-    print(f"{method_title} {title}: Sample Size = {s_count[0]}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{s_brkdwn}")
-    print("============================================\n\n")
+    if isinstance(cohort, pd.Series):
+        cohort = cohort.reindex(input_data.index, fill_value=False)
 
-    if plot is True:
-        # Set the plot style and color palette
-        sns.set_style('whitegrid')
-        sns.set_palette('muted')
+    return np.asarray(cohort, dtype=bool)
 
-        fig, ax = plt.subplots()
-        ax.bar(s_graphs['Sexuality'],
-               s_graphs['Total'])
 
-        ax.set_xticklabels(s_graphs['Sexuality'],rotation=45, ha='right')
-        ax.set_xlabel('Sexuality: Self Identification - Percentage of Surveys')
-        ax.set_ylabel('Count')
-        if title == "":
-            ax.set_title(f'ORH Breakdown - Sexuality - Self Identification: {stage}')
-        else:
-            ax.set_title(f'{title} - ORH Breakdown - Sexuality - Self Identification: {stage}')
-
-        for i, percent in enumerate(s_graphs['g_perc']):
-            ax.text(i, 
-                    s_graphs['Total'][i]+0.5,
-                    f'{percent:.2f}%',
-                    ha='center',
-                    va='bottom')
-
-        ax.set_ylim([0, s_graphs['Total'].max()*1.1])
-
-        # Customize plot
-        fig.set_size_inches(8, 6)
-        ax.tick_params(axis='both',
-                       which='major',
-                       labelsize=10)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.yaxis.grid(True)
-
-        plt.tight_layout()
-        plt.show()
+def _cohort_rows(input_data, cohorts, stages=None, includeStaff=True):
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Cohort_Comparisons/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    # Row positions of every cohort stacked end to end, with the cohort as a group code.
+    # Only integer positions are kept, so overlapping cohorts never copy the frame.
+    names = list(cohorts)
+    rows = []
+    groups = []
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    for code, name in enumerate(names):
+        positions = _view_rows(input_data, stages, includeStaff, cohorts[name])
+        rows.append(positions)
+        groups.append(np.full(len(positions), code, dtype=np.int64))
 
+    return names, np.concatenate(rows), np.concatenate(groups)
 
-# ----------------------------------------------------------------------------------------- #
-#                                    OUTCOME FUNCTIONS                                      #
-# ----------------------------------------------------------------------------------------- #
 
+def _label_groups(counts, names, key='cohort'):
 
-def outcomeSubstance(input_data,
-                     title="",
-                     plot=False,
-                     includeStaff=True,
-                     noAnswers=False):
+    counts.insert(0, key, pd.Categorical.from_codes(counts.pop('group'), categories=names))
 
-    method_title_a = "Alcohol Use"
+    return counts
 
-    # Substance User
-    out_sub = input_data[['Stage', 'input_type', 'last_30_alcohol_use',
-                          'last_30_illegal_drugs_non_prescribed_medications']]
-    out_sub.columns = ['Stage', 'Input Type', 'Alcohol Use', 'Drug Use']
 
-    out_sub = out_sub[out_sub['Stage'] != 'Follow Up']
+def cohort_counts(input_data, cohorts, includeStaff=True, noAnswers=False, metrics=None):
 
-    if includeStaff is False:
-        out_sub = out_sub[out_sub['Input Type'] == 'Client']
+    names, rows, groups = _cohort_rows(input_data,
+                                       cohorts,
+                                       includeStaff=includeStaff)
 
-    if noAnswers is False:
-        alc_out_sub = out_sub[out_sub['Alcohol Use'] != 'Prefer not to answer']
-        alc_out_sub = alc_out_sub[alc_out_sub['Alcohol Use'] != 'Unknown']
-    else:
-        alc_out_sub = out_sub
+    counts = _count_outcomes(input_data,
+                             rows,
+                             groups,
+                             len(names),
+                             noAnswers=noAnswers,
+                             metrics=metrics)
 
-    counts_a = alc_out_sub.groupby(['Alcohol Use', 'Stage']).size().unstack()
+    return _label_groups(counts, names)
 
-    perc_a = counts_a.div(counts_a.sum(axis=0),axis=1)
 
-    if plot is True:
-        ax = perc_a.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title('Alcohol Use Last 30 Days: Move In vs Move Out')
-        else:
-            ax.set_title(f'{title} - Alcohol Use Last 30 Days: Move In vs Move Out')
+def demographic_counts(input_data, cohorts, stage='Move In', metrics=None):
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc_a.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    if metrics is None:
+        metrics = COHORT_METRICS
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    names, rows, groups = _cohort_rows(input_data,
+                                       cohorts,
+                                       stages=[stage])
 
-    method_title_b = 'Drug Use'
+    # Demographic breakdowns always leave out no-answers
+    counts = _count_outcomes(input_data,
+                             rows,
+                             groups,
+                             len(names),
+                             noAnswers=False,
+                             metrics=metrics,
+                             stages=[stage])
 
-    if noAnswers is False:
-        dr_out_sub = out_sub[out_sub['Drug Use'] != 'Prefer not to answer']
-        dr_out_sub = dr_out_sub[dr_out_sub['Drug Use'] != 'Unknown']
-    else:
-        dr_out_sub = out_sub
+    return _label_groups(counts, names)
 
-    counts_b = dr_out_sub.groupby(['Drug Use', 'Stage']).size().unstack()
 
-    perc_b = counts_b.div(counts_b.sum(axis=0), axis=1)
+def _cohort_table(spec, counts):
 
-    if plot is True:
-        ax = perc_b.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'Drug Use Last 30 Days: Move In vs Move Out')
-        else:
-            ax.set_title(f'{title} - Drug Use Last 30 Days: Move In vs Move Out')    
+    values = counts[counts['value'] != POPULATION].groupby('value', sort=False)['count'].sum()
+    population = counts.loc[counts['value'] == POPULATION, 'count'].sum()
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc_b.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    if spec['type'] == 'single':
+        values = values[values > 0]
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+        df = values.rename('count').rename_axis(spec['column']).reset_index()
 
-    print(f"{method_title_a} {title}: Sample Size: {counts_a.sum(axis=0)}")
-    print(f"\n{method_title_a} {title}: Summary Table")
-    print("============================================")
-    print(f"{perc_a}")
-    print("============================================\n\n")
-    print(f"{method_title_b} {title}: Sample Size: {counts_b.sum(axis=0)}")
-    print(f"\n{method_title_b} {title}: Summary Table")
-    print("============================================")
-    print(f"{perc_b}")
-    print("============================================\n\n")
+        if 'strip' in spec:
+            df[spec['column']] = df[spec['column']].str.replace(spec['strip'], '', regex=False)
+        if 'label' in spec:
+            df = df.rename(columns={spec['column']: spec['label']})
 
-    output_a = pd.concat([counts_a, perc_a], axis=1)
-    output_a.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
-    output_b = pd.concat([counts_b, perc_b], axis=1)
-    output_b.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+        if 'names' in spec:
+            names = spec['names']
+            order = {value: i for i, value in enumerate(names)}
+            df = df.iloc[df[spec['column']].map(order).fillna(len(order)).argsort(kind='stable')]
+            df = df.reset_index(drop=True)
+            df['Education'] = df[spec['column']].map(names).fillna(df[spec['column']])
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_a}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+        df['percent'] = df['count'] / df['count'].sum() * 100
 
-    # Save the output table to the new directory
-    output_a.to_csv(f'{output_directory}/{method_title_a}_{title}_{date.today()}.csv')
+        return df
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_b}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    df = pd.DataFrame({spec['label']: [col.replace(spec.get('prefix', ''), '') for col in values.index],
+                       'Total': values.to_numpy(),
+                       'Surveys': population})
+    df['Percent Surveyed'] = df['Total'] / df['Surveys']
 
-    # Save the output table to the new directory
-    output_b.to_csv(f'{output_directory}/{method_title_b}_{title}_{date.today()}.csv')
+    return df
 
 
-def outcomePrograms(input_data,
-                    title="",
-                    plot=False,
-                    includeStaff=True,
-                    noAnswers=True):
+def demographic_tables(counts, metrics=None):
 
-    method_title = "Program Usage"
+    if metrics is None:
+        metrics = COHORT_METRICS
 
-    # Participation in Recovery Programs
-    out_progs = input_data[['Stage', 'input_type', 'last_30_attendance_12_step',
-                            'last_30_attendance_organized_religious_group',
-                            'last_30_attendance_other_support_group',
-                            'last_30_attendance_sober_support_outing',
-                            'last_30_attendance_activities_sponsored_by_recovery_residence',
-                            'last_30_attendance_activities_provided_while_incarcerated',
-                            'last_30_attendance_none', 'last_30_attendance_no_answer']]
+    by_metric = dict(tuple(counts.groupby('metric', sort=False)))
 
-    update_cols = out_progs.columns[2:]
-    for col in update_cols:
-        out_progs[col] = out_progs[col].fillna('NA').map(lambda x: 1 if x != 'NA' else 0)
+    return {spec['title']: _cohort_table(spec, by_metric[spec['title']])
+            for spec in metrics if spec['title'] in by_metric}
 
-    out_progs.columns = ['Stage', 'Input Type', 'Last 30: 12 Step',
-                         'Last 30: Attended Religious Group',
-                         'Last 30: Attended Other Support Group',
-                         'Last 30: Attended Sober Support Outing',
-                         'Last 30: Attended Recovery Residence Activity',
-                         'Last 30: Attended Activity while Incarcerated',
-                         'Last 30: Attended No Program',
-                         'Last 30: No Answer on Attendance']
 
-    out_progs = out_progs[out_progs['Stage'] != 'Follow Up']
+def _plot_cohort(spec, table, stage, title="", ax=None):
 
-    if includeStaff is False:
-        out_progs = out_progs[out_progs['Input Type'] == 'Client']
+    if spec['type'] == 'single':
+        labels = table.get('Education', table[table.columns[0]])
+        heights = table['count']
+        percents = table['percent']
+        ylabel = 'Count'
+    else:
+        labels = table[table.columns[0]]
+        heights = table['Total']
+        percents = table['Percent Surveyed'] * 100
+        ylabel = 'Total'
 
-    if noAnswers is False:
-        out_progs = out_progs[out_progs['Last 30: No Answer on Attendance'] == 0]        
-        out_progs = out_progs[['Stage', 'Input Type', 'Last 30: 12 Step',
-                               'Last 30: Attended Religious Group',
-                               'Last 30: Attended Other Support Group',
-                               'Last 30: Attended Sober Support Outing',
-                               'Last 30: Attended Recovery Residence Activity',
-                               'Last 30: Attended Activity while Incarcerated',
-                               'Last 30: Attended No Program']]
-        out_progs = out_progs[(out_progs['Last 30: 12 Step'] > 0)
-                              | (out_progs['Last 30: Attended Religious Group'] > 0)
-                              | (out_progs['Last 30: Attended Other Support Group'] > 0)
-                              | (out_progs['Last 30: Attended Sober Support Outing'] > 0)
-                              | (out_progs['Last 30: Attended Recovery Residence Activity'] > 0)
-                              | (out_progs['Last 30: Attended Activity while Incarcerated'] > 0)
-                              | (out_progs['Last 30: Attended No Program'] > 0)]
-
-    grouped = out_progs.groupby("Stage").sum()
-
-    in_count = out_progs[out_progs['Stage']=='Move In']['Stage'].count()
-    out_count = out_progs[out_progs['Stage']=='Move Out']['Stage'].count()
-
-    grouped = grouped.transpose()
-
-    grouped['Percent Move In'] = (grouped['Move In']/in_count)*100
-    grouped['Percent Move Out'] = (grouped['Move Out']/out_count)*100
-
-    # Reset the index of the dataframe
-    grouped = grouped.reset_index()
-
-    # Output Table
-    output_table = grouped.copy()
-    output_table['Move In Population'] = in_count
-    output_table['Move Out Population'] = out_count
-    output_table.columns = ['Program Usage', 'Move In', 'Move Out', 'Percent Move In', 'Percent move Out', 'Move In Population', 'Move Out Population']
-
-    prog_perc = grouped[['index', 'Percent Move In', 'Percent Move Out']]
-    prog_perc.columns = ['Program Usage', 'Move In', 'Move Out']
-
-    print(f"{method_title} {title}: Move In Sample Size = {in_count}")
-    print(f"{method_title} {title}: Move Out Sample Size = {out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_table}")
-    print("============================================\n\n")
+    # Set the plot style and color palette
+    sns.set_style('whitegrid')
+    sns.set_palette('muted')
 
-    if plot is True:
-        # Create a horizontal stacked bar chart
-        ax = prog_perc.plot(x = 'Program Usage', kind="bar", stacked=False)
+    if ax is None:
+        fig, ax = plt.subplots()
+    fig = ax.figure
 
-        # Set the chart title and labels
-        if title == "":
-            ax.set_title(f"Program Usage Comparison for 'Last 30' Columns: Move In vs Move Out")
-        else:
-            ax.set_title(f"{title} - Program Usage Comparison for 'Last 30' Columns: Move In vs Move Out")    
-        ax.set_xlabel("Percentage of Total (%)")
-        ax.set_ylabel("Last 30 Columns")
+    bars = ax.bar(range(len(table)), heights)
 
+    ax.set_xticks(range(len(table)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel(ylabel)
+    if title == "":
+        ax.set_title(f"{spec['plot_title']}: {stage}")
+    else:
+        ax.set_title(f"{title} - {spec['plot_title']}: {stage}")
 
-        # Add percentage labels above each bar
-        for container in ax.containers:
-            for bar in container:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width() / 2, height, f'{height:.0f}%',
-                        ha='center', va='bottom')
+    # display percent above each bar
+    ax.bar_label(bars, labels=[f'{percent:.2f}%' for percent in percents], padding=1)
 
-        # Show the chart
-        plt.show()
+    if len(table):
+        ax.set_ylim([0, heights.max()*1.1])
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    # Customize plot
+    fig.set_size_inches(8, 6)
+    ax.tick_params(axis='both',
+                   which='major',
+                   labelsize=10)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.yaxis.grid(True)
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    fig.tight_layout()
 
+    return ax
 
-def outcomeDocuments(input_data,
-                     title="",
-                     plot=False,
-                     includeStaff=True,
-                     noAnswers=False):
-    # Personal Documents
-    out_docs = input_data[['Stage', 'input_type', 'doc_status_drivers_license',
-                           'doc_status_state_id', 'doc_status_social_security_card',
-                           'doc_status_birth_certificate']]
-    # out_docs.columns = [['Stage', 'Input Type', 'Drivers License', 'State ID', 'Social Security Card', 'Birth Certificate']]
 
-    out_docs = out_docs[out_docs['Stage'] != 'Follow Up']
+def _cohort_directory(spec):
 
-    if includeStaff is False:
-        out_docs = out_docs[out_docs['input_type'] == 'Client']
+    return f'./ORH_Output_{date.today()}/Cohort_Comparisons/{spec["title"]}'
 
-    # Drivers License
-    method_title_dl = "Drivers License"
-    out_docs_dl = out_docs.copy()
 
-    if noAnswers is False:
-        out_docs_dl = out_docs_dl[out_docs_dl['doc_status_drivers_license'] != 'Prefer not to answer']
-        out_docs_dl = out_docs_dl[out_docs_dl['doc_status_drivers_license'] != 'Unknown']
+def _report_cohort(spec, table, stage, title="", plot=False):
 
-    out_docs_dl = out_docs_dl.groupby(['doc_status_drivers_license', 'Stage']).size().unstack()
+    method_title = spec['title']
 
-    perc = out_docs_dl.div(out_docs_dl.sum(axis=0), axis=1)
+    output_table = table.copy()
+    if spec['type'] == 'single':
+        sample_size = table['count'].sum()
+        output_table[f'Total Sample Size {title}'] = sample_size
+    else:
+        sample_size = table['Surveys'].iloc[0] if len(table) else 0
 
-    output_dl = pd.concat([out_docs_dl, perc], axis=1)
-    output_dl.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    result = report_result(method_title, title, {stage: sample_size}, table)
 
-    dl_in_count = output_dl['Move In Surveys'].sum()
-    dl_out_count = output_dl['Move Out Surveys'].sum()
+    if plot is True and len(table) > 0:
+        ax = _plot_cohort(spec, table, stage, title)
+        plt.show()
+        plt.close(ax.figure)
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'Document Status: Drivers License')
-        else:
-            ax.set_title(f'{title} - Document Status: Drivers License')    
+    # Save the output table
+    output_directory = _cohort_directory(spec)
+    save_output(output_table, output_directory, f'{method_title}_{title}_{date.today()}.csv')
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    return result
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
 
-    # State ID
-    method_title_id = "State ID"
-    out_docs_id = out_docs.copy()
+@profiled
+def cohortBatch(input_data,
+                cohorts,
+                stage='Move In',
+                plot=False,
+                includeStaff=True,
+                noAnswers=False):
 
-    if noAnswers is False:
-        out_docs_id = out_docs_id[out_docs_id['doc_status_state_id'] != 'Prefer not to answer']
-        out_docs_id = out_docs_id[out_docs_id['doc_status_state_id'] != 'Unknown']
+    # cohorts: {title: mask}, where a mask is a boolean Series, a callable taking the
+    # frame, or a DataFrame.eval expression. All cohorts are counted together, with the
+    # cohort as an extra group key, so no per-cohort copy of the frame is made.
+    outcome_specs = outcome_metrics(summary=True)
 
-    out_docs_id = out_docs_id.groupby(['doc_status_state_id', 'Stage']).size().unstack()
+    outcomes = cohort_counts(input_data,
+                             cohorts,
+                             includeStaff=includeStaff,
+                             noAnswers=noAnswers,
+                             metrics=outcome_specs)
+    demographics = demographic_counts(input_data,
+                                      cohorts,
+                                      stage=stage)
 
-    perc = out_docs_id.div(out_docs_id.sum(axis=0), axis=1)
+    results = _batch_tables(list(cohorts), outcomes, demographics, outcome_specs)
 
-    output_id = pd.concat([out_docs_id, perc], axis=1)
-    output_id.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    _report_batch(results, outcome_specs, stage, plot)
 
-    id_in_count = output_id['Move In Surveys'].sum()
-    id_out_count = output_id['Move Out Surveys'].sum()
+    return results
 
-    if plot is True:
-        ax = perc.plot(kind = 'bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'Document Status: State ID')
-        else:
-            ax.set_title(f'{title} - Document Status: State ID')    
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+def _batch_tables(names, outcomes, demographics, outcome_specs):
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    results = {name: {} for name in names}
 
+    for name, counts in outcomes.groupby('cohort', sort=False, observed=True):
+        results[name].update(outcome_tables(counts, outcome_specs))
+    for name, counts in demographics.groupby('cohort', sort=False, observed=True):
+        results[name].update(demographic_tables(counts))
 
-    # Social Security Card
-    method_title_ss = "Social Security Card"
-    out_docs_ss = out_docs.copy()
+    return results
 
-    if noAnswers is False:
-        out_docs_ss = out_docs_ss[out_docs_ss['doc_status_social_security_card'] != 'Prefer not to answer']
-        out_docs_ss = out_docs_ss[out_docs_ss['doc_status_social_security_card'] != 'Unknown']
 
-    out_docs_ss = out_docs_ss.groupby(['doc_status_social_security_card', 'Stage']).size().unstack()
+def _report_batch(results, outcome_specs, stage, plot=False):
 
-    perc = out_docs_ss.div(out_docs_ss.sum(axis=0), axis=1)
+    for spec in outcome_specs:
+        for name in results:
+            _report_outcome(spec, results[name][spec['title']], name, plot)
 
-    output_ss = pd.concat([out_docs_ss, perc], axis=1)
-    output_ss.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    for spec in COHORT_METRICS:
+        for name in results:
+            _report_cohort(spec, results[name][spec['title']], stage, name, plot)
 
-    ss_in_count = output_ss['Move In Surveys'].sum()
-    ss_out_count = output_ss['Move Out Surveys'].sum()
 
-    if plot is True:
-        ax = perc.plot(kind = 'bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'Document Status: Social Security Card')
-        else:
-            ax.set_title(f'{title} - Document Status: Social Security Card')    
+# ----------------------------------------------------------------------------------------- #
+#                                  COHORT DEFINITIONS                                       #
+# ----------------------------------------------------------------------------------------- #
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+# Short names for the checkbox families cohort expressions use most. Any family in
+# CHECKBOX_FAMILIES can also be used by its full name.
+COHORT_FAMILIES = {'race': 'race_id',
+                   'gender': 'gender_identify',
+                   'sexuality': 'sexual_identity',
+                   'ethnicity': 'ethnicity_id',
+                   'cjs': 'curr_status_cjs'}
+
+# Cohorts the workspaces compare, written as cohort expressions. Bump 'version' whenever
+# an expression changes meaning, so tables made under the old one can be told apart.
+COHORT_DEFINITIONS = {
+    'In Criminal Justice System': {
+        'version': 1,
+        'expression': 'cjs in {parole_probation, drug_court} and not cjs.no_involvement and not cjs.no_answer'},
+    'Not In Criminal Justice System': {
+        'version': 1,
+        'expression': 'cjs.no_involvement'},
+    'Parent': {'version': 1, 'expression': "parent == 'Yes'"},
+    'Not Parent': {'version': 1, 'expression': "parent == 'No'"},
+    'Female Identifying': {'version': 1, 'expression': 'gender.woman and not gender.man'},
+    'Male Identifying': {'version': 1, 'expression': 'gender.man and not gender.woman'},
+    'Heterosexual': {'version': 1, 'expression': 'sexuality.heterosexual'},
+    'LGBTQ+': {
+        'version': 1,
+        'expression': 'sexuality in {asexual, bisexual, gay, lesbian, pansexual, queer, same_gender_loving, other}'
+                      ' and not sexuality.heterosexual and not sexuality.no_answer'},
+    'White': {'version': 1, 'expression': 'race only {white}'},
+    # Version 1 in Question_Workspace tested isna() on the other races, so it also took
+    # in every survey with race left blank
+    'BIPOC': {'version': 2, 'expression': 'race.answered and not race.white and not race.no_answer'},
+}
+
+_COHORT_TOKEN = re.compile(r"\s*(?:(==|!=|[(){},.])|'([^']*)'|\"([^\"]*)\"|([\w+/-]+))")
+
+
+def _option_bits(family):
+
+    # Option name -> bit in '<family>_bits', the column name without the family prefix
+    bits = {}
+    for col in CHECKBOX_FAMILIES[family]:
+        name = col.strip()
+        name = name[len(family) + 1:] if name.startswith(f'{family}_') else name.rsplit('_id_', 1)[-1]
+        bits[name] = 1 << CHECKBOX_OPTIONS[col][1]
+
+    return bits
+
+
+def _option_mask(family, name):
+
+    # Exact option names win, otherwise an unambiguous start of one will do ('black')
+    bits = _option_bits(family)
+    if name == 'answered':
+        return sum(bit for option, bit in bits.items() if option != 'no_answer')
+    if name in bits:
+        return bits[name]
+
+    matches = [option for option in bits if option.startswith(name)]
+    if len(matches) == 1:
+        return bits[matches[0]]
+
+    raise ValueError(f"'{name}' is {'ambiguous' if matches else 'not an option'} for {family}, "
+                     f"options are: {', '.join(bits)}")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_cohort(expression):
+
+    # Compile a cohort expression into a tree of tuples that _cohort_mask evaluates with
+    # a few bitwise operations on the '<family>_bits' columns. For example
+    #     race in {black, native_hawaiian} and not race.white
+    #     gender.woman or (sexuality only {lesbian, queer})
+    #     parent == 'Yes' and Stage in {'Move In', 'Move Out'}
+    # family.option        the option was ticked, family.answered for any real answer
+    # family in {...}      any of the options was ticked
+    # family only {...}    something was ticked, and nothing outside the options
+    # column == value      also !=, and column in {...} for a set of values
+    # column.answered      any answer other than a no-answer
+    # and, or, not and parentheses combine them
+    tokens = []
+    position = 0
+    while expression[position:].strip():
+        match = _COHORT_TOKEN.match(expression, position)
+        if match is None:
+            raise ValueError(f'Cannot read cohort expression {expression!r} at {expression[position:]!r}')
+        symbol, single, double, word = match.groups()
+        tokens.append(symbol or word or (single if single is not None else double))
+        position = match.end()
+
+    def peek():
+        return tokens[0] if tokens else None
+
+    def take(expected=None):
+        if not tokens or (expected is not None and tokens[0] != expected):
+            found = repr(tokens[0]) if tokens else 'the end'
+            raise ValueError(f'Cohort expression {expression!r}: expected {expected or "more"}, found {found}')
+        return tokens.pop(0)
+
+    def values():
+        take('{')
+        found = [take()]
+        while peek() == ',':
+            take(',')
+            found.append(take())
+        take('}')
+        return found
+
+    def atom():
+        if peek() == '(':
+            take('(')
+            node = either()
+            take(')')
+            return node
+
+        name = take()
+        family = COHORT_FAMILIES.get(name, name)
+
+        if family in CHECKBOX_FAMILIES:
+            if peek() == '.':
+                take('.')
+                return ('any', family, _option_mask(family, take()))
+            if peek() in ('in', 'only'):
+                kind = 'any' if take() == 'in' else 'only'
+                mask = 0
+                for option in values():
+                    mask |= _option_mask(family, option)
+                return (kind, family, mask)
+            raise ValueError(f'Cohort expression {expression!r}: {name} needs .option, in {{...}} or only {{...}}')
+
+        if peek() in ('==', '!='):
+            negate = take() == '!='
+            node = ('in', name, (take(),))
+            return ('not', node) if negate else node
+        if peek() == 'in':
+            take('in')
+            return ('in', name, tuple(values()))
+        if peek() == '.':
+            take('.')
+            take('answered')
+            return ('answered', name)
+        raise ValueError(f'Cohort expression {expression!r}: {name} needs ==, !=, in {{...}} or .answered')
+
+    def negation():
+        if peek() == 'not':
+            take('not')
+            return ('not', negation())
+        return atom()
+
+    def both():
+        node = negation()
+        while peek() == 'and':
+            take('and')
+            node = ('and', node, negation())
+        return node
+
+    def either():
+        node = both()
+        while peek() == 'or':
+            take('or')
+            node = ('or', node, both())
+        return node
+
+    tree = either()
+    if tokens:
+        raise ValueError(f'Cohort expression {expression!r}: unexpected {tokens[0]!r}')
+
+    return tree
+
+
+def _family_bits(input_data, family):
+
+    if f'{family}_bits' in input_data.columns:
+        return input_data[f'{family}_bits'].to_numpy().astype(np.uint64)
+
+    ticked = checkbox_array(input_data, CHECKBOX_FAMILIES[family]).astype(np.uint64)
+    return np.bitwise_or.reduce(ticked << np.arange(ticked.shape[1], dtype=np.uint64), axis=1)
+
+
+def _evaluate_cohort(input_data, tree, bits=None):
+
+    # Boolean mask for a compiled cohort; bits holds each family's bits once read
+    if bits is None:
+        bits = {}
+
+    kind = tree[0]
+    if kind in ('any', 'only'):
+        family, mask = tree[1], np.uint64(tree[2])
+        if family not in bits:
+            bits[family] = _family_bits(input_data, family)
+        ticked = bits[family]
+        if kind == 'any':
+            return (ticked & mask) != 0
+        return (ticked != 0) & ((ticked & mask) == ticked)
+
+    if kind == 'in':
+        return input_data[tree[1]].isin(tree[2]).to_numpy()
+    if kind == 'answered':
+        column = input_data[tree[1]]
+        return (column.notna() & ~column.isin(NO_ANSWER_VALUES)).to_numpy()
+    if kind == 'not':
+        return ~_evaluate_cohort(input_data, tree[1], bits)
+    if kind == 'and':
+        return _evaluate_cohort(input_data, tree[1], bits) & _evaluate_cohort(input_data, tree[2], bits)
 
+    return _evaluate_cohort(input_data, tree[1], bits) | _evaluate_cohort(input_data, tree[2], bits)
 
-    # Birth Certificate
-    method_title_bc = "Birth Certificate"
-    out_docs_bc = out_docs.copy()
 
-    if noAnswers is False:
-        out_docs_bc = out_docs_bc[out_docs_bc['doc_status_birth_certificate'] != 'Prefer not to answer']
-        out_docs_bc = out_docs_bc[out_docs_bc['doc_status_birth_certificate'] != 'Unknown']
+def _compiled_cohort(cohort):
 
-    out_docs_bc = out_docs_bc.groupby(['doc_status_birth_certificate', 'Stage']).size().unstack()
+    # A name from COHORT_DEFINITIONS, an expression or an already compiled cohort
+    if cohort in COHORT_DEFINITIONS:
+        cohort = COHORT_DEFINITIONS[cohort]['expression']
+    if isinstance(cohort, str):
+        cohort = compile_cohort(cohort)
 
-    perc = out_docs_bc.div(out_docs_bc.sum(axis=0), axis=1)
+    return cohort
 
-    output_bc = pd.concat([out_docs_bc, perc], axis=1)
-    output_bc.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
 
-    bc_in_count = output_bc['Move In Surveys'].sum()
-    bc_out_count = output_bc['Move Out Surveys'].sum()
+def cohort_definitions(names=None):
 
-    if plot is True:
-        ax = perc.plot(kind = 'bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'Document Status: Birth Certificate')
-        else:
-            ax.set_title(f'{title} - Document Status: Birth Certificate')    
+    # {name: compiled cohort} from COHORT_DEFINITIONS, ready for cohortBatch and friends
+    if names is None:
+        names = list(COHORT_DEFINITIONS)
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    return {name: compile_cohort(COHORT_DEFINITIONS[name]['expression']) for name in names}
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
 
-    print(f"{method_title_dl} {title}: Move In Sample Size = {dl_in_count}")
-    print(f"{method_title_dl} {title}: Move Out Sample Size = {dl_out_count}")
-    print(f"\n{method_title_dl} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_dl}")
-    print("============================================\n\n\n\n")
+def select_cohort(input_data, cohort):
 
-    print(f"{method_title_id} {title}: Move In Sample Size = {id_in_count}")
-    print(f"{method_title_id} {title}: Move Out Sample Size = {id_out_count}")
-    print(f"\n{method_title_id} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_id}")
-    print("============================================\n\n\n\n")
+    # Rows of a named cohort from COHORT_DEFINITIONS, or of a cohort expression, as a
+    # frame for outcomeComparison / cohortComparison
+    return input_data[_evaluate_cohort(input_data, _compiled_cohort(cohort))]
 
-    print(f"{method_title_ss} {title}: Move In Sample Size = {ss_in_count}")
-    print(f"{method_title_ss} {title}: Move Out Sample Size = {ss_out_count}")
-    print(f"\n{method_title_ss} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_ss}")
-    print("============================================\n\n\n\n")
 
-    print(f"{method_title_bc} {title}: Move In Sample Size = {bc_in_count}")
-    print(f"{method_title_bc} {title}: Move Out Sample Size = {bc_out_count}")
-    print(f"\n{method_title_bc} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_bc}")
-    print("============================================\n\n\n\n")
+# ----------------------------------------------------------------------------------------- #
+#                                     ANSWER INDEX                                          #
+# ----------------------------------------------------------------------------------------- #
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_dl}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output_dl.to_csv(f'{output_directory}/{method_title_dl}_{title}_{date.today()}.csv')
+# A value's rows are kept as positions when fewer than 1 row in INDEX_SPARSE has it, where
+# 4 bytes a row beat one bit for every row, and as a packed bitmap otherwise
+INDEX_SPARSE = 32
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_id}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output_id.to_csv(f'{output_directory}/{method_title_id}_{title}_{date.today()}.csv')
+def _compact_rows(rows, n_rows):
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_ss}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    if len(rows) * INDEX_SPARSE < n_rows:
+        return rows.astype(np.uint32)
 
-    # Save the output table to the new directory
-    output_ss.to_csv(f'{output_directory}/{method_title_ss}_{title}_{date.today()}.csv')
+    ticked = np.zeros(n_rows, dtype=bool)
+    ticked[rows] = True
+    return np.packbits(ticked)
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_bc}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output_bc.to_csv(f'{output_directory}/{method_title_bc}_{title}_{date.today()}.csv')
+def answer_index(input_data, columns=None):
 
+    # Inverted index, answer value -> rows, for every categorical column by default.
+    # {'rows': n, 'columns': {column: {value: bitmap}}, 'options': {option: bitmap}}, with
+    # None as the value for rows left blank and 'options' holding the ticked rows of every
+    # checkbox option. Build it once after format_orh and resolve cohorts against it with
+    # index_mask / index_rows / index_count; nothing compares strings row by row again.
+    if columns is None:
+        columns = [col for col in input_data.columns
+                   if isinstance(input_data[col].dtype, pd.CategoricalDtype)]
 
-def outcomeEducation(input_data,
-                     title="",
-                     plot=False,
-                     includeStaff=True,
-                     noAnswers=True):
+    n_rows = len(input_data)
+    index = {'rows': n_rows, 'columns': {}, 'options': {}}
 
-    method_title = 'Education Outcome'
+    for family, options in CHECKBOX_FAMILIES.items():
+        if (f'{family}_bits' not in input_data.columns
+                and not set(options).issubset(input_data.columns)):
+            continue
 
-    # Education Progress
-    out_educ = input_data[['Stage', 'input_type',
-                           'last_30_education_progress_ged',
-                           'last_30_education_progress_vocational_school',
-                           'last_30_education_progress_skilled_training',
-                           'last_30_education_progress_college',
-                           'last_30_education_progress_not_involved']]
+        ticked = checkbox_array(input_data, options)
+        for i, col in enumerate(options):
+            index['options'][col] = _compact_rows(np.flatnonzero(ticked[:, i]), n_rows)
 
-    update_cols = out_educ.columns[2:]
+    for col in columns:
+        codes, uniques = _answer_codes(input_data, col, noAnswers=True)
 
-    for col in update_cols:
-            out_educ[col] = out_educ[col].fillna('NA').map(lambda x: 1 if x != 'NA' else 0)
+        # One stable sort groups every value's rows, already in row order
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes + 1, minlength=len(uniques) + 1)
+        groups = np.split(order, np.cumsum(counts)[:-1])
 
-    out_educ = out_educ[out_educ['Stage'] != 'Follow Up']
+        index['columns'][col] = {value: _compact_rows(rows, n_rows)
+                                 for value, rows in zip([None] + list(uniques), groups)
+                                 if len(rows) > 0}
 
-    if includeStaff is False:
-        out_educ = out_educ[out_educ['input_type'] == 'Client']
+    return index
 
-    if noAnswers is False:
-        out_educ = out_educ[(out_educ['last_30_education_progress_ged'] > 0)
-                            | (out_educ['last_30_education_progress_vocational_school'] > 0)
-                            | (out_educ['last_30_education_progress_skilled_training'] > 0)
-                            | (out_educ['last_30_education_progress_college'] > 0)
-                            | (out_educ['last_30_education_progress_not_involved'] > 0)]
-
-    grouped = out_educ.groupby("Stage").sum()
-    grouped.columns = ['Last 30: GED',
-                       'Last 30: Vocational School',
-                       'Last 30: Skilled Training',
-                       'Last 30: College',
-                       'Last 30: No Involvement']
-
-    in_count = out_educ[out_educ['Stage'] == 'Move In']['Stage'].count()
-    out_count = out_educ[out_educ['Stage'] == 'Move Out']['Stage'].count()
-
-    grouped = grouped.transpose()
-
-    grouped['Percent Move In'] = (grouped['Move In']/in_count)*100
-    grouped['Percent Move Out'] = (grouped['Move Out']/out_count)*100
-
-    # Reset the index of the dataframe
-    grouped = grouped.reset_index()
-
-    # Output Table
-    output_table = grouped.copy()
-    output_table['Move In Population'] = in_count
-    output_table['Move Out Population'] = out_count
-    output_table.columns = ['Education Progress', 'Move In', 'Move Out', 'Percent Move In', 'Percent move Out', 'Move In Population', 'Move Out Population']
-
-    educ_perc = grouped[['index', 'Percent Move In', 'Percent Move Out']]
-    educ_perc.columns = ['Education Progress', 'Move In', 'Move Out']
-
-    print(f"{method_title} {title}: Move In Sample Size = {in_count}")
-    print(f"{method_title} {title}: Move Out Sample Size = {out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_table}")
-    print("============================================\n\n")
 
-    if plot is True:
-        # Create a horizontal stacked bar chart
-        ax = educ_perc.plot(x='Education Progress', 
-                            kind="bar", stacked=False)
+def _index_bits(index, bitmaps):
 
-        # Set the chart title and labels
-        if title == "":
-            ax.set_title(f"Education Comparison for 'Last 30' Columns: Move In vs Move Out")
+    # Packed union of bitmaps
+    n_rows = index['rows']
+    ticked = np.zeros(n_rows, dtype=bool)
+    output = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+
+    for bitmap in bitmaps:
+        if bitmap.dtype == np.uint8:
+            output |= bitmap
         else:
-            ax.set_title(f"{title} - Education Comparison for 'Last 30' Columns: Move In vs Move Out")    
-        ax.set_ylabel("Percentage of Total (%)")
-        ax.set_xlabel("Last 30 Columns")
+            ticked[bitmap] = True
 
-        # Add percentage labels above each bar
-        for container in ax.containers:
-            for bar in container:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width() / 2, height, f'{height:.0f}%',
-                        ha='center', va='bottom')
+    return output | np.packbits(ticked)
 
-        # Show the chart
-        plt.show()
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+def _index_column(index, column):
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    if column not in index['columns']:
+        raise KeyError(f'{column} is not in the answer index')
 
+    return index['columns'][column]
 
-def outcomeEmployment(input_data,
-                      title="",
-                      plot=False,
-                      includeStaff=True,
-                      noAnswers=True):
 
-    out_emp_vol = input_data[['Stage', 'input_type',
-                          'last_30_employment_status',
-                          'last_30_volunteering_status']]
+def _index_family(index, family, mask):
 
-    out_emp_vol = out_emp_vol[out_emp_vol['Stage'] != 'Follow Up']
+    # Rows with any of the family's options in mask ticked
+    options = [col for bit, col in enumerate(CHECKBOX_FAMILIES[family]) if mask & (1 << bit)]
+    if not set(options).issubset(index['options']):
+        raise KeyError(f'{family} options are not in the answer index')
 
-    if includeStaff is False:
-        out_emp_vol = out_emp_vol[out_emp_vol['input_type'] == 'Client']
+    return _index_bits(index, [index['options'][col] for col in options])
 
-    # Employment Status
 
-    method_title_emp = "Employment"
+def _evaluate_index(index, tree):
 
-    out_emp = out_emp_vol.copy()
+    # Packed bitmap for a compiled cohort, the bitmap algebra twin of _evaluate_cohort
+    kind = tree[0]
 
-    if noAnswers is False:
-        out_emp = out_emp[out_emp['last_30_employment_status'] != 'Prefer not to answer']
-        out_emp = out_emp[~out_emp['last_30_employment_status'].isna()]
-        out_emp = out_emp[out_emp['last_30_employment_status'] != 'Unknown']
+    if kind == 'any':
+        return _index_family(index, tree[1], tree[2])
+    if kind == 'only':
+        family = tree[1]
+        everything = (1 << len(CHECKBOX_FAMILIES[family])) - 1
+        return _index_family(index, family, tree[2]) & ~_index_family(index, family, everything & ~tree[2])
+    if kind == 'in':
+        values = _index_column(index, tree[1])
+        return _index_bits(index, [values[value] for value in tree[2] if value in values])
+    if kind == 'answered':
+        values = _index_column(index, tree[1])
+        return _index_bits(index, [bitmap for value, bitmap in values.items()
+                                   if value is not None and value not in NO_ANSWER_VALUES])
+    if kind == 'not':
+        output = ~_evaluate_index(index, tree[1])
+        # Clear the padding bits after the last row
+        if index['rows'] % 8:
+            output[-1] &= np.uint8((0xFF << (8 - index['rows'] % 8)) & 0xFF)
+        return output
+    if kind == 'and':
+        return _evaluate_index(index, tree[1]) & _evaluate_index(index, tree[2])
 
-    out_emp = out_emp.groupby(['last_30_employment_status', 'Stage']).size().unstack()
+    return _evaluate_index(index, tree[1]) | _evaluate_index(index, tree[2])
 
-    perc = out_emp.div(out_emp.sum(axis=0), axis=1)
 
-    output_emp = pd.concat([out_emp, perc], axis=1)
-    output_emp.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
-    output_emp.fillna(0, inplace=True)
-    output_emp['Move In Surveys'] = output_emp['Move In Surveys'].astype(int)
-    output_emp['Move Out Surveys'] = output_emp['Move Out Surveys'].astype(int)
-    in_count_emp = output_emp['Move In Surveys'].sum()
-    out_count_emp = output_emp['Move Out Surveys'].sum()
+def index_mask(index, cohort):
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f"Employment Status")
-        else:
-            ax.set_title(f"{title} - Employment Status")
+    # Boolean mask for a cohort name, expression or compiled cohort; can be passed as a
+    # cohort itself
+    bits = _evaluate_index(index, _compiled_cohort(cohort))
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    return np.unpackbits(bits, count=index['rows']).astype(bool)
 
-    # Volunteer Status
 
-    method_title_vol = "Volunteering"
+def index_rows(index, cohort):
 
-    out_vol = out_emp_vol.copy()
+    return np.flatnonzero(index_mask(index, cohort))
 
-    if noAnswers is False:
-        out_vol = out_vol[out_vol['last_30_volunteering_status'] != 'Prefer not to answer']
-        out_vol = out_vol[out_vol['last_30_volunteering_status'] != 'Unknown']
-        out_vol = out_vol[~out_vol['last_30_volunteering_status'].isna()]
 
-    out_vol = out_vol.groupby(['last_30_volunteering_status', 'Stage']).size().unstack()
+# Set bits in every byte value
+_BYTE_COUNTS = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
 
-    perc = out_vol.div(out_vol.sum(axis=0), axis=1)
 
-    output_vol = pd.concat([out_vol, perc], axis=1)
-    output_vol.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
-    in_count_vol = output_vol['Move In Surveys'].sum()
-    out_count_vol = output_vol['Move Out Surveys'].sum()
+def index_count(index, cohort):
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f"Volunteering Status")
-        else:
-            ax.set_title(f"{title} - Volunteering Status")
+    return int(_BYTE_COUNTS[_evaluate_index(index, _compiled_cohort(cohort))].sum())
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
-
-    print(f"{method_title_emp} {title}: Move In Sample Size = {in_count_emp}")
-    print(f"{method_title_emp} {title}: Move Out Sample Size = {out_count_emp}")
-    print(f"\n{method_title_emp} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_emp}")
-    print("============================================\n\n\n\n")
 
-    print(f"{method_title_vol} {title}: Move In Sample Size = {in_count_vol}")
-    print(f"{method_title_vol} {title}: Move Out Sample Size = {out_count_vol}")
-    print(f"\n{method_title_vol} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_vol}")
-    print("============================================\n\n\n\n")
+# ----------------------------------------------------------------------------------------- #
+#                                    CHUNKED INGEST                                         #
+# ----------------------------------------------------------------------------------------- #
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_emp}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output_emp.to_csv(f'{output_directory}/{method_title_emp}_{title}_{date.today()}.csv')
+def read_orh_chunks(source_path='./orh_2022.csv',
+                    chunksize=100000,
+                    path='./orh_cols.csv',
+                    types_path='./orh_col_types.csv'):
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_vol}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    # Read an export in blocks of chunksize rows, each formatted on its own
+    for chunk in pd.read_csv(source_path, chunksize=chunksize):
+        yield format_orh(chunk, path, types_path)
 
-    # Save the output table to the new directory
-    output_vol.to_csv(f'{output_directory}/{method_title_vol}_{title}_{date.today()}.csv')
 
+def _add_counts(total, counts):
 
-def outcomeHealth(input_data,
-                  title="",
-                  plot=False,
+    # Count tables are additive, so a running total is a grouped sum over the keys
+    if total is None:
+        return counts
+
+    keys = [col for col in counts.columns if col != 'count']
+    total = pd.concat([total, counts], ignore_index=True)
+
+    return total.groupby(keys, sort=False, observed=True)['count'].sum().reset_index()
+
+
+def stream_counts(source_path='./orh_2022.csv',
+                  cohorts=None,
+                  stage='Move In',
+                  chunksize=100000,
                   includeStaff=True,
-                  noAnswers=True):
+                  noAnswers=False,
+                  metrics=None,
+                  path='./orh_cols.csv',
+                  types_path='./orh_col_types.csv'):
 
-    # Health Status
-    out_health = input_data[['Stage','input_type','last_30_physical_health','last_30_mental_health']]
+    # Outcome and demographic count tables for a whole export, built one chunk at a
+    # time so only a single chunk and the running totals are ever in memory. Cohort
+    # masks are evaluated per chunk, so use callables or expressions, not Series.
+    if cohorts is None:
+        cohorts = {'All': lambda df: np.ones(len(df), dtype=bool)}
+    if metrics is None:
+        metrics = outcome_metrics(summary=True)
 
-    out_health = out_health[out_health['Stage'] != 'Follow Up']
+    outcomes = None
+    demographics = None
 
-    if includeStaff is False:
-        out_health = out_health[out_health['input_type'] == 'Client']
+    for chunk in read_orh_chunks(source_path, chunksize, path, types_path):
+        outcomes = _add_counts(outcomes, cohort_counts(chunk,
+                                                       cohorts,
+                                                       includeStaff=includeStaff,
+                                                       noAnswers=noAnswers,
+                                                       metrics=metrics))
+        demographics = _add_counts(demographics, demographic_counts(chunk,
+                                                                    cohorts,
+                                                                    stage=stage))
 
-    # Physical Health
-    method_title_phys = "Physical Health"
+    return outcomes, demographics
 
-    out_health_phy = out_health.copy()
 
-    if noAnswers is False:
-        out_health_phy = out_health_phy[out_health_phy['last_30_physical_health'] != 'Prefer not to answer']
-        out_health_phy = out_health_phy[out_health_phy['last_30_physical_health'] != 'Unknown']
-        out_health_phy = out_health_phy[~out_health_phy['last_30_physical_health'].isna()]
+@profiled
+def cohortStream(source_path='./orh_2022.csv',
+                 cohorts=None,
+                 stage='Move In',
+                 chunksize=100000,
+                 plot=False,
+                 includeStaff=True,
+                 noAnswers=False,
+                 path='./orh_cols.csv',
+                 types_path='./orh_col_types.csv'):
 
-    out_health_phy = out_health_phy.groupby(['last_30_physical_health', 'Stage']).size().unstack()
+    # cohortBatch over an export too large to load at once. Without cohorts the
+    # whole export is reported as 'All'.
+    outcome_specs = outcome_metrics(summary=True)
 
-    perc = out_health_phy.div(out_health_phy.sum(axis = 0), axis = 1)
+    outcomes, demographics = stream_counts(source_path,
+                                           cohorts,
+                                           stage=stage,
+                                           chunksize=chunksize,
+                                           includeStaff=includeStaff,
+                                           noAnswers=noAnswers,
+                                           metrics=outcome_specs,
+                                           path=path,
+                                           types_path=types_path)
 
-    output_phys = pd.concat([out_health_phy, perc], axis=1)
-    output_phys.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
-    in_count_phys = output_phys['Move In Surveys'].sum()
-    out_count_phys = output_phys['Move Out Surveys'].sum()
+    names = list(outcomes['cohort'].cat.categories)
+    results = _batch_tables(names, outcomes, demographics, outcome_specs)
+
+    _report_batch(results, outcome_specs, stage, plot)
+
+    return results
+
+
+def _row_keys(input_data):
+
+    # One hash per survey over every column; the formatted frame has no survey id left
+    return pd.util.hash_pandas_object(input_data, index=False).to_numpy().tolist()
+
+
+def _unseen_rows(input_data, submitted, state):
+
+    # Surveys submitted after the watermark, plus surveys on the watermark day that were
+    # not counted yet, since a later export can add surveys from the day of the last
+    # refresh. state['seen'] holds how often each row key was counted on that day.
+    new = (submitted > state['watermark']).to_numpy()
+
+    same_day = np.flatnonzero((submitted == state['watermark']).to_numpy())
+    if len(same_day):
+        keys = pd.Series(_row_keys(input_data.iloc[same_day]))
+        repeat = keys.groupby(keys).cumcount().to_numpy()
+        counted = keys.map(state['seen']).fillna(0).to_numpy()
+        new[same_day[repeat >= counted]] = True
+
+    return new
 
-    if plot is True:
-        ax = perc.plot(kind = 'bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f"Physical Health")
-        else:
-            ax.set_title(f"{title} - Physical Health")    
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+def _advance_watermark(state, input_data, submitted, new):
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    # Move the watermark to the latest counted submission and note the row keys counted
+    # on that day, so the next refresh can tell late surveys from the same day apart
+    latest = submitted[new].max()
+    if pd.isna(latest):
+        return
 
-    # Mental Health
-    method_title_men = "Mental Health"
+    if state['watermark'] is None or latest > state['watermark']:
+        state['watermark'] = latest
+        state['seen'] = {}
 
-    out_health_men = out_health.copy()
+    for key in _row_keys(input_data[new & (submitted == latest).to_numpy()]):
+        state['seen'][key] = state['seen'].get(key, 0) + 1
 
-    if noAnswers is False:
-        out_health_men = out_health_men[out_health_men['last_30_mental_health'] != 'Prefer not to answer']
-        out_health_men = out_health_men[out_health_men['last_30_mental_health'] != 'Unknown']
-        out_health_men = out_health_men[~out_health_men['last_30_mental_health'].isna()]
 
-    out_health_men = out_health_men.groupby(['last_30_mental_health', 'Stage']).size().unstack()
+def refresh_counts(input_data,
+                   cohorts=None,
+                   state_path='./ORH_Cache/counts.pkl',
+                   stage='Move In',
+                   includeStaff=True,
+                   noAnswers=False):
 
-    perc = out_health_men.div(out_health_men.sum(axis = 0), axis = 1)
+    # Keep outcome and demographic count tables on disk and fold in only surveys submitted
+    # since the last refresh, so input_data can be the full history or just a new export.
+    # The tables are rebuilt from scratch when cohorts, metrics or settings change, or when
+    # no survey had a submission_date yet. Surveys without a submission_date are only
+    # counted in a full rebuild.
+    if cohorts is None:
+        cohorts = {'All': lambda df: np.ones(len(df), dtype=bool)}
+
+    settings = {'cohorts': list(cohorts),
+                'metrics': [spec['title'] for spec in outcome_metrics(summary=True)],
+                'stage': stage,
+                'includeStaff': includeStaff,
+                'noAnswers': noAnswers}
+
+    state = None
+    if os.path.exists(state_path):
+        state = pd.read_pickle(state_path)
+        if state['settings'] != settings:
+            state = None
+
+    # Without a watermark there is nothing to count from, so start over
+    submitted = pd.to_datetime(input_data['submission_date'], errors='coerce')
+    if state is None or state['watermark'] is None or 'seen' not in state:
+        state = {'settings': settings, 'watermark': None, 'seen': {}, 'outcomes': None, 'demographics': None}
+        new = np.ones(len(input_data), dtype=bool)
+    else:
+        new = _unseen_rows(input_data, submitted, state)
 
-    output_men = pd.concat([out_health_men, perc], axis=1)
-    output_men.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
-    in_count_men = output_men['Move In Surveys'].sum()
-    out_count_men = output_men['Move Out Surveys'].sum()
+    if new.any() or state['outcomes'] is None:
+        new_rows = input_data[new]
+        state['outcomes'] = _add_counts(state['outcomes'], cohort_counts(new_rows,
+                                                                         cohorts,
+                                                                         includeStaff=includeStaff,
+                                                                         noAnswers=noAnswers,
+                                                                         metrics=outcome_metrics(summary=True)))
+        state['demographics'] = _add_counts(state['demographics'], demographic_counts(new_rows,
+                                                                                      cohorts,
+                                                                                      stage=stage))
 
-    if plot is True:
-        ax = perc.plot(kind = 'bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f"Mental Health")
-        else:
-            ax.set_title(f"{title} - Mental Health")
+        _advance_watermark(state, input_data, submitted, new)
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        pd.to_pickle(state, state_path + '.tmp')
+        os.replace(state_path + '.tmp', state_path)
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    return state['outcomes'], state['demographics']
 
-    print(f"{method_title_phys} {title}: Move In Sample Size = {in_count_phys}")
-    print(f"{method_title_phys} {title}: Move Out Sample Size = {out_count_phys}")
-    print(f"\n{method_title_phys} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_phys}")
-    print("============================================\n\n\n\n")
 
-    print(f"{method_title_men} {title}: Move In Sample Size = {in_count_men}")
-    print(f"{method_title_men} {title}: Move Out Sample Size = {out_count_men}")
-    print(f"\n{method_title_men} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_men}")
-    print("============================================\n\n\n\n")
+@profiled
+def cohortRefresh(input_data,
+                  cohorts=None,
+                  state_path='./ORH_Cache/counts.pkl',
+                  stage='Move In',
+                  plot=False,
+                  includeStaff=True,
+                  noAnswers=False):
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_phys}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    # cohortBatch over the persisted counts after folding in new submissions
+    outcome_specs = outcome_metrics(summary=True)
 
-    # Save the output table to the new directory
-    output_phys.to_csv(f'{output_directory}/{method_title_phys}_{title}_{date.today()}.csv')
+    outcomes, demographics = refresh_counts(input_data,
+                                            cohorts,
+                                            state_path=state_path,
+                                            stage=stage,
+                                            includeStaff=includeStaff,
+                                            noAnswers=noAnswers)
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title_men}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    names = list(outcomes['cohort'].cat.categories)
+    results = _batch_tables(names, outcomes, demographics, outcome_specs)
 
-    # Save the output table to the new directory
-    output_men.to_csv(f'{output_directory}/{method_title_men}_{title}_{date.today()}.csv')
+    _report_batch(results, outcome_specs, stage, plot)
 
+    return results
 
-def outcomeConsequences(input_data,
-                        title="",
-                        plot=False,
-                        includeStaff=True,
-                        noAnswers=True):
 
-    method_title = "Substance Use Consequences"
+# ----------------------------------------------------------------------------------------- #
+#                                      COUNT CUBE                                           #
+# ----------------------------------------------------------------------------------------- #
 
-    # Substance Use Consequences
-    out_sub_consq = input_data[['Stage', 'input_type',
-                                'last_30_substance_use_consequences_social',
-                                'last_30_substance_use_consequences_health_behavioral',
-                                'last_30_substance_use_consequences_financial',
-                                'last_30_substance_use_consequences_none_of_above',
-                                'last_30_substance_use_consequences_no_answer',
-                                'last_30_substance_use_consequences_other']]
 
-    update_cols = out_sub_consq.columns[2:]
+# Cube dimension -> frame column; the export names the org column with a trailing space
+CUBE_DIMENSIONS = {'org': 'org ', 'org_house_name': 'org_house_name', 'input_type': 'input_type'}
 
-    for col in update_cols:
-        out_sub_consq[col] = out_sub_consq[col].fillna('NA').map(lambda x: 1 if x != 'NA' else 0)
+# Every completion stage, in STAGE_NAMES order
+CUBE_STAGES = list(dict.fromkeys(STAGE_NAMES.values()))
 
-    out_sub_consq = out_sub_consq[out_sub_consq['Stage'] != 'Follow Up']
 
-    if includeStaff is False:
-        out_sub_consq = out_sub_consq[out_sub_consq['input_type'] == 'Client']
+def cube_metrics(input_data):
 
-    if noAnswers is False:
-        out_sub_consq = out_sub_consq[(out_sub_consq['last_30_substance_use_consequences_social'] > 0)
-                                      | (out_sub_consq['last_30_substance_use_consequences_health_behavioral'] > 0)
-                                      | (out_sub_consq['last_30_substance_use_consequences_financial'] > 0)
-                                      | (out_sub_consq['last_30_substance_use_consequences_none_of_above'] > 0)
-                                      | (out_sub_consq['last_30_substance_use_consequences_no_answer'] > 0)
-                                      | (out_sub_consq['last_30_substance_use_consequences_other'] > 0)]
-        
-        out_sub_consq = out_sub_consq[['Stage', 'input_type',
-                                       'last_30_substance_use_consequences_social',
-                                       'last_30_substance_use_consequences_health_behavioral',
-                                       'last_30_substance_use_consequences_financial',
-                                       'last_30_substance_use_consequences_other']]
-
-    grouped = out_sub_consq.groupby("Stage").sum()
-
-    in_count = out_sub_consq[out_sub_consq['Stage']=='Move In']['Stage'].count()
-    out_count = out_sub_consq[out_sub_consq['Stage']=='Move Out']['Stage'].count()
-
-    grouped = grouped.transpose()
-
-    grouped['Percent Move In'] = (grouped['Move In']/in_count)*100
-    grouped['Percent Move Out'] = (grouped['Move Out']/out_count)*100
-
-    # Reset the index of the dataframe
-    grouped = grouped.reset_index()
-
-    # Output Table
-    output_table = grouped.copy()
-    output_table['Move In Population'] = in_count
-    output_table['Move Out Population'] = out_count
-    output_table.columns = ['Consequences', 'Move In', 'Move Out', 'Percent Move In', 'Percent move Out', 'Move In Population', 'Move Out Population']
-
-    cons_perc = grouped[['index', 'Percent Move In', 'Percent Move Out']]
-    cons_perc.columns = ['Consequences', 'Move In', 'Move Out']
-
-    print(f"{method_title} {title}: Move In Sample Size = {in_count}")
-    print(f"{method_title} {title}: Move Out Sample Size = {out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_table}")
-    print("============================================\n\n")
+    # The outcome and demographic registries, then every other single-choice column and
+    # checkbox family of the frame under its own column / family name
+    metrics = list(OUTCOME_METRICS) + list(COHORT_METRICS)
 
-    if plot is True:
-        
-        # Create a horizontal stacked bar chart
-        ax = cons_perc.plot(x = 'Consequences', kind="bar", stacked=False)
+    covered = {spec['column'] for spec in metrics if spec['type'] == 'single'}
+    covered |= set(CHECKBOX_OPTIONS) | set(CUBE_DIMENSIONS.values()) | {'Stage'}
 
-        # Set the chart title and labels
-        if title == "":
-            ax.set_title(f"Outcome Substance Consequences for 'Last 30' Columns: Move In vs Move Out")
-        else:
-            ax.set_title(f"{title} - Outcome Substance Consequences for 'Last 30' Columns: Move In vs Move Out")
-        ax.set_xlabel("Percentage of Total (%)")
-        ax.set_ylabel("Last 30 Columns")
+    for col in input_data.columns:
+        if isinstance(input_data[col].dtype, pd.CategoricalDtype) and col not in covered:
+            metrics.append({'title': col, 'type': 'single', 'column': col})
 
-        # Add percentage labels above each bar
-        for container in ax.containers:
-            for bar in container:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width() / 2, height, f'{height:.0f}%',
-                        ha='center', va='bottom')
-                
-        # Show the chart
-        plt.show()
+    for family, columns in CHECKBOX_FAMILIES.items():
+        if f'{family}_bits' in input_data.columns or set(columns).issubset(input_data.columns):
+            metrics.append({'title': family, 'type': 'multi', 'columns': columns})
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    return metrics
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
 
+def _compact_cells(cells):
 
-def outcomeRecoveryCapital(input_data,
-                     title="",
-                     plot=False,
-                     includeStaff=True,
-                     noAnswers=False):
-    
-    out_cap = input_data[['Stage', 'input_type', 
-                           'move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery',
-                           'move_out_statement_i_have_goals_and_hopes_for_my_future',
-                           'move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions',
-                           'move_out_statement_i_have_a_clear_sense_of_who_i_am',
-                           'move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community',
-                           'move_out_statement_i_have_a_sense_of_purpose_in_my_life',
-                           'move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong',
-                           'move_out_statement_i_have_a_sense_of_community_and_belonging']]
-
-    out_cap = out_cap[out_cap['Stage'] != 'Follow Up']
+    # Categorical keys and 32 bit counts; the cube is mostly a handful of repeated labels
+    cells = cells.reset_index(drop=True)
+    for col in cells.columns:
+        if col == 'count':
+            cells[col] = cells[col].astype(np.int32)
+        elif col != 'noAnswers':
+            cells[col] = cells[col].astype('category')
 
-    if includeStaff is False:
-        out_cap = out_cap[out_cap['input_type'] == 'Client']
+    return cells
 
-    # Support System
-    method_title_1 = "Support System"
-    out_cap_1 = out_cap.copy()
 
-    if noAnswers is False:
-        out_cap_1 = out_cap_1[out_cap_1['move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery'] != 'Prefer not to answer']
-        out_cap_1 = out_cap_1[out_cap_1['move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery'] != 'Unknown']
-        out_cap_1 = out_cap_1[~out_cap_1['move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery'].isna()]
+def build_cube(input_data, metrics=None):
 
-    out_cap_1 = out_cap_1.groupby(['move_out_statement_i_have_people_in_my_life_i_can_rely_on_in_support_of_my_recovery', 'Stage']).size().unstack()
+    # Count every metric by org, org_house_name, input_type and Stage, once without and
+    # once with no-answers, in the same passes the outcome engine makes. Only non-zero
+    # cells are kept; 'values' keeps each metric's answers in engine order so the zeros
+    # can be put back when a slice is read with cube_counts.
+    if metrics is None:
+        metrics = cube_metrics(input_data)
 
-    perc = out_cap_1.div(out_cap_1.sum(axis=0), axis=1)
+    keys = input_data[list(CUBE_DIMENSIONS.values())]
+    groups = keys.groupby(list(keys.columns), sort=False, dropna=False, observed=True).ngroup().to_numpy()
 
-    output_1 = pd.concat([out_cap_1, perc], axis=1)
-    output_1.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    dimensions = keys.iloc[np.unique(groups, return_index=True)[1]].reset_index(drop=True)
+    dimensions.columns = list(CUBE_DIMENSIONS)
 
-    outcap_1_in_count = output_1['Move In Surveys'].sum()
-    outcap_1_out_count = output_1['Move Out Surveys'].sum()
+    # Surveys without a known Stage have no cell to land in
+    rows = np.flatnonzero(_stage_codes(input_data, CUBE_STAGES) >= 0)
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_1}')
-        else:
-            ax.set_title(f'{title} - {method_title_1}')    
+    pieces = []
+    values = {}
+    for noAnswers in [False, True]:
+        counts = _count_outcomes(input_data,
+                                 rows,
+                                 groups[rows],
+                                 len(dimensions),
+                                 noAnswers=noAnswers,
+                                 metrics=metrics,
+                                 stages=CUBE_STAGES)
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+        answers = counts[counts['value'] != POPULATION].drop_duplicates(['metric', 'value'])
+        for title, listed in answers.groupby('metric', sort=False):
+            values[(title, noAnswers)] = list(listed['value'])
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+        counts = counts[counts['count'] > 0]
+        cells = dimensions.iloc[counts.pop('group')].reset_index(drop=True)
+        cells = pd.concat([cells, counts.reset_index(drop=True)], axis=1)
+        cells['noAnswers'] = noAnswers
+        pieces.append(cells)
 
-    # Goals and Hopes
-    method_title_2 = "Future Hopes and Goals"
-    out_cap_2 = out_cap.copy()
+    return {'metrics': [spec['title'] for spec in metrics],
+            'values': values,
+            'cells': _compact_cells(pd.concat(pieces, ignore_index=True))}
 
-    if noAnswers is False:
-        out_cap_2 = out_cap_2[out_cap_2['move_out_statement_i_have_goals_and_hopes_for_my_future'] != 'Prefer not to answer']
-        out_cap_2 = out_cap_2[out_cap_2['move_out_statement_i_have_goals_and_hopes_for_my_future'] != 'Unknown']
-        out_cap_2 = out_cap_2[~out_cap_2['move_out_statement_i_have_goals_and_hopes_for_my_future'].isna()]
 
-    out_cap_2 = out_cap_2.groupby(['move_out_statement_i_have_goals_and_hopes_for_my_future', 'Stage']).size().unstack()
+def _merge_cubes(cube, new):
 
-    perc = out_cap_2.div(out_cap_2.sum(axis=0), axis=1)
+    # Cells are additive; answers first seen in new go after the ones already known
+    keys = [col for col in cube['cells'].columns if col != 'count']
+    cells = pd.concat([cube['cells'].astype({col: object for col in keys if col != 'noAnswers'}),
+                       new['cells'].astype({col: object for col in keys if col != 'noAnswers'})],
+                      ignore_index=True)
+    cells = cells.groupby(keys, sort=False, dropna=False)['count'].sum().reset_index()
 
-    output_2 = pd.concat([out_cap_2, perc], axis=1)
-    output_2.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    values = dict(cube['values'])
+    for key, answers in new['values'].items():
+        known = values.get(key, [])
+        values[key] = known + [value for value in answers if value not in known]
 
-    outcap_2_in_count = output_2['Move In Surveys'].sum()
-    outcap_2_out_count = output_2['Move Out Surveys'].sum()
+    return {'metrics': cube['metrics'], 'values': values, 'cells': _compact_cells(cells)}
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_2}')
-        else:
-            ax.set_title(f'{title} - {method_title_2}')    
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+def refresh_cube(input_data, state_path='./ORH_Cache/cube.pkl.gz', metrics=None):
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    # Keep the cube on disk, gzipped, and fold in only surveys submitted since the last
+    # refresh, like refresh_counts. Rebuilt from scratch when the metrics or stages change,
+    # or when no survey had a submission_date yet.
+    if metrics is None:
+        metrics = cube_metrics(input_data)
 
-    # Problem Solving Skills
-    method_title_3 = "Problem Solving Skills"
-    out_cap_3 = out_cap.copy()
+    settings = {'metrics': [spec['title'] for spec in metrics], 'stages': CUBE_STAGES}
 
-    if noAnswers is False:
-        out_cap_3 = out_cap_3[out_cap_3['move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions'] != 'Prefer not to answer']
-        out_cap_3 = out_cap_3[out_cap_3['move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions'] != 'Unknown']
-        out_cap_3 = out_cap_3[~out_cap_3['move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions'].isna()]
+    state = None
+    if os.path.exists(state_path):
+        state = pd.read_pickle(state_path, compression='gzip')
+        if state['settings'] != settings:
+            state = None
 
-    out_cap_3 = out_cap_3.groupby(['move_out_statement_i_have_problem-solving_skills_and_resources_to_help_me_make_healthy_decisions', 'Stage']).size().unstack()
+    # Without a watermark there is nothing to count from, so start over
+    submitted = pd.to_datetime(input_data['submission_date'], errors='coerce')
+    if state is None or state['watermark'] is None or 'seen' not in state:
+        state = {'settings': settings, 'watermark': None, 'seen': {}, 'cube': None}
+        new = np.ones(len(input_data), dtype=bool)
+    else:
+        new = _unseen_rows(input_data, submitted, state)
 
-    perc = out_cap_3.div(out_cap_3.sum(axis=0), axis=1)
+    if new.any() or state['cube'] is None:
+        cube = build_cube(input_data[new], metrics)
+        state['cube'] = cube if state['cube'] is None else _merge_cubes(state['cube'], cube)
 
-    output_3 = pd.concat([out_cap_3, perc], axis=1)
-    output_3.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+        _advance_watermark(state, input_data, submitted, new)
 
-    outcap_3_in_count = output_3['Move In Surveys'].sum()
-    outcap_3_out_count = output_3['Move Out Surveys'].sum()
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        pd.to_pickle(state, state_path + '.tmp', compression='gzip')
+        os.replace(state_path + '.tmp', state_path)
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_3}')
-        else:
-            ax.set_title(f'{title} - {method_title_3}')    
+    return state['cube']
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+def cube_counts(cube, metrics=None, stages=None, includeStaff=True, noAnswers=False, **dimensions):
 
-    # Problem Solving Skills
-    method_title_4 = "Sense of Self"
-    out_cap_4 = out_cap.copy()
+    # Count table (metric, value, Stage, count) for a slice of the cube, the table
+    # outcome_counts gives for the same rows, so outcome_tables and demographic_tables
+    # read it as is. dimensions narrow org, org_house_name or input_type to one value or
+    # a list of values.
+    if metrics is None:
+        metrics = outcome_metrics()
+    if stages is None:
+        stages = OUTCOME_STAGES
+    if includeStaff is False:
+        dimensions['input_type'] = 'Client'
 
-    if noAnswers is False:
-        out_cap_4 = out_cap_4[out_cap_4['move_out_statement_i_have_a_clear_sense_of_who_i_am'] != 'Prefer not to answer']
-        out_cap_4 = out_cap_4[out_cap_4['move_out_statement_i_have_a_clear_sense_of_who_i_am'] != 'Unknown']
-        out_cap_4 = out_cap_4[~out_cap_4['move_out_statement_i_have_a_clear_sense_of_who_i_am'].isna()]
+    cells = cube['cells']
+    titles = [spec['title'] for spec in metrics]
 
-    out_cap_4 = out_cap_4.groupby(['move_out_statement_i_have_a_clear_sense_of_who_i_am', 'Stage']).size().unstack()
+    keep = (cells['noAnswers'] == noAnswers).to_numpy()
+    keep &= cells['metric'].isin(titles).to_numpy() & cells['Stage'].isin(stages).to_numpy()
+    for name, value in dimensions.items():
+        if name not in CUBE_DIMENSIONS:
+            raise KeyError(f'{name} is not a cube dimension, use one of {list(CUBE_DIMENSIONS)}')
+        value = value if isinstance(value, (list, tuple, set)) else [value]
+        keep &= cells[name].isin(value).to_numpy()
 
-    perc = out_cap_4.div(out_cap_4.sum(axis=0), axis=1)
+    totals = cells[keep].groupby(['metric', 'value', 'Stage'], observed=True)['count'].sum()
 
-    output_4 = pd.concat([out_cap_4, perc], axis=1)
-    output_4.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    # Every answer at every stage, zeros included, in the order the engine lists them
+    pieces = []
+    for title in titles:
+        answers = cube['values'].get((title, noAnswers), []) + [POPULATION]
+        index = pd.MultiIndex.from_product([[title], stages, answers], names=['metric', 'Stage', 'value'])
+        pieces.append(index.to_frame(index=False))
+    grid = pd.concat(pieces, ignore_index=True)[['metric', 'value', 'Stage']]
 
-    outcap_4_in_count = output_4['Move In Surveys'].sum()
-    outcap_4_out_count = output_4['Move Out Surveys'].sum()
+    grid['count'] = totals.reindex(pd.MultiIndex.from_frame(grid), fill_value=0).to_numpy().astype(np.int64)
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_4}')
-        else:
-            ax.set_title(f'{title} - {method_title_4}')    
+    return grid
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+@profiled
+def outcomeCube(cube,
+                report,
+                title="",
+                plot=False,
+                includeStaff=True,
+                noAnswers=False,
+                **dimensions):
 
-    # Family and Community Participation
-    method_title_5 = "Family and Community Participation"
-    out_cap_5 = out_cap.copy()
+    # outcomeReport answered from the cube, for all of it or a slice of houses / orgs
+    metrics = outcome_metrics(report=report)
 
-    if noAnswers is False:
-        out_cap_5 = out_cap_5[out_cap_5['move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community'] != 'Prefer not to answer']
-        out_cap_5 = out_cap_5[out_cap_5['move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community'] != 'Unknown']
-        out_cap_5 = out_cap_5[~out_cap_5['move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community'].isna()]
+    tables = outcome_tables(cube_counts(cube,
+                                        metrics,
+                                        includeStaff=includeStaff,
+                                        noAnswers=noAnswers,
+                                        **dimensions), metrics)
 
-    out_cap_5 = out_cap_5.groupby(['move_out_statement_i_have_meaningful_positive_participation_in_my_family_and_community', 'Stage']).size().unstack()
+    results = {}
+    for spec in metrics:
+        results[spec['title']] = _report_outcome(spec, tables[spec['title']], title, plot)
 
-    perc = out_cap_5.div(out_cap_5.sum(axis=0), axis=1)
+    return results
 
-    output_5 = pd.concat([out_cap_5, perc], axis=1)
-    output_5.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
 
-    outcap_5_in_count = output_5['Move In Surveys'].sum()
-    outcap_5_out_count = output_5['Move Out Surveys'].sum()
+@profiled
+def cohortCube(cube, stage='Move In', title="", plot=False, **dimensions):
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_5}')
-        else:
-            ax.set_title(f'{title} - {method_title_5}')    
+    # The demographic breakdowns of cohortSummary answered from the cube
+    tables = demographic_tables(cube_counts(cube, COHORT_METRICS, stages=[stage], **dimensions))
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    results = {}
+    for spec in COHORT_METRICS:
+        results[spec['title']] = _report_cohort(spec, tables[spec['title']], stage, title, plot)
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)    
+    return results
 
-    # Sense of Purpose
-    method_title_6 = "Sense of Purpose"
-    out_cap_6 = out_cap.copy()
 
-    if noAnswers is False:
-        out_cap_6 = out_cap_6[out_cap_6['move_out_statement_i_have_a_sense_of_purpose_in_my_life'] != 'Prefer not to answer']
-        out_cap_6 = out_cap_6[out_cap_6['move_out_statement_i_have_a_sense_of_purpose_in_my_life'] != 'Unknown']
-        out_cap_6 = out_cap_6[~out_cap_6['move_out_statement_i_have_a_sense_of_purpose_in_my_life'].isna()]
+# ----------------------------------------------------------------------------------------- #
+#                                   PARALLEL REPORTS                                        #
+# ----------------------------------------------------------------------------------------- #
 
-    out_cap_6 = out_cap_6.groupby(['move_out_statement_i_have_a_sense_of_purpose_in_my_life', 'Stage']).size().unstack()
 
-    perc = out_cap_6.div(out_cap_6.sum(axis=0), axis=1)
+# Formatted frame handed to each worker once, when the pool starts
+_WORKER_FRAME = None
 
-    output_6 = pd.concat([out_cap_6, perc], axis=1)
-    output_6.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
 
-    outcap_6_in_count = output_6['Move In Surveys'].sum()
-    outcap_6_out_count = output_6['Move Out Surveys'].sum()
+def _init_worker(input_data):
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_6}')
-        else:
-            ax.set_title(f'{title} - {method_title_6}')    
+    global _WORKER_FRAME
+    _WORKER_FRAME = input_data
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)    
+def _cohort_job(name, mask, stage, includeStaff, noAnswers):
 
-    # Sense of Personal Values
-    method_title_7 = "Sense of Personal Values"
-    out_cap_7 = out_cap.copy()
+    outcome_specs = outcome_metrics(summary=True)
+    cohorts = {name: mask}
 
-    if noAnswers is False:
-        out_cap_7 = out_cap_7[out_cap_7['move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong'] != 'Prefer not to answer']
-        out_cap_7 = out_cap_7[out_cap_7['move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong'] != 'Unknown']
-        out_cap_7 = out_cap_7[~out_cap_7['move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong'].isna()]
+    outcomes = cohort_counts(_WORKER_FRAME,
+                             cohorts,
+                             includeStaff=includeStaff,
+                             noAnswers=noAnswers,
+                             metrics=outcome_specs)
+    demographics = demographic_counts(_WORKER_FRAME,
+                                      cohorts,
+                                      stage=stage)
 
-    out_cap_7 = out_cap_7.groupby(['move_out_statement_i_have_a_sense_of_personal_values_that_guide_me_between_right_and_wrong', 'Stage']).size().unstack()
+    return _batch_tables([name], outcomes, demographics, outcome_specs)[name]
 
-    perc = out_cap_7.div(out_cap_7.sum(axis=0), axis=1)
 
-    output_7 = pd.concat([out_cap_7, perc], axis=1)
-    output_7.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+@profiled
+def cohortParallel(input_data,
+                   cohorts,
+                   stage='Move In',
+                   plot=False,
+                   includeStaff=True,
+                   noAnswers=False,
+                   workers=None):
 
-    outcap_7_in_count = output_7['Move In Surveys'].sum()
-    outcap_7_out_count = output_7['Move Out Surveys'].sum()
+    # cohortBatch with one job per cohort spread over a process pool, one worker per
+    # core by default. Workers only count and build tables; every plot and CSV is then
+    # written here, in cohort order, so a run gives the same output as cohortBatch.
+    masks = {name: _cohort_mask(input_data, cohort) for name, cohort in cohorts.items()}
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_7}')
-        else:
-            ax.set_title(f'{title} - {method_title_7}')    
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(input_data,)) as pool:
+        jobs = {name: pool.submit(_cohort_job, name, mask, stage, includeStaff, noAnswers)
+                for name, mask in masks.items()}
+        results = {name: job.result() for name, job in jobs.items()}
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    _report_batch(results, outcome_metrics(summary=True), stage, plot)
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)    
+    return results
 
-    # Sense of Belonging
-    method_title_8 = "Sense of Community and Belonging"
-    out_cap_8 = out_cap.copy()
 
-    if noAnswers is False:
-        out_cap_8 = out_cap_8[out_cap_8['move_out_statement_i_have_a_sense_of_community_and_belonging'] != 'Prefer not to answer']
-        out_cap_8 = out_cap_8[out_cap_8['move_out_statement_i_have_a_sense_of_community_and_belonging'] != 'Unknown']
-        out_cap_8 = out_cap_8[~out_cap_8['move_out_statement_i_have_a_sense_of_community_and_belonging'].isna()]
+# ----------------------------------------------------------------------------------------- #
+#                                     CHART FILES                                           #
+# ----------------------------------------------------------------------------------------- #
 
-    out_cap_8 = out_cap_8.groupby(['move_out_statement_i_have_a_sense_of_community_and_belonging', 'Stage']).size().unstack()
 
-    perc = out_cap_8.div(out_cap_8.sum(axis=0), axis=1)
+# Figure each chart worker draws every chart on, cleared in between
+_CHART_FIGURE = None
 
-    output_8 = pd.concat([out_cap_8, perc], axis=1)
-    output_8.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
 
-    outcap_8_in_count = output_8['Move In Surveys'].sum()
-    outcap_8_out_count = output_8['Move Out Surveys'].sum()
+def _init_chart_worker():
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title_8}')
-        else:
-            ax.set_title(f'{title} - {method_title_8}')    
+    matplotlib.use('Agg')
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1) 
+def _chart_job(kind, metric, table, title, stage, paths):
 
-    print(f"{method_title_1} {title}: Move In Sample Size = {outcap_1_in_count}")
-    print(f"{method_title_1} {title}: Move Out Sample Size = {outcap_1_out_count}")
-    print(f"\n{method_title_1} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_1}")
-    print("============================================\n\n\n\n")
+    global _CHART_FIGURE
+    if _CHART_FIGURE is None:
+        _CHART_FIGURE = Figure(figsize=(8, 6))
 
-    print(f"{method_title_2} {title}: Move In Sample Size = {outcap_2_in_count}")
-    print(f"{method_title_2} {title}: Move Out Sample Size = {outcap_2_out_count}")
-    print(f"\n{method_title_2} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_2}")
-    print("============================================\n\n\n\n")
+    fig = _CHART_FIGURE
+    fig.clear()
+    ax = fig.add_subplot()
 
-    print(f"{method_title_3} {title}: Move In Sample Size = {outcap_3_in_count}")
-    print(f"{method_title_3} {title}: Move Out Sample Size = {outcap_3_out_count}")
-    print(f"\n{method_title_3} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_3}")
-    print("============================================\n\n\n\n")
+    if kind == 'outcome':
+        _plot_outcome(outcome_metrics([metric])[0], table, title, ax=ax)
+        fig.tight_layout()
+    else:
+        specs = {spec['title']: spec for spec in COHORT_METRICS}
+        _plot_cohort(specs[metric], table, stage, title, ax=ax)
 
-    print(f"{method_title_4} {title}: Move In Sample Size = {outcap_4_in_count}")
-    print(f"{method_title_4} {title}: Move Out Sample Size = {outcap_4_out_count}")
-    print(f"\n{method_title_4} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_4}")
-    print("============================================\n\n\n\n")
+    for path in paths:
+        fig.savefig(path)
 
-    print(f"{method_title_5} {title}: Move In Sample Size = {outcap_5_in_count}")
-    print(f"{method_title_5} {title}: Move Out Sample Size = {outcap_5_out_count}")
-    print(f"\n{method_title_5} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_5}")
-    print("============================================\n\n\n\n")
+    return paths
 
-    print(f"{method_title_6} {title}: Move In Sample Size = {outcap_6_in_count}")
-    print(f"{method_title_6} {title}: Move Out Sample Size = {outcap_6_out_count}")
-    print(f"\n{method_title_6} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_6}")
-    print("============================================\n\n\n\n")
 
-    print(f"{method_title_7} {title}: Move In Sample Size = {outcap_7_in_count}")
-    print(f"{method_title_7} {title}: Move Out Sample Size = {outcap_7_out_count}")
-    print(f"\n{method_title_7} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_3}")
-    print("============================================\n\n\n\n")
+@profiled
+def chartBatch(results, stage='Move In', formats=('png',), workers=None):
 
-    print(f"{method_title_8} {title}: Move In Sample Size = {outcap_8_in_count}")
-    print(f"{method_title_8} {title}: Move Out Sample Size = {outcap_8_out_count}")
-    print(f"\n{method_title_8} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_8}")
-    print("============================================\n\n\n\n")
+    # Write a chart file for every table in cohortBatch style results, {title: {metric:
+    # table}}, next to the CSVs. Charts are drawn off screen with Agg on a process pool,
+    # one figure per worker, and never opened in the notebook. Returns the files written.
+    outcome_titles = [spec['title'] for spec in OUTCOME_METRICS]
+    cohort_specs = {spec['title']: spec for spec in COHORT_METRICS}
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_1}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    jobs = []
+    for title, tables in results.items():
+        for metric, table in tables.items():
+            if len(table) == 0:
+                continue
 
-    # Save the output table to the new directory
-    output_1.to_csv(f'{output_directory}/{method_title_1}_{title}_{date.today()}.csv')
+            if metric in outcome_titles:
+                kind = 'outcome'
+                output_directory = _outcome_directory(outcome_metrics([metric])[0])
+            else:
+                kind = 'cohort'
+                output_directory = _cohort_directory(cohort_specs[metric])
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_2}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+            os.makedirs(output_directory, exist_ok=True)
+            paths = [f'{output_directory}/{metric}_{title}_{date.today()}.{ext}' for ext in formats]
+            jobs.append((kind, metric, table, title, stage, paths))
 
-    # Save the output table to the new directory
-    output_2.to_csv(f'{output_directory}/{method_title_2}_{title}_{date.today()}.csv')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker) as pool:
+        written = [pool.submit(_chart_job, *job) for job in jobs]
+        written = [path for job in written for path in job.result()]
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_3}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    return written
 
-    # Save the output table to the new directory
-    output_3.to_csv(f'{output_directory}/{method_title_3}_{title}_{date.today()}.csv')
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_4}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+# ----------------------------------------------------------------------------------------- #
+#                                    HOUSE FAN-OUT                                          #
+# ----------------------------------------------------------------------------------------- #
 
-    # Save the output table to the new directory
-    output_4.to_csv(f'{output_directory}/{method_title_4}_{title}_{date.today()}.csv')
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_5}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+def fanout_counts(input_data,
+                  by='org_house_name',
+                  stage='Move In',
+                  includeStaff=True,
+                  noAnswers=False,
+                  metrics=None):
+
+    # Outcome and demographic count tables for every value of by, a cube dimension or any
+    # column, with the value as the cohort. The column is factorized once and used as the
+    # group code, so every group is counted in the same pass; rows left blank are skipped.
+    if metrics is None:
+        metrics = outcome_metrics(summary=True)
+
+    codes, names = pd.factorize(input_data[CUBE_DIMENSIONS.get(by, by)], sort=True)
+    names = list(names)
+
+    rows = _view_rows(input_data, includeStaff=includeStaff)
+    rows = rows[codes[rows] >= 0]
+    outcomes = _count_outcomes(input_data,
+                               rows,
+                               codes[rows],
+                               len(names),
+                               noAnswers=noAnswers,
+                               metrics=metrics)
+
+    # Demographic breakdowns always leave out no-answers
+    rows = _view_rows(input_data, stages=[stage])
+    rows = rows[codes[rows] >= 0]
+    demographics = _count_outcomes(input_data,
+                                   rows,
+                                   codes[rows],
+                                   len(names),
+                                   noAnswers=False,
+                                   metrics=COHORT_METRICS,
+                                   stages=[stage])
+
+    return _label_groups(outcomes, names), _label_groups(demographics, names)
+
+
+def _write_job(buffer):
+
+    written = []
+    for output_directory, file_name, table in buffer:
+        os.makedirs(output_directory, exist_ok=True)
+        table.to_csv(f'{output_directory}/{file_name}')
+        written.append(f'{output_directory}/{file_name}')
+
+    return written
+
+
+@profiled
+def reportFanout(input_data,
+                 by='org_house_name',
+                 stage='Move In',
+                 plot=False,
+                 includeStaff=True,
+                 noAnswers=False,
+                 workers=None):
+
+    # outcomeSummary and cohortSummary for every house (or org, with by='org'), titled by
+    # the house, from one grouped pass instead of a pass per house. Results are collected
+    # quietly and each house's CSVs are written by one job on a process pool; with plot
+    # the charts are written by chartBatch rather than shown. Inside deferred_output the
+    # tables are handed to its buffer instead. Returns {house: {metric: table}}.
+    outcome_specs = outcome_metrics(summary=True)
+
+    outcomes, demographics = fanout_counts(input_data,
+                                           by,
+                                           stage=stage,
+                                           includeStaff=includeStaff,
+                                           noAnswers=noAnswers,
+                                           metrics=outcome_specs)
+
+    # Titles end up in file names, so keep path separators out of them
+    names = list(outcomes['cohort'].cat.categories)
+    titles = {name: str(name).replace('/', '-').replace('\\', '-') for name in names}
+    results = _batch_tables(names, outcomes, demographics, outcome_specs)
+    results = {titles[name]: results[name] for name in names}
+
+    buffers = []
+    with quiet_results():
+        for title in results:
+            with deferred_output(csv=False) as buffer:
+                _report_batch({title: results[title]}, outcome_specs, stage)
+            buffers.append(buffer)
+
+    if _OUTPUT_BUFFER is not None:
+        for buffer in buffers:
+            _OUTPUT_BUFFER.extend(buffer)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for written in pool.map(_write_job, buffers):
+                for file_path in written:
+                    _count_output(file_path)
 
-    # Save the output table to the new directory
-    output_5.to_csv(f'{output_directory}/{method_title_5}_{title}_{date.today()}.csv')
+    if plot is True:
+        chartBatch(results, stage=stage, workers=workers)
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_6}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    return results
 
-    # Save the output table to the new directory
-    output_6.to_csv(f'{output_directory}/{method_title_6}_{title}_{date.today()}.csv')
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_7}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+# ----------------------------------------------------------------------------------------- #
+#                                       LINKAGE                                             #
+# ----------------------------------------------------------------------------------------- #
 
-    # Save the output table to the new directory
-    output_7.to_csv(f'{output_directory}/{method_title_7}_{title}_{date.today()}.csv')
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/Recovery_Capital/{method_title_8}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+# Answers a resident gives the same way on every survey. Together with the house they
+# stand in for an ID the survey does not collect.
+LINK_FIELDS = ['mother_first_i', 'father_first_i', 'fav_color', 'fav_season', 'age']
 
-    # Save the output table to the new directory
-    output_8.to_csv(f'{output_directory}/{method_title_8}_{title}_{date.today()}.csv')
 
+def link_keys(input_data, fields=None):
 
-def outcomeSuccess(input_data,
-                     title="",
-                     plot=False,
-                     includeStaff=True,
-                     noAnswers=False):
+    # 64-bit pseudo-ID per survey hashed from the house and the link fields. Surveys with
+    # any of them missing cannot be linked and get <NA>.
+    if fields is None:
+        fields = LINK_FIELDS
+    columns = ['org_house_name'] + fields
 
-    method_title = "Was Housing Successful?"
+    keys = pd.util.hash_pandas_object(input_data[columns].astype(str), index=False)
+    keys = keys.astype('UInt64')
+    keys[input_data[columns].isna().any(axis=1)] = pd.NA
 
-    out_success = input_data[['Stage', 'input_type', 
-                           'move_out_recovery_housing_success']]
+    return keys.rename('link_id')
 
-    out_success = out_success[out_success['Stage'] != 'Follow Up']
 
-    if includeStaff is False:
-        out_success = out_success[out_success['input_type'] == 'Client']
+def link_orh(input_data, from_stage='Move In', to_stage='Move Out', fields=None):
 
-    if noAnswers is False:
-        out_success = out_success[out_success['move_out_recovery_housing_success'] != 'Prefer not to answer']
-        out_success = out_success[out_success['move_out_recovery_housing_success'] != 'Unknown']
-        out_success = out_success[~out_success['move_out_recovery_housing_success'].isna()]
+    # Pair each from_stage survey with the to_stage survey of the same resident. The
+    # house is part of the pseudo-ID, so this is a hash join within each house rather
+    # than a comparison of every pair. A pseudo-ID that shows up on more than one
+    # survey of a stage is ambiguous and left unpaired.
+    keys = link_keys(input_data, fields)
 
-    out_success = out_success.groupby(['move_out_recovery_housing_success', 'Stage']).size().unstack()
+    sides = []
+    for stage in [from_stage, to_stage]:
+        side = pd.DataFrame({'link_id': keys, stage: input_data.index})
+        side = side[(input_data['Stage'] == stage).to_numpy() & keys.notna().to_numpy()]
+        sides.append(side.drop_duplicates('link_id', keep=False))
 
-    perc = out_success.div(out_success.sum(axis=0), axis=1)
+    pairs = sides[0].merge(sides[1], on='link_id', how='inner')
 
-    output = pd.concat([out_success, perc], axis=1)
-    output.columns = ['Move Out Surveys', '% Move Out']
+    return pairs.reset_index(drop=True)
 
-    output_out_count = output['Move Out Surveys'].sum()
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title}')
-        else:
-            ax.set_title(f'{title} - {method_title}')    
+# Weight of each field in a fuzzy match score, and fields whose answers are ordered ranges
+# where a neighbouring answer earns half credit
+MATCH_WEIGHTS = {'mother_first_i': 1, 'father_first_i': 1, 'fav_color': 1, 'fav_season': 1, 'age': 1}
+MATCH_ORDERED = ['age']
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+def _field_codes(input_data, field):
 
-    print(f"{method_title} {title}: Move Out Sample Size = {output_out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output}")
-    print("============================================\n\n\n\n")
+    column = input_data[field]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), list(column.cat.categories)
 
+    codes, uniques = pd.factorize(column, sort=True)
+    return codes.astype(np.int64), list(uniques)
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+def _field_similarity(input_data, field, a, b):
 
+    # Similarity of a field between the surveys at positions a and b, from 0 to 1
+    codes, uniques = _field_codes(input_data, field)
+    code_a = codes[a]
+    code_b = codes[b]
 
-def outcomeMoveOutReason(input_data,
-                         title="",
-                         plot=False,
-                         includeStaff=True,
-                         noAnswers=False):
+    similarity = ((code_a == code_b) & (code_a >= 0)).astype(float)
 
-    method_title = "Move Out Reason"
+    if field in MATCH_ORDERED:
+        # Rank of each answer among the real ones, -1 for missing and no-answers
+        answers = [value for value in uniques if value not in NO_ANSWER_VALUES]
+        ranks = np.array([answers.index(value) if value in answers else -1 for value in uniques] + [-1])
+        rank_a = ranks[code_a]
+        rank_b = ranks[code_b]
+        near = (rank_a >= 0) & (rank_b >= 0) & (np.abs(rank_a - rank_b) == 1)
+        similarity[near] = 0.5
 
-    out_reason = input_data[['Stage', 'input_type', 
-                             'move_out_recovery_housing_leave_reason']]
+    return similarity
 
-    out_reason = out_reason[out_reason['Stage'] != 'Follow Up']
 
-    if includeStaff is False:
-        out_reason = out_reason[out_reason['input_type'] == 'Client']
+def _assign_pairs(a, b):
 
-    if noAnswers is False:
-        out_reason = out_reason[out_reason['move_out_recovery_housing_leave_reason'] != 'Prefer not to answer']
-        out_reason = out_reason[out_reason['move_out_recovery_housing_leave_reason'] != 'Unknown']
-        out_reason = out_reason[~out_reason['move_out_recovery_housing_leave_reason'].isna()]
+    # Greedy one-to-one assignment over pairs already sorted best first: a pair is taken
+    # when neither of its surveys has been taken yet. One pass, linear in the pairs.
+    taken = np.zeros(len(a), dtype=bool)
+    used_a = set()
+    used_b = set()
 
-    out_reason = out_reason.groupby(['move_out_recovery_housing_leave_reason', 'Stage']).size().unstack()
+    for i, (survey_a, survey_b) in enumerate(zip(a.tolist(), b.tolist())):
+        if survey_a in used_a or survey_b in used_b:
+            continue
+        taken[i] = True
+        used_a.add(survey_a)
+        used_b.add(survey_b)
 
-    perc = out_reason.div(out_reason.sum(axis=0), axis=1)
+    return taken
 
-    output = pd.concat([out_reason, perc], axis=1)
-    output.columns = ['Move Out Surveys', '% Move Out']
 
-    output_out_count = output['Move Out Surveys'].sum()
+# Candidate pairs scored at a time by match_orh, which bounds its memory
+MATCH_BLOCK = 1000000
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title}')
-        else:
-            ax.set_title(f'{title} - {method_title}')    
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+def _window_pairs(house, day, from_rows, to_rows, max_days):
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    # Every (from, to) pair in the same house with 0 <= to day - from day <= max_days, in
+    # blocks of about MATCH_BLOCK pairs. The to side is sorted by (house, day) once and
+    # each from survey finds its window with two binary searches, so only pairs inside
+    # a window are ever built.
+    rows = np.concatenate([from_rows, to_rows])
+    first = day[rows].min()
+    span = day[rows].max() - first + max_days + 1
 
-    print(f"{method_title} {title}: Move Out Sample Size = {output_out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output}")
-    print("============================================\n\n\n\n")
+    key = np.zeros(len(day), dtype=np.int64)
+    key[rows] = house[rows] * span + (day[rows] - first)
 
+    to_rows = to_rows[np.argsort(key[to_rows], kind='stable')]
+    to_keys = key[to_rows]
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    start = np.searchsorted(to_keys, key[from_rows], side='left')
+    counts = np.searchsorted(to_keys, key[from_rows] + max_days, side='right') - start
 
-    # Save the output table to the new directory
-    output.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    # Cut the from side where the running number of pairs passes each multiple of MATCH_BLOCK
+    ends = np.cumsum(counts)
+    cuts = np.searchsorted(ends, np.arange(MATCH_BLOCK, ends[-1], MATCH_BLOCK), side='right')
 
+    for block in np.split(np.arange(len(from_rows)), np.unique(cuts)):
+        block_counts = counts[block]
+        a = np.repeat(from_rows[block], block_counts)
+        offsets = np.arange(block_counts.sum()) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+        b = to_rows[np.repeat(start[block], block_counts) + offsets]
 
-def outcomeSponsor(input_data,
-                   title="",
-                   plot=False,
-                   includeStaff=True,
-                   noAnswers=False):
+        yield a, b
 
-    method_title = "Working with Sponsor?"
 
-    out_sponsor = input_data[['Stage', 'input_type', 
-                             'last_30_attendance_working_with_sponsor']]
+def match_orh(input_data,
+              from_stage='Move In',
+              to_stage='Move Out',
+              threshold=0.8,
+              max_days=730,
+              weights=None):
 
-    out_sponsor = out_sponsor[out_sponsor['Stage'] != 'Follow Up']
+    # Typo tolerant version of link_orh. Candidates are the from_stage and to_stage
+    # surveys of the same house submitted in that order and at most max_days apart
+    # (None for no limit, which compares every such pair in a house). Surveys without a
+    # submission date are left to link_orh. Each candidate gets the weighted share of
+    # link fields that agree, and pairs scoring at least threshold are assigned one to
+    # one, best score first, then the shortest stay.
+    if weights is None:
+        weights = MATCH_WEIGHTS
 
-    if includeStaff is False:
-        out_sponsor = out_sponsor[out_sponsor['input_type'] == 'Client']
+    house = pd.factorize(input_data['org_house_name'])[0]
+    when = pd.to_datetime(input_data['submission_date'], errors='coerce')
+    day = (when.to_numpy().astype('datetime64[D]') - np.datetime64(0, 'D')).astype(np.int64)
 
-    if noAnswers is False:
-        out_sponsor = out_sponsor[out_sponsor['last_30_attendance_working_with_sponsor'] != 'Prefer not to answer']
-        out_sponsor = out_sponsor[out_sponsor['last_30_attendance_working_with_sponsor'] != 'Unknown']
-        out_sponsor = out_sponsor[~out_sponsor['last_30_attendance_working_with_sponsor'].isna()]
+    dated = (house >= 0) & when.notna().to_numpy()
+    from_rows = np.flatnonzero((input_data['Stage'] == from_stage).to_numpy() & dated)
+    to_rows = np.flatnonzero((input_data['Stage'] == to_stage).to_numpy() & dated)
 
-    out_sponsor = out_sponsor.groupby(['last_30_attendance_working_with_sponsor', 'Stage']).size().unstack()
+    if len(from_rows) == 0 or len(to_rows) == 0:
+        return pd.DataFrame({from_stage: input_data.index[[]],
+                             to_stage: input_data.index[[]],
+                             'score': np.zeros(0)})
 
-    perc = out_sponsor.div(out_sponsor.sum(axis=0), axis=1)
+    if max_days is None:
+        max_days = int(day[dated].max() - day[dated].min())
 
-    output = pd.concat([out_sponsor, perc], axis=1)
-    output.columns = ['Move In Surveys', 'Move Out Surveys', '% Move In', '% Move Out']
+    # Blocking: only surveys of the same house inside the date window are ever compared,
+    # and only the pairs scoring at least threshold are kept from each block
+    kept = []
+    for a, b in _window_pairs(house, day, from_rows, to_rows, max_days):
+        score = np.zeros(len(a))
+        for field, weight in weights.items():
+            score += weight * _field_similarity(input_data, field, a, b)
+        score /= sum(weights.values())
 
-    output_out_count = output['Move Out Surveys'].sum()
+        keep = score >= threshold
+        kept.append((a[keep], b[keep], score[keep]))
 
-    if plot is True:
-        ax = perc.plot(kind='bar')
-        ax.set_ylabel('Percent Total')
-        if title == "":
-            ax.set_title(f'{method_title}')
-        else:
-            ax.set_title(f'{title} - {method_title}')    
+    a, b, score = (np.concatenate(part) for part in zip(*kept))
 
-        # Add percentage labels above each bar
-        for i in range(len(ax.containers)):
-            container = ax.containers[i]
-            for j, val in enumerate(container):
-                height = val.get_height()
-                ax.text(val.get_x() + val.get_width() / 2, height, f'{perc.values[j, i]:.0%}',
-                        ha='center', va='bottom')
+    # Best score first, then the shortest stay
+    order = np.lexsort((day[b] - day[a], -score))
+    a, b, score = a[order], b[order], score[order]
 
-        # Set the y-axis limits
-        ax.set_ylim(0, 1)
+    taken = _assign_pairs(a, b)
 
-    print(f"{method_title} {title}: Move Out Sample Size = {output_out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output}")
-    print("============================================\n\n\n\n")
+    return pd.DataFrame({from_stage: input_data.index[a[taken]],
+                         to_stage: input_data.index[b[taken]],
+                         'score': score[taken]})
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    # Save the output table to the new directory
-    output.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+# ----------------------------------------------------------------------------------------- #
+#                                   PAIRED OUTCOMES                                         #
+# ----------------------------------------------------------------------------------------- #
 
 
-def outcomeCriminalJustice(input_data,
-                    title="",
-                    plot=False,
-                    includeStaff=True,
-                    noAnswers=True):
+def _transition_table(input_data, spec, a, b, noAnswers=False):
 
-    method_title = "Criminal Justice Status"
+    # What each paired resident answered at Move In (rows) against Move Out (columns)
+    if spec['type'] == 'single':
+        codes, uniques = _answer_codes(input_data, spec['column'], noAnswers)
+        code_a = codes[a]
+        code_b = codes[b]
+        valid = (code_a >= 0) & (code_b >= 0)
 
-    # Criminal Justice Status
-    out_cjs = input_data[['Stage', 'input_type', 'curr_status_cjs_parole_probation',
-                            'curr_status_cjs_drug_court', 'curr_status_cjs_no_involvement',
-                            'curr_status_cjs_no_answer']]
+        n_values = len(uniques)
+        grid = np.bincount(code_a[valid] * n_values + code_b[valid],
+                           minlength=n_values * n_values).reshape(n_values, n_values)
 
-    update_cols = out_cjs.columns[2:]
-    for col in update_cols:
-        out_cjs[col] = out_cjs[col].fillna('NA').map(lambda x: 1 if x != 'NA' else 0)
+        # Same answers on both axes, leaving out any that no pair gave
+        shown = (grid.sum(axis=0) > 0) | (grid.sum(axis=1) > 0)
+        return pd.DataFrame(grid[shown][:, shown],
+                            index=pd.Index(uniques[shown], name='Move In'),
+                            columns=pd.Index(uniques[shown], name='Move Out'))
 
-    out_cjs = out_cjs[out_cjs['Stage'] != 'Follow Up']
+    # Checkbox families: per option, how many residents kept, gained or lost it
+    columns = _family_columns(spec)
+    indicators = checkbox_array(input_data, columns).astype(bool)
+    before = indicators[a]
+    after = indicators[b]
 
-    if includeStaff is False:
-        out_cjs = out_cjs[out_cjs['input_type'] == 'Client']
+    if noAnswers is False:
+        keep = _family_keep(before, columns, spec) & _family_keep(after, columns, spec)
+        before, after = before[keep], after[keep]
+        shown = [col for col in spec['columns'] if col not in spec.get('hidden', [])]
+    else:
+        shown = spec['columns']
 
-    if noAnswers is False:    
-        out_cjs = out_cjs[(out_cjs['curr_status_cjs_parole_probation'] > 0)
-                              | (out_cjs['curr_status_cjs_drug_court'] > 0)
-                              | (out_cjs['curr_status_cjs_no_involvement'] > 0)
-                              | (out_cjs['curr_status_cjs_no_answer'] == 0)]
-        out_cjs = out_cjs[['Stage', 'input_type', 'curr_status_cjs_parole_probation',
-                            'curr_status_cjs_drug_court', 'curr_status_cjs_no_involvement']]
+    labels = dict(zip(spec['columns'], spec.get('labels', spec['columns'])))
+    positions = [columns.index(col) for col in shown]
+    before = before[:, positions]
+    after = after[:, positions]
 
-    grouped = out_cjs.groupby("Stage").sum()
+    output = pd.DataFrame({spec.get('label', spec['title']): [labels[col] for col in shown],
+                           'Neither': (~before & ~after).sum(axis=0),
+                           'Gained': (~before & after).sum(axis=0),
+                           'Lost': (before & ~after).sum(axis=0),
+                           'Kept': (before & after).sum(axis=0)})
+    output['Pairs'] = len(before)
 
-    in_count = out_cjs[out_cjs['Stage']=='Move In']['Stage'].count()
-    out_count = out_cjs[out_cjs['Stage']=='Move Out']['Stage'].count()
+    return output
 
-    grouped = grouped.transpose()
 
-    grouped['Percent Move In'] = (grouped['Move In']/in_count)*100
-    grouped['Percent Move Out'] = (grouped['Move Out']/out_count)*100
+def outcome_transitions(input_data,
+                        pairs=None,
+                        includeStaff=True,
+                        noAnswers=False,
+                        metrics=None):
 
-    # Reset the index of the dataframe
-    grouped = grouped.reset_index()
+    # Within-person change for every metric asked at both Move In and Move Out, over
+    # Move In/Move Out pairs from link_orh or match_orh (link_orh when not given)
+    if pairs is None:
+        pairs = link_orh(input_data)
+    if metrics is None:
+        metrics = outcome_metrics()
 
-    # Output Table
-    output_table = grouped.copy()
-    output_table['Move In Population'] = in_count
-    output_table['Move Out Population'] = out_count
-    output_table.columns = ['Criminal Justice System Status', 'Move In', 'Move Out', 'Percent Move In', 'Percent move Out', 'Move In Population', 'Move Out Population']
+    a = input_data.index.get_indexer(pairs['Move In'])
+    b = input_data.index.get_indexer(pairs['Move Out'])
 
-    prog_perc = grouped[['index', 'Percent Move In', 'Percent Move Out']]
-    prog_perc.columns = ['Criminal Justice System Status', 'Move In', 'Move Out']
+    found = (a >= 0) & (b >= 0)
+    if includeStaff is False:
+        client = (input_data['input_type'] == 'Client').to_numpy()
+        found &= client[a] & client[b]
+    a, b = a[found], b[found]
 
-    print(f"{method_title} {title}: Move In Sample Size = {in_count}")
-    print(f"{method_title} {title}: Move Out Sample Size = {out_count}")
-    print(f"\n{method_title} {title}: Summary Table")
-    print("============================================")
-    print(f"{output_table}")
-    print("============================================\n\n")
+    return {spec['title']: _transition_table(input_data, spec, a, b, noAnswers)
+            for spec in metrics if spec.get('stages', OUTCOME_STAGES) == OUTCOME_STAGES}
 
-    if plot is True:
-        # Create a horizontal stacked bar chart
-        ax = prog_perc.plot(x = 'Criminal Justice System Status', kind="bar", stacked=False)
 
-        # Set the chart title and labels
-        if title == "":
-            ax.set_title(f"{method_title}: Move In vs Move Out")
-        else:
-            ax.set_title(f"{title} - {method_title}: Move In vs Move Out")    
-        ax.set_xlabel("Percentage of Total (%)")
-        ax.set_ylabel("Last 30 Columns")
+@profiled
+def outcomePaired(input_data,
+                  title="",
+                  pairs=None,
+                  includeStaff=True,
+                  noAnswers=False):
 
+    # Transition tables for every summary metric, saved next to the outcome comparisons
+    metrics = outcome_metrics(summary=True)
 
-        # Add percentage labels above each bar
-        for container in ax.containers:
-            for bar in container:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width() / 2, height, f'{height:.0f}%',
-                        ha='center', va='bottom')
+    tables = outcome_transitions(input_data,
+                                 pairs=pairs,
+                                 includeStaff=includeStaff,
+                                 noAnswers=noAnswers,
+                                 metrics=metrics)
 
-        # Show the chart
-        plt.show()
+    results = {}
+    for spec in metrics:
+        if spec['title'] not in tables:
+            continue
 
-    # Check if directory exists and create it if not
-    output_directory = f'./ORH_Output_{date.today()}/Outcome_Comparison/{method_title}'
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+        table = tables[spec['title']]
+        if spec['type'] == 'single':
+            sample_size = table.to_numpy().sum()
+        else:
+            sample_size = table['Pairs'].iloc[0] if len(table) else 0
+
+        results[spec['title']] = report_result(spec['title'], title, {'Pairs': sample_size}, table)
+
+        # Save the output table
+        output_directory = _outcome_directory(spec)
+        save_output(table, output_directory, f'{spec["title"]}_{title}_Paired_{date.today()}.csv')
 
-    # Save the output table to the new directory
-    output_table.to_csv(f'{output_directory}/{method_title}_{title}_{date.today()}.csv')
+    return results
 
 
 # ----------------------------------------------------------------------------------------- #
@@ -2210,6 +3448,7 @@ def outcomeCriminalJustice(input_data,
 # ----------------------------------------------------------------------------------------- #
 
 
+@profiled
 def outcomeComparison(data_1,
                       title_1,
                       data_2,
@@ -2218,139 +3457,28 @@ def outcomeComparison(data_1,
                       includeStaff=True,
                       noAnswers=False):
 
-    # Substance Use
-    outcomeSubstance(input_data=data_1,
-                     title=title_1,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-    outcomeSubstance(input_data=data_2,
-                     title=title_2,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-    
-    # Program Usage
-    outcomePrograms(input_data=data_1,
-                    title=title_1,
-                    plot=plot,
-                    includeStaff=includeStaff,
-                    noAnswers=noAnswers)
-    outcomePrograms(input_data=data_2,
-                    title=title_2,
-                    plot=plot,
-                    includeStaff=includeStaff,
-                    noAnswers=noAnswers)
-
-    # Document Status
-    outcomeDocuments(input_data=data_1,
-                     title=title_1,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-    outcomeDocuments(input_data=data_2,
-                     title=title_2,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-
-    # Employment Status
-    outcomeEmployment(input_data=data_1,
-                      title=title_1,
-                      plot=plot,
-                      includeStaff=includeStaff,
-                      noAnswers=noAnswers)
-    outcomeEmployment(input_data=data_2,
-                      title=title_2,
-                      plot=plot,
-                      includeStaff=includeStaff,
-                      noAnswers=noAnswers)
-
-    # Health
-    outcomeHealth(input_data=data_1,
-                  title=title_1,
-                  plot=plot,
-                  includeStaff=includeStaff,
-                  noAnswers=noAnswers)
-    outcomeHealth(input_data=data_2,
-                  title=title_2,
-                  plot=plot,
-                  includeStaff=includeStaff,
-                  noAnswers=noAnswers)
-
-    # Consequences
-    outcomeConsequences(input_data=data_1,
-                        title=title_1,
-                        plot=plot,
-                        includeStaff=includeStaff,
-                        noAnswers=noAnswers)
-    outcomeConsequences(input_data=data_2,
-                        title=title_2,
-                        plot=plot,
-                        includeStaff=includeStaff,
-                        noAnswers=noAnswers)
-
-    # Recovery Capital
-    outcomeRecoveryCapital(input_data=data_1,
-                           title=title_1,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
-    outcomeRecoveryCapital(input_data=data_2,
-                           title=title_2,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
-
-    # Housing Success
-    outcomeSuccess(input_data=data_1,
-                   title=title_1,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-    outcomeSuccess(input_data=data_2,
-                   title=title_2,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-
-    # Move Out Reason
-    outcomeMoveOutReason(input_data=data_1,
-                         title=title_1,
-                         plot=plot,
-                         includeStaff=includeStaff,
-                         noAnswers=noAnswers)
-    outcomeMoveOutReason(input_data=data_2,
-                         title=title_2,
-                         plot=plot,
-                         includeStaff=includeStaff,
-                         noAnswers=noAnswers)
+    # Every metric is counted in one pass per cohort
+    metrics = outcome_metrics(summary=True)
 
-    # Sponsor Status
-    outcomeSponsor(input_data=data_1,
-                   title=title_1,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-    outcomeSponsor(input_data=data_2,
-                   title=title_2,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-
-    # Criminal Justice Status
-    outcomeCriminalJustice(input_data=data_1,
-                           title=title_1,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
-    outcomeCriminalJustice(input_data=data_2,
-                           title=title_2,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
+    results_1 = outcomeEngine(data_1,
+                              includeStaff=includeStaff,
+                              noAnswers=noAnswers,
+                              metrics=metrics)
+    results_2 = outcomeEngine(data_2,
+                              includeStaff=includeStaff,
+                              noAnswers=noAnswers,
+                              metrics=metrics)
+
+    # {title: {metric: result}}, as report_result makes them
+    output = {title_1: {}, title_2: {}}
+    for spec in metrics:
+        output[title_1][spec['title']] = _report_outcome(spec, results_1[spec['title']], title_1, plot)
+        output[title_2][spec['title']] = _report_outcome(spec, results_2[spec['title']], title_2, plot)
 
+    return output
 
+
+@profiled
 def cohortComparison(data_1,
                      title_1,
                      data_2,
@@ -2358,172 +3486,57 @@ def cohortComparison(data_1,
                      stage='Move In',
                      plot=False):
 
-    # Age Comparison
-    cohortAges(input_data=data_1,
-               stage=stage,
-               plot=plot,
-               title=title_1)
-    cohortAges(input_data=data_2,
-               stage=stage,
-               plot=plot,
-               title=title_2)
-
-    # Education Comparison
-    cohortEducation(input_data=data_1,
-                    stage=stage,
-                    plot=plot,
-                    title=title_1)
-    cohortEducation(input_data=data_2,
-                    stage=stage,
-                    plot=plot,
-                    title=title_2)
-
-    # Race Comparison
-    cohortRace(input_data=data_1,
-               stage=stage,
-               plot=plot,
-               title=title_1)
-    cohortRace(input_data=data_2,
-               stage=stage,
-               plot=plot,
-               title=title_2)
-
-    # Gender Comparison
-    cohortGender(input_data=data_1,
-                 stage=stage,
-                 plot=plot,
-                 title=title_1)
-    cohortGender(input_data=data_2,
-                 stage=stage,
-                 plot=plot,
-                 title=title_2)
-
-    # Sexuality Comparison
-    cohortSexuality(input_data=data_1,
-                    stage=stage,
-                    plot=plot,
-                    title=title_1)
-    cohortSexuality(input_data=data_2,
-                    stage=stage,
-                    plot=plot,
-                    title=title_2)
+    # Every breakdown for both cohorts, in the order the files have always been written.
+    # Returns {title: {metric: result}}, as report_result makes them.
+    output = {title_1: {}, title_2: {}}
+
+    for breakdown in [cohortAges, cohortEducation, cohortRace, cohortGender, cohortSexuality]:
+        output[title_1].update(breakdown(input_data=data_1,
+                                         stage=stage,
+                                         plot=plot,
+                                         title=title_1))
+        output[title_2].update(breakdown(input_data=data_2,
+                                         stage=stage,
+                                         plot=plot,
+                                         title=title_2))
 
+    return output
 
+
+@profiled
 def outcomeSummary(data_1,
                    title_1,
                    plot=False,
                    includeStaff=True,
                    noAnswers=False):
 
-    # Substance Use
-    outcomeSubstance(input_data=data_1,
-                     title=title_1,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-
-    # Program Usage
-    outcomePrograms(input_data=data_1,
-                    title=title_1,
-                    plot=plot,
-                    includeStaff=includeStaff,
-                    noAnswers=noAnswers)
-
-    # Document Status
-    outcomeDocuments(input_data=data_1,
-                     title=title_1,
-                     plot=plot,
-                     includeStaff=includeStaff,
-                     noAnswers=noAnswers)
-
-    # Employment Status
-    outcomeEmployment(input_data=data_1,
-                      title=title_1,
-                      plot=plot,
-                      includeStaff=includeStaff,
-                      noAnswers=noAnswers)
-
-    # Health
-    outcomeHealth(input_data=data_1,
-                  title=title_1,
-                  plot=plot,
-                  includeStaff=includeStaff,
-                  noAnswers=noAnswers)
-
-    # Consequences
-    outcomeConsequences(input_data=data_1,
-                        title=title_1,
-                        plot=plot,
-                        includeStaff=includeStaff,
-                        noAnswers=noAnswers)
-
-    # Recovery Capital
-    outcomeRecoveryCapital(input_data=data_1,
-                           title=title_1,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
-
-    # Housing Success
-    outcomeSuccess(input_data=data_1,
-                   title=title_1,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-
-    # Move Out Reason
-    outcomeMoveOutReason(input_data=data_1,
-                         title=title_1,
-                         plot=plot,
-                         includeStaff=includeStaff,
-                         noAnswers=noAnswers)
+    # Every metric is counted in one pass over the frame
+    metrics = outcome_metrics(summary=True)
 
-    # Sponsor Status
-    outcomeSponsor(input_data=data_1,
-                   title=title_1,
-                   plot=plot,
-                   includeStaff=includeStaff,
-                   noAnswers=noAnswers)
-
-    # Criminal Justice Status
-    outcomeCriminalJustice(input_data=data_1,
-                           title=title_1,
-                           plot=plot,
-                           includeStaff=includeStaff,
-                           noAnswers=noAnswers)
+    results = outcomeEngine(data_1,
+                            includeStaff=includeStaff,
+                            noAnswers=noAnswers,
+                            metrics=metrics)
 
+    output = {}
+    for spec in metrics:
+        output[spec['title']] = _report_outcome(spec, results[spec['title']], title_1, plot)
 
+    return {title_1: output}
+
+
+@profiled
 def cohortSummary(data_1,
                   title_1,
                   stage='Move In',
                   plot=False):
 
-    # Age Comparison
-    cohortAges(input_data=data_1,
-               stage=stage,
-               plot=plot,
-               title=title_1)
-
-    # Education Comparison
-    cohortEducation(input_data=data_1,
-                    stage=stage,
-                    plot=plot,
-                    title=title_1)
-
-    # Race Comparison
-    cohortRace(input_data=data_1,
-               stage=stage,
-               plot=plot,
-               title=title_1)
-
-    # Gender Comparison
-    cohortGender(input_data=data_1,
-                 stage=stage,
-                 plot=plot,
-                 title=title_1)
-
-    # Sexuality Comparison
-    cohortSexuality(input_data=data_1,
-                    stage=stage,
-                    plot=plot,
-                    title=title_1)
+    output = {}
+
+    for breakdown in [cohortAges, cohortEducation, cohortRace, cohortGender, cohortSexuality]:
+        output.update(breakdown(input_data=data_1,
+                                stage=stage,
+                                plot=plot,
+                                title=title_1))
+
+    return {title_1: output}
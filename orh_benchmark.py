@@ -0,0 +1,389 @@
+import matplotlib
+import pandas as pd
+import numpy as np
+from contextlib import contextmanager, redirect_stdout
+from datetime import date
+import argparse
+import gc
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import mcm_orh_functions as orh
+
+
+# ----------------------------------------------------------------------------------------- #
+#                                   SYNTHETIC SURVEYS                                       #
+# ----------------------------------------------------------------------------------------- #
+
+
+# Completion stage mix: Move In, Move Out, Follow Up
+STAGE_SHARES = [0.55, 0.35, 0.10]
+
+# Share of surveys filled in by staff for a resident
+STAFF_SHARE = 0.15
+
+NO_ANSWER_SHARES = {'Prefer not to answer': 0.03, 'Unknown': 0.02}
+
+# Share of single-choice answers left blank, and of answers orh_col_types.csv does not list
+BLANK_SHARE = 0.02
+UNLISTED_SHARE = 0.01
+UNLISTED_ANSWER = 'Not sure'
+
+# Answers and their shares where the split is roughly known, worded as in orh_col_types.csv.
+# Every other single-choice question draws evenly from the answers orh_col_types.csv lists
+# for it, and questions it leaves open are answered Yes / No.
+SINGLE_ANSWERS = {
+    'age': {'18-24 years': 0.10, '25-29 years': 0.17, '30-34 years': 0.20, '35-39 years': 0.17,
+            '40-44 years': 0.12, '45-49 years': 0.08, '50-54 years': 0.06, '55-59 years': 0.04,
+            '60-64 years': 0.02, '65-69 years': 0.01, '70+ years': 0.01},
+    'highest_education_degree': {'No degree received': 0.25,
+                                 'High school diploma or equivalency (GED)': 0.50,
+                                 'Associate degree': 0.07,
+                                 "Bachelor's degree": 0.05,
+                                 "Master's degree or beyond": 0.01,
+                                 'Technical or vocational certification': 0.07},
+    'doc_status_drivers_license': {"Possess a driver's license": 0.35,
+                                   "Do not possess a driver's license": 0.30,
+                                   'License is currently suspended': 0.25,
+                                   'License is revoked': 0.05},
+    'doc_status_state_id': {'Have a state ID': 0.60, 'Do not have a state ID': 0.35},
+    'doc_status_social_security_card': {'Possess a social security card': 0.45,
+                                        'Possess a copy of social security card': 0.15,
+                                        'Do not possess a social security card or a copy': 0.35},
+    'doc_status_birth_certificate': {'Possess birth certificate': 0.40,
+                                     'Possess a copy of birth certificate': 0.20,
+                                     'Do not possess birth certificate, or a copy': 0.35},
+    'last_30_alcohol_use': {'No use': 0.75, '1-10 days': 0.12, '11-20 days': 0.04, '21-30 days': 0.04},
+    'last_30_illegal_drugs_non_prescribed_medications': {'No use': 0.70, '1-10 days': 0.14,
+                                                         '11-20 days': 0.05, '21-30 days': 0.06},
+    'last_30_employment_status': {'Full-time paid work': 0.30,
+                                  'Part-time paid work': 0.15,
+                                  'Temporary assignment for paid work': 0.05,
+                                  'Looking for paid work': 0.25,
+                                  'Retired': 0.02,
+                                  'Disabled and receiving disability benefits': 0.06,
+                                  'Disabled and not receiving disability benefits': 0.04,
+                                  'Other': 0.08},
+    'last_30_volunteering_status': {'Have not volunteered in the last 30 days': 0.60,
+                                    'Volunteering less than 10 hours a week': 0.25,
+                                    'Volunteering more than 10 hours a week': 0.10},
+    'last_30_physical_health': {'Good on most days': 0.50, 'Fair on most days': 0.30,
+                                'Poor on most days': 0.15},
+    'last_30_mental_health': {'Good on most days': 0.45, 'Fair on most days': 0.35,
+                              'Poor on most days': 0.15},
+    'move_out_recovery_housing_success': {'Yes': 0.65, 'No': 0.30},
+    'move_out_recovery_housing_leave_reason': {'Completed the program': 0.40,
+                                               'Moved to independent living': 0.20,
+                                               'Asked to leave': 0.20,
+                                               'Returned to use': 0.10,
+                                               'Other': 0.05},
+    'fav_color': {'Red': 0.25, 'Blue': 0.35, 'Green': 0.20, 'Purple': 0.15},
+    'fav_season': {'Winter': 0.15, 'Spring': 0.25, 'Summer': 0.35, 'Fall': 0.20},
+}
+
+YES_NO = {'Yes': 0.45, 'No': 0.50}
+
+# Questions only asked at move out
+MOVE_OUT_ONLY = ['move_out_recovery_housing_success', 'move_out_recovery_housing_leave_reason']
+
+# Columns filled with something other than a survey answer
+FREE_TEXT = ['survey_id', 'consent_indicator', 'org ', 'org_house_name', 'frm_completion_stage',
+             'mother_first_i', 'father_first_i', 'start_date', 'submission_date', 'network_id',
+             'tags', 'input_type', 'debt_balance', 'move_out_recovery_housing_stay_week_count']
+
+
+def _listed_answers(types_path):
+
+    # {column: answers orh_col_types.csv lists}, for the columns it lists any answers for
+    orh_types = pd.read_csv(types_path, keep_default_na=False)
+
+    return {col: listed.split('|') for col, listed in zip(orh_types['Columns'], orh_types['Categories'])
+            if listed != ''}
+
+
+def _answer_shares(column, listed):
+
+    # The column's answers and shares, padded out with the no-answers the spec lists (both
+    # for open questions), blanks, and for listed questions a few answers it does not list
+    if column in SINGLE_ANSWERS:
+        answers = dict(SINGLE_ANSWERS[column])
+    elif column in listed:
+        options = [value for value in listed[column] if value not in NO_ANSWER_SHARES]
+        answers = dict.fromkeys(options, 0.95 / len(options))
+    else:
+        answers = dict(YES_NO)
+
+    for value, share in NO_ANSWER_SHARES.items():
+        if column not in listed or value in listed[column]:
+            answers[value] = share
+    if column in listed:
+        answers[UNLISTED_ANSWER] = UNLISTED_SHARE
+    answers[None] = BLANK_SHARE
+
+    return answers
+
+
+def _choose(rng, answers, n_rows):
+
+    # Draw answers by share
+    values = np.array(list(answers), dtype=object)
+    shares = np.array(list(answers.values()))
+
+    return values[rng.choice(len(values), size=n_rows, p=shares / shares.sum())]
+
+
+def _option_text(column, family):
+
+    return column.replace(f'{family}_', '').replace('_', ' ').strip().capitalize()
+
+
+def _tick_family(rng, family, columns, n_rows):
+
+    # Most surveys tick one option, earlier options more often, some tick a second one
+    # and a few only the no-answer option
+    declined = [i for i, col in enumerate(columns) if 'no_answer' in col]
+    options = [i for i in range(len(columns)) if i not in declined]
+
+    shares = 1 / np.arange(1, len(options) + 1)
+    first = np.array(options)[rng.choice(len(options), size=n_rows, p=shares / shares.sum())]
+    second = np.array(options)[rng.integers(0, len(options), size=n_rows)]
+
+    ticked = np.zeros((n_rows, len(columns)), dtype=bool)
+    ticked[np.arange(n_rows), first] = True
+    ticked[np.arange(n_rows), second] |= rng.random(n_rows) < 0.15
+
+    if declined:
+        no_answer = rng.random(n_rows) < 0.05
+        ticked[no_answer] = False
+        ticked[no_answer, declined[0]] = True
+
+    return {col: np.where(ticked[:, i], _option_text(col, family), None)
+            for i, col in enumerate(columns)}
+
+
+def synthetic_orh(n_rows, seed=0, start_id=0, path='./orh_cols.csv', types_path='./orh_col_types.csv'):
+
+    # A raw export, columns as in orh_cols.csv, with answers drawn from the shares above
+    rng = np.random.default_rng(seed)
+    columns = pd.read_csv(path)['Columns'].tolist()
+    listed = _listed_answers(types_path)
+
+    stage_text = {name: text for text, name in orh.STAGE_NAMES.items()}
+    stages = rng.choice(len(STAGE_SHARES), size=n_rows, p=STAGE_SHARES)
+    move_out = stages == 1
+
+    data = {}
+    for family, family_columns in orh.CHECKBOX_FAMILIES.items():
+        if set(family_columns).issubset(columns):
+            data.update(_tick_family(rng, family, family_columns, n_rows))
+
+    for col in columns:
+        if col in data or col in FREE_TEXT:
+            continue
+        data[col] = _choose(rng, _answer_shares(col, listed), n_rows)
+        if col in MOVE_OUT_ONLY:
+            data[col] = np.where(move_out, data[col], None)
+
+    submitted = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 365, size=n_rows), 'D')
+
+    data['survey_id'] = np.arange(start_id, start_id + n_rows)
+    data['consent_indicator'] = 'I agree'
+    data['org '] = rng.choice([f'Org {i}' for i in range(25)], size=n_rows)
+    data['org_house_name'] = rng.choice([f'House {i}' for i in range(300)], size=n_rows)
+    data['frm_completion_stage'] = np.array([stage_text['Move In'],
+                                             stage_text['Move Out'],
+                                             stage_text['Follow Up']], dtype=object)[stages]
+    data['mother_first_i'] = rng.choice(list('ABCDEFGHIJKLMNOPRSTW'), size=n_rows)
+    data['father_first_i'] = rng.choice(list('ABCDEFGHIJKLMNOPRSTW'), size=n_rows)
+    data['start_date'] = submitted.strftime('%Y-%m-%d')
+    data['submission_date'] = submitted.strftime('%Y-%m-%d')
+    data['network_id'] = 'ORH'
+    data['tags'] = None
+    data['input_type'] = np.where(rng.random(n_rows) < STAFF_SHARE, 'Staff', 'Client')
+    data['debt_balance'] = rng.integers(0, 50000, size=n_rows)
+    data['move_out_recovery_housing_stay_week_count'] = np.where(move_out, rng.integers(1, 104, size=n_rows), None)
+
+    return pd.DataFrame({col: data[col] for col in columns})
+
+
+def write_synthetic_orh(source_path,
+                        n_rows,
+                        seed=0,
+                        chunksize=100000,
+                        path='./orh_cols.csv',
+                        types_path='./orh_col_types.csv'):
+
+    # Written chunk by chunk, so exports larger than memory can be made
+    written = 0
+    while written < n_rows:
+        rows = min(chunksize, n_rows - written)
+        chunk = synthetic_orh(rows, seed=seed + written, start_id=written, path=path, types_path=types_path)
+        chunk.to_csv(source_path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += rows
+
+    return source_path
+
+
+# ----------------------------------------------------------------------------------------- #
+#                                      BENCHMARKS                                           #
+# ----------------------------------------------------------------------------------------- #
+
+
+BENCHMARK_ROWS = [10000, 100000, 1000000, 10000000]
+
+# Above this many rows only the chunked ingest is timed, the formatted frame would not fit
+IN_MEMORY_ROWS = 1000000
+
+BENCHMARK_COHORTS = {'Parent': "parent == 'Yes'",
+                     'Not Parent': "parent == 'No'",
+                     'Client': "input_type == 'Client'"}
+
+
+def _measure(records, n_rows, step, func, *args, memory=True, **kwargs):
+
+    # Time one call, then repeat it under tracemalloc for its peak allocation so the
+    # tracing does not slow the timed run
+    gc.collect()
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak = np.nan
+    if memory is True:
+        del value
+        gc.collect()
+        tracemalloc.start()
+        value = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    records.append({'rows': n_rows, 'step': step, 'seconds': seconds, 'peak_mb': peak})
+
+    return value
+
+
+@contextmanager
+def _scratch_directory(path, types_path):
+
+    # Reports write their CSVs and charts relative to the working directory, so run them
+    # somewhere disposable with the column specs next to them
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        shutil.copy(path, os.path.join(scratch, 'orh_cols.csv'))
+        shutil.copy(types_path, os.path.join(scratch, 'orh_col_types.csv'))
+        os.chdir(scratch)
+        try:
+            yield scratch
+        finally:
+            os.chdir(cwd)
+
+
+def _read_formatted(source_path):
+
+    return orh.format_orh(pd.read_csv(source_path))
+
+
+def _stream_all(source_path):
+
+    return orh.stream_counts(source_path, cohorts=BENCHMARK_COHORTS)
+
+
+def benchmark_size(source_path, n_rows, memory=True, charts=True):
+
+    records = []
+
+    _measure(records, n_rows, 'ingest: chunked counts', _stream_all, source_path, memory=memory)
+
+    if n_rows > IN_MEMORY_ROWS:
+        return records
+
+    df = _measure(records, n_rows, 'ingest: read + format_orh', _read_formatted, source_path, memory=memory)
+
+    # The cohort* functions set columns on slices, keep their warnings out of the timings
+    with redirect_stdout(io.StringIO()), orh.quiet_results(), warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+
+        for spec in orh.OUTCOME_METRICS:
+            _measure(records, n_rows, f'metric: {spec["title"]}',
+                     orh.outcomeEngine, df, metrics=[spec], memory=memory)
+
+        for cohort in [orh.cohortAges, orh.cohortEducation, orh.cohortRace,
+                       orh.cohortGender, orh.cohortSexuality]:
+            _measure(records, n_rows, f'cohort: {cohort.__name__}',
+                     cohort, df, 'Move In', memory=memory)
+
+        _measure(records, n_rows, 'aggregate: outcomeSummary',
+                 orh.outcomeSummary, df, 'Benchmark', memory=memory)
+        _measure(records, n_rows, 'aggregate: cohortSummary',
+                 orh.cohortSummary, df, 'Benchmark', memory=memory)
+        _measure(records, n_rows, 'aggregate: outcomeComparison',
+                 orh.outcomeComparison, df[df['parent'] == 'Yes'], 'Parent',
+                 df[df['parent'] == 'No'], 'Not Parent', memory=memory)
+        results = _measure(records, n_rows, 'aggregate: cohortBatch',
+                           orh.cohortBatch, df, BENCHMARK_COHORTS, memory=memory)
+
+    if charts is True:
+        _measure(records, n_rows, 'charts: chartBatch', orh.chartBatch, results, memory=False)
+
+    return records
+
+
+def runBenchmark(rows=None,
+                 seed=0,
+                 memory=True,
+                 charts=True,
+                 data_dir='./ORH_Benchmark',
+                 path='./orh_cols.csv',
+                 types_path='./orh_col_types.csv'):
+
+    # Time ingest, every metric, the cohort and aggregate reports and chart writing on
+    # synthetic exports of each size. Exports are kept in data_dir and reused by later
+    # runs with the same size and seed. Returns one row per (size, step).
+    if rows is None:
+        rows = BENCHMARK_ROWS
+
+    matplotlib.use('Agg')
+    os.makedirs(data_dir, exist_ok=True)
+    data_dir = os.path.abspath(data_dir)
+    path = os.path.abspath(path)
+    types_path = os.path.abspath(types_path)
+
+    records = []
+    for n_rows in rows:
+        source_path = os.path.join(data_dir, f'orh_synthetic_{n_rows}_{seed}.csv')
+        if not os.path.exists(source_path):
+            write_synthetic_orh(source_path, n_rows, seed=seed, path=path, types_path=types_path)
+
+        with _scratch_directory(path, types_path):
+            records.extend(benchmark_size(source_path, n_rows, memory=memory, charts=charts))
+
+        # Large sizes take a while, show progress between them
+        print(f'{n_rows} rows done', flush=True)
+
+    output = pd.DataFrame(records)
+    output.to_csv(os.path.join(data_dir, f'benchmark_{date.today()}.csv'), index=False)
+
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the ORH reports on synthetic surveys.')
+    parser.add_argument('--rows', type=int, nargs='+', default=BENCHMARK_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced peak memory runs')
+    parser.add_argument('--no-charts', action='store_true', help='skip chart writing')
+    parser.add_argument('--data-dir', default='./ORH_Benchmark')
+    args = parser.parse_args()
+
+    output = runBenchmark(rows=args.rows,
+                          seed=args.seed,
+                          memory=not args.no_memory,
+                          charts=not args.no_charts,
+                          data_dir=args.data_dir)
+
+    print(output.pivot_table(index='step', columns='rows', values='seconds', sort=False).round(3).to_string())
@@ -0,0 +1,138 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import mcm_orh_functions as orh
+import orh_benchmark
+
+COLS_PATH = os.path.join(REPO, 'orh_cols.csv')
+TYPES_PATH = os.path.join(REPO, 'orh_col_types.csv')
+
+
+@pytest.fixture
+def orh_data():
+    raw = orh_benchmark.synthetic_orh(600, path=COLS_PATH, types_path=TYPES_PATH)
+    return orh.format_orh(raw, path=COLS_PATH, types_path=TYPES_PATH)
+
+
+# ----------------------------------------------------------------------------------- #
+#                                      FORMATTING                                     #
+# ----------------------------------------------------------------------------------- #
+
+def test_unlisted_answer_keeps_string_order():
+    raw = pd.DataFrame({'move_out_recovery_housing_success': ['Yes', 'Somewhat', 'No', np.nan]})
+
+    typed = orh.format_orh_types(raw, TYPES_PATH)
+
+    categories = list(typed['move_out_recovery_housing_success'].cat.categories)
+    assert categories == ['No', 'Prefer not to answer', 'Somewhat', 'Unknown', 'Yes']
+
+
+# ----------------------------------------------------------------------------------- #
+#                                    OUTCOME ENGINE                                   #
+# ----------------------------------------------------------------------------------- #
+
+@pytest.mark.parametrize('cohort', ["parent == 'Yes'",
+                                    "(parent == 'Yes') | (parent == 'Unknown')",
+                                    orh.compile_cohort("parent == 'Yes'")])
+def test_cached_cohort_rows_follow_reassigned_columns(orh_data, cohort):
+    everyone = len(orh._view_rows(orh_data))
+    assert 0 < len(orh._view_rows(orh_data, cohort=cohort)) < everyone
+
+    orh_data['parent'] = 'Yes'
+
+    assert len(orh._view_rows(orh_data, cohort=cohort)) == everyone
+
+
+# ----------------------------------------------------------------------------------- #
+#                                     COHORT BATCH                                    #
+# ----------------------------------------------------------------------------------- #
+
+def test_cohort_text_uses_compiled_cohorts(orh_data):
+    def chosen(cohort):
+        return orh_data.index.isin(orh.select_cohort(orh_data, cohort).index)
+
+    # Names and cohort expressions, which DataFrame.eval cannot read
+    for cohort in ['race.white', 'White', 'BIPOC']:
+        assert (orh._cohort_mask(orh_data, cohort) == chosen(cohort)).all()
+
+    # Anything else still goes to DataFrame.eval
+    either = orh._cohort_mask(orh_data, "(parent == 'Yes') | (parent == 'No')")
+    assert (either == orh_data['parent'].isin(['Yes', 'No']).to_numpy()).all()
+
+
+# ----------------------------------------------------------------------------------- #
+#                                    CHUNKED INGEST                                   #
+# ----------------------------------------------------------------------------------- #
+
+def _late_export(input_data):
+
+    # An early export that misses two surveys from its last day, and the full export
+    submitted = pd.to_datetime(input_data['submission_date'])
+    busy = submitted.value_counts()
+    busy = busy[busy >= 3].index.sort_values()
+    last_day = busy[len(busy) // 2]
+    late = input_data.index[submitted == last_day][:2]
+
+    early = input_data[(submitted <= last_day) & ~input_data.index.isin(late)]
+    return early, input_data
+
+
+def _sorted_counts(table):
+    keys = [col for col in table.columns if col != 'count']
+    table = table.astype({col: str for col in keys})
+    return table.groupby(keys)['count'].sum().sort_index()
+
+
+def test_refresh_counts_keeps_late_same_day_surveys(orh_data, tmp_path):
+    early, full = _late_export(orh_data)
+
+    orh.refresh_counts(early, state_path=str(tmp_path / 'counts.pkl'))
+    outcomes, demographics = orh.refresh_counts(full, state_path=str(tmp_path / 'counts.pkl'))
+    fresh_outcomes, fresh_demographics = orh.refresh_counts(full, state_path=str(tmp_path / 'fresh.pkl'))
+
+    pd.testing.assert_series_equal(_sorted_counts(outcomes), _sorted_counts(fresh_outcomes))
+    pd.testing.assert_series_equal(_sorted_counts(demographics), _sorted_counts(fresh_demographics))
+
+    # Refreshing again with nothing new changes nothing
+    outcomes, demographics = orh.refresh_counts(full, state_path=str(tmp_path / 'counts.pkl'))
+    pd.testing.assert_series_equal(_sorted_counts(outcomes), _sorted_counts(fresh_outcomes))
+
+
+# ----------------------------------------------------------------------------------- #
+#                                      COUNT CUBE                                     #
+# ----------------------------------------------------------------------------------- #
+
+def test_cube_skips_unknown_stages(orh_data):
+    data = orh_data.sort_values(['org ', 'org_house_name', 'input_type']).reset_index(drop=True)
+    data['Stage'] = data['Stage'].cat.add_categories(['Intake'])
+
+    # The first row of the first group and a row of a later group
+    later = data.index[data['org_house_name'] != data.loc[0, 'org_house_name']][5]
+    data.loc[0, 'Stage'] = np.nan
+    data.loc[later, 'Stage'] = 'Intake'
+
+    metrics = orh.outcome_metrics()
+    cube = orh.build_cube(data, metrics)
+    known = orh.build_cube(data.drop(index=[0, later]), metrics)
+
+    for house in [data.loc[0, 'org_house_name'], data.loc[later, 'org_house_name']]:
+        pd.testing.assert_frame_equal(orh.cube_counts(cube, metrics, org_house_name=house),
+                                      orh.cube_counts(known, metrics, org_house_name=house))
+
+
+def test_refresh_cube_keeps_late_same_day_surveys(orh_data, tmp_path):
+    early, full = _late_export(orh_data)
+    metrics = orh.outcome_metrics()
+
+    orh.refresh_cube(early, state_path=str(tmp_path / 'cube.pkl.gz'), metrics=metrics)
+    cube = orh.refresh_cube(full, state_path=str(tmp_path / 'cube.pkl.gz'), metrics=metrics)
+    fresh = orh.build_cube(full, metrics)
+
+    pd.testing.assert_frame_equal(orh.cube_counts(cube, metrics), orh.cube_counts(fresh, metrics))